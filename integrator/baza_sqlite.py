@@ -0,0 +1,626 @@
+"""Hramba uporabnikov, nalog in oddaj v bazi SQLite.
+Za razliko od Integratorja baza ni v celoti v pomnilniku: objekte ustvarimo šele, ko jih kdo potrebuje,
+zato sta zagon in poraba pomnilnika neodvisna od velikosti baze.
+
+Uporaba iz ukazne vrstice:
+    python baza_sqlite.py uvozi db.json db.sqlite                       # prenos obstoječe baze JSON
+    python baza_sqlite.py primerjava [stevilo_uporabnikov] [stevilo_oddaj]   # primerjava hitrosti z JSON
+    python baza_sqlite.py pomnilnik [stevilo_uporabnikov] [stevilo_oddaj]    # poraba pomnilnika na oddajo
+Primerjava meri tudi leno nalaganje baze JSON (glej Integrator).
+
+Baza SQLite je lahko skupna več procesom hkrati (npr. delovnim procesom strežnika, glej streznik.py);
+vsak proces (in vsaka nit, npr. pri ocenjevanju v ozadju) ima svojo povezavo, pisanje pa zaklene bazo,
+tako da se hkratna pisanja izvedejo eno za drugim.
+Neocenjene oddaje imajo rezultat NULL; baze, ustvarjene pred tem, se ob odprtju posodobijo (glej _posodobi_shemo)."""
+
+import contextlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+from model import (
+    Funkcija, Integrator, Lestvica, Naloga, Oddaja, PovzetekNaloge, Uporabnik, nakljucna_naloga, oceni_neocenjeno,
+    oceni_niz
+)
+from ocenjevanje import PrekoracenaOmejitev
+from pomozne_funkcije import LRUPredpomnilnik
+
+
+# Stolpci tabele oddaj; potrebujemo jih tudi pri posodabljanju starejših baz (glej IntegratorSQLite._posodobi_shemo)
+STOLPCI_ODDAJ = """
+    zaporedje INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    uporabnik INTEGER NOT NULL REFERENCES uporabniki (zaporedje),
+    naloga TEXT NOT NULL,
+    funkcija TEXT NOT NULL,
+    cas_oddaje TEXT NOT NULL,
+    rezultat INTEGER,
+    napaka TEXT
+"""
+
+SHEMA = f"""
+CREATE TABLE IF NOT EXISTS uporabniki (
+    zaporedje INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    uporabnisko_ime TEXT NOT NULL UNIQUE,
+    sol TEXT NOT NULL,
+    razprsitev TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS naloge (
+    zaporedje INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    zaporedna_stevilka TEXT NOT NULL,
+    podatki TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS naloge_po_stevilki ON naloge (zaporedna_stevilka);
+
+CREATE TABLE IF NOT EXISTS oddaje ({STOLPCI_ODDAJ});
+CREATE INDEX IF NOT EXISTS oddaje_po_uporabniku ON oddaje (uporabnik);
+CREATE INDEX IF NOT EXISTS oddaje_po_nalogi ON oddaje (naloga);
+CREATE INDEX IF NOT EXISTS neocenjene_oddaje ON oddaje (zaporedje) WHERE rezultat IS NULL;
+"""
+
+
+class UporabnikSQLite(Uporabnik):
+    """Uporabnik iz baze SQLite. Strežnik uporabnika poišče ob vsaki zahtevi, zato njegovih oddaj ne preberemo
+    takoj: posamezno oddajo, oddaje ene naloge in povzetke nalog preberemo s poizvedbami, vse oddaje pa šele,
+    ko jih kdo potrebuje (kot pri lenem nalaganju, glej Uporabnik)."""
+
+    STOLPCI_ODDAJE = "id, naloga, funkcija, cas_oddaje, rezultat, napaka"
+
+    def __init__(self, baza, zaporedje, slovar):
+        super(UporabnikSQLite, self).__init__(slovar=dict(slovar, oddaje=[]), leno=True)
+        self._baza = baza
+        self._zaporedje = zaporedje
+        self._prebrane = False      # ali so vse oddaje že prebrane iz baze
+        self._povzetki_prebrani = False
+
+    def _poizvedba_oddaj(self, pogoj, parametri=()):
+        vrstice = self._baza.povezava.execute(
+            f"SELECT {self.STOLPCI_ODDAJE} FROM oddaje WHERE uporabnik = ? {pogoj} ORDER BY zaporedje",
+            (self._zaporedje, *parametri)
+        )
+        return [self._baza._slovar_oddaje(vrstica) for vrstica in vrstice]
+
+    def _preberi_oddaje(self):
+        """Preberi vse oddaje iz baze; oddaje in povzetki se iz njih ustvarijo kot pri lenem nalaganju."""
+        if not self._prebrane:
+            self._prebrane = True
+            self._surove_oddaje = self._poizvedba_oddaj("")
+            self._povzetki.clear()
+
+    def _ustvari_oddaje(self):
+        self._preberi_oddaje()
+        super(UporabnikSQLite, self)._ustvari_oddaje()
+
+    def rezultati(self):
+        self._preberi_oddaje()
+        return super(UporabnikSQLite, self).rezultati()
+
+    def neocenjene_oddaje(self):
+        self._preberi_oddaje()
+        return super(UporabnikSQLite, self).neocenjene_oddaje()
+
+    def shrani_v_slovar(self):
+        self._preberi_oddaje()
+        return super(UporabnikSQLite, self).shrani_v_slovar()
+
+    def ustvari_oddajo(self, id_naloge, oddana_funkcija, cas_oddaje, rezultat):
+        """Ustvari novo oddajo; v bazo jo doda klicoči (glej IntegratorSQLite.dodaj_oddajo)."""
+        if self._prebrane:
+            return super(UporabnikSQLite, self).ustvari_oddajo(id_naloge, oddana_funkcija, cas_oddaje, rezultat)
+        oddaja = Oddaja(id_naloge, oddana_funkcija, cas_oddaje, rezultat)
+        if self._povzetki_prebrani and rezultat is not None:
+            self._povzetki.setdefault(id_naloge, PovzetekNaloge()).dodaj_rezultat(rezultat)
+        return oddaja
+
+    def poisci_oddajo(self, _id):
+        if self._prebrane:
+            return super(UporabnikSQLite, self).poisci_oddajo(_id)
+        oddaje = self._poizvedba_oddaj("AND id = ?", (_id,))
+        return Oddaja(slovar=oddaje[0]) if oddaje else None
+
+    def oddaje_za_nalogo(self, id_naloge):
+        if self._prebrane:
+            return super(UporabnikSQLite, self).oddaje_za_nalogo(id_naloge)
+        return [Oddaja(slovar=oddaja) for oddaja in self._poizvedba_oddaj("AND naloga = ?", (id_naloge,))]
+
+    def povzetek_naloge(self, id_naloge):
+        if self._prebrane:
+            return super(UporabnikSQLite, self).povzetek_naloge(id_naloge)
+        if not self._povzetki_prebrani:
+            # Povzetke vseh nalog preberemo z eno poizvedbo, saj jih stran z nalogami potrebuje za vse naloge
+            self._povzetki_prebrani = True
+            for naloga, najboljsi_rezultat, stevilo_oddaj in self._baza.povezava.execute(
+                "SELECT naloga, MAX(rezultat), COUNT(rezultat) FROM oddaje "
+                "WHERE uporabnik = ? AND rezultat IS NOT NULL GROUP BY naloga",
+                (self._zaporedje,)
+            ):
+                self._povzetki[naloga] = PovzetekNaloge(najboljsi_rezultat, stevilo_oddaj)
+        return self._povzetki.get(id_naloge, None)
+
+
+class IntegratorSQLite:
+    """Podatki Integratorja v bazi SQLite. Metode za iskanje in dodajanje se obnašajo enako kot
+    istoimenske metode Integratorja; uporabniki in oddaje so ob vsakem klicu ustvarjeni na novo iz baze.
+    Naloge se ne spreminjajo, zato jih hranimo v pomnilniku in iz baze preberemo le nove.
+    Tudi lestvice hranimo v pomnilniku in jih ob uporabi dopolnimo z oddajami, ki so bile dodane medtem."""
+
+    # Koliko sekund pisanje čaka, da drug proces konča svojo transakcijo
+    CAS_CAKANJA_NA_ZAKLEP = 30
+
+    def __init__(self, ime_datoteke):
+        self.ime_datoteke = ime_datoteke
+        self._niti = threading.local()
+        self._podedovane_povezave = []
+
+        self.naloge_po_vrsti = []
+        self._naloge_po_stevilki = {}
+        self._naloge_po_id = {}
+        self._zadnja_naloga = 0     # zaporedje zadnje prebrane naloge
+        self._lestvice = {}         # id naloge -> (lestvica, zaporedje zadnje upoštevane oddaje)
+
+        self.predpomnilnik_ocen = LRUPredpomnilnik(Integrator.VELIKOST_PREDPOMNILNIKA_OCEN)
+        self.ocenjevalec = None
+        self.vrsta_ocenjevanja = None
+
+        self.povezava.executescript(SHEMA)
+        if self._posodobi_shemo():
+            # Ob prepisu tabele oddaj so se izbrisali tudi njeni indeksi
+            self.povezava.executescript(SHEMA)
+
+    def _posodobi_shemo(self):
+        """Posodobi bazo, ustvarjeno s starejšo shemo. Bazo lahko hkrati odpre več procesov, zato shemo
+        preverimo šele v transakciji. Vrni, ali je bilo treba tabelo oddaj prepisati."""
+        with self._transakcija() as povezava:
+            # Bazam, ustvarjenim pred shranjevanjem napak pri ocenjevanju, dodamo stolpec z napako
+            stolpci = {vrstica[1]: vrstica[3] for vrstica in povezava.execute("PRAGMA table_info(oddaje)")}
+            if "napaka" not in stolpci:
+                povezava.execute("ALTER TABLE oddaje ADD COLUMN napaka TEXT")
+
+            # V bazah, ustvarjenih pred neocenjenimi oddajami, rezultat ne sme biti NULL. SQLite omejitve
+            # ne zna odstraniti, zato tabelo prepišemo v novo s trenutno shemo
+            prepisana = bool(stolpci["rezultat"])
+            if prepisana:
+                povezava.execute(f"CREATE TABLE nove_oddaje ({STOLPCI_ODDAJ})")
+                povezava.execute(
+                    "INSERT INTO nove_oddaje (zaporedje, id, uporabnik, naloga, funkcija, cas_oddaje, rezultat, napaka) "
+                    "SELECT zaporedje, id, uporabnik, naloga, funkcija, cas_oddaje, rezultat, napaka FROM oddaje"
+                )
+                povezava.execute("DROP TABLE oddaje")
+                povezava.execute("ALTER TABLE nove_oddaje RENAME TO oddaje")
+
+            # V bazah, ustvarjenih pred enoličnimi zaporednimi številkami nalog, sta lahko dva procesa hkrati
+            # dodala nalogo z isto številko; odveč naloge brez oddaj izbrišemo (uporabljala se je prva)
+            enolicni_indeksi = [vrstica[1] for vrstica in povezava.execute("PRAGMA index_list(naloge)") if vrstica[2]]
+            if "naloge_po_stevilki" not in enolicni_indeksi:
+                povezava.execute(
+                    "DELETE FROM naloge WHERE zaporedje NOT IN "
+                    "(SELECT MIN(zaporedje) FROM naloge GROUP BY zaporedna_stevilka) "
+                    "AND id NOT IN (SELECT naloga FROM oddaje)"
+                )
+                podvojene = povezava.execute(
+                    "SELECT zaporedna_stevilka FROM naloge GROUP BY zaporedna_stevilka HAVING COUNT(*) > 1"
+                ).fetchall()
+                if podvojene:
+                    print(
+                        f"Naloge {', '.join(stevilka for stevilka, in podvojene)} so podvojene in imajo oddaje; "
+                        "zaporedne številke nalog ostanejo neenolične.",
+                        file=sys.stderr
+                    )
+                else:
+                    povezava.execute("DROP INDEX IF EXISTS naloge_po_stevilki")
+                    povezava.execute("CREATE UNIQUE INDEX naloge_po_stevilki ON naloge (zaporedna_stevilka)")
+        return prepisana
+
+    @property
+    def povezava(self):
+        """Povezava z bazo, ki jo odpremo ob prvi uporabi. Povezave SQLite ne smemo uporabljati v več procesih
+        ali nitih, zato jo vsaka nit in proces, ustvarjen z os.fork, odpre znova."""
+        povezava = getattr(self._niti, "povezava", None)
+        if povezava is None or self._niti.pid != os.getpid():
+            if povezava is not None:
+                # Podedovane povezave ne zapremo, saj bi zapiranje lahko vplivalo na zaklepe starševskega procesa
+                self._podedovane_povezave.append(povezava)
+            povezava = sqlite3.connect(self.ime_datoteke, timeout=self.CAS_CAKANJA_NA_ZAKLEP)
+            # WAL dovoljuje branje med pisanjem; pri NORMAL se ob sesutju sistema izgubijo kvečjemu zadnje transakcije
+            povezava.execute("PRAGMA journal_mode = WAL")
+            povezava.execute("PRAGMA synchronous = NORMAL")
+            povezava.execute("PRAGMA foreign_keys = ON")
+            self._niti.povezava = povezava
+            self._niti.pid = os.getpid()
+        return povezava
+
+    @contextlib.contextmanager
+    def _transakcija(self):
+        """Transakcija, ki bazo za pisanje zaklene že ob začetku. Tako hkratna pisanja drugih procesov
+        počakajo, da se transakcija konča, in ne morejo prebrati stanja, ki ga transakcija ravno spreminja."""
+        povezava = self.povezava
+        povezava.execute("BEGIN IMMEDIATE")
+        try:
+            yield povezava
+        except BaseException:
+            povezava.rollback()
+            raise
+        povezava.commit()
+
+    def zapri(self):
+        """Zapri povezavo trenutne niti. Ob naslednji uporabi se odpre znova."""
+        povezava = getattr(self._niti, "povezava", None)
+        if povezava is not None and self._niti.pid == os.getpid():
+            povezava.close()
+        self._niti.povezava = None
+
+    @staticmethod
+    def _slovar_oddaje(vrstica):
+        _id, naloga, funkcija, cas_oddaje, rezultat, napaka = vrstica
+        slovar = {
+            "_id": _id,
+            "naloga": naloga,
+            "funkcija": json.loads(funkcija),
+            "cas_oddaje": cas_oddaje,
+            "rezultat": rezultat
+        }
+        if napaka is not None:
+            slovar["napaka"] = napaka
+        return slovar
+
+    def _uporabnik_iz_vrstice(self, vrstica):
+        zaporedje, _id, uporabnisko_ime, sol, razprsitev = vrstica
+        return UporabnikSQLite(self, zaporedje, {
+            "_id": _id,
+            "uporabnisko_ime": uporabnisko_ime,
+            "sol": sol,
+            "razprsitev": razprsitev
+        })
+
+    def _zaporedje_uporabnika(self, uporabnik: Uporabnik):
+        vrstica = self.povezava.execute("SELECT zaporedje FROM uporabniki WHERE id = ?", (uporabnik._id,)).fetchone()
+        return vrstica[0]
+
+    def poisci_uporabnika(self, uporabnisko_ime: str):
+        """Poišči in vrni uporabnika z podanim imenom. Če tak uporabnik ne obstaja, vrni None"""
+        vrstica = self.povezava.execute(
+            "SELECT zaporedje, id, uporabnisko_ime, sol, razprsitev FROM uporabniki WHERE uporabnisko_ime = ?",
+            (uporabnisko_ime,)
+        ).fetchone()
+        if vrstica is None:
+            return None
+        return self._uporabnik_iz_vrstice(vrstica)
+
+    def dodaj_uporabnika(self, uporabnik: Uporabnik):
+        """Dodaj obstoječega uporabnika skupaj z njegovimi oddajami."""
+        with self._transakcija():
+            self._vstavi_uporabnike([uporabnik])
+
+    def ustvari_uporabnika(self, uporabnisko_ime, geslo):
+        """Ustvari novega uporabnika."""
+        self.dodaj_uporabnika(Uporabnik.ustvari_uporabnika(uporabnisko_ime, geslo))
+
+    def nastavi_geslo(self, uporabnik: Uporabnik, novo_geslo: str):
+        """Nastavi uporabnikovo geslo na novo vrednost."""
+        uporabnik.nastavi_geslo(novo_geslo)
+        with self._transakcija():
+            self.povezava.execute(
+                "UPDATE uporabniki SET razprsitev = ? WHERE id = ?", (uporabnik.razprsitev, uporabnik._id)
+            )
+
+    def _preberi_nove_naloge(self):
+        """Preberi naloge, ki so bile dodane od zadnjega branja (tudi v drugih procesih)."""
+        vrstice = self.povezava.execute(
+            "SELECT zaporedje, podatki FROM naloge WHERE zaporedje > ? ORDER BY zaporedje", (self._zadnja_naloga,)
+        ).fetchall()
+        for zaporedje, podatki in vrstice:
+            naloga = Naloga(slovar=json.loads(podatki))
+            self._naloge_po_id[naloga._id] = naloga
+            self._zadnja_naloga = zaporedje
+            # Podvojene naloge iz baz s starejšo shemo (glej _posodobi_shemo) poiščemo le po ID-ju
+            if naloga.zaporedna_stevilka not in self._naloge_po_stevilki:
+                self.naloge_po_vrsti.append(naloga)
+                self._naloge_po_stevilki[naloga.zaporedna_stevilka] = naloga
+
+    def poisci_nalogo(self, zaporedna_stevilka=None, _id=None):
+        """Vrni nalogo z dano zaporedno številko oz. ID-jem, ali None, če taka naloga ne obstaja."""
+        self._preberi_nove_naloge()
+        if zaporedna_stevilka is not None:
+            return self._naloge_po_stevilki.get(str(zaporedna_stevilka), None)
+
+        if _id is not None:
+            return self._naloge_po_id.get(_id, None)
+
+        return None
+
+    @property
+    def naloge(self):
+        """Seznam vseh nalog v vrstnem redu dodajanja."""
+        self._preberi_nove_naloge()
+        return list(self.naloge_po_vrsti)
+
+    def poisci_funkcijo(self, id_funkcije):
+        """Poišči in vrni funkcijo naloge z danim ID-jem. Če ne obstaja, vrni None."""
+        self._preberi_nove_naloge()
+        return Funkcija.ustvarjeni_objekti.get(id_funkcije, None)
+
+    def dodaj_nalogo(self, naloga: Naloga):
+        """Dodaj nalogo."""
+        with self._transakcija():
+            self._vstavi_naloge([naloga.shrani_v_slovar()])
+
+    def ustvari_nakljucno_nalogo(self, zaporedna_stevilka):
+        """Ustvari novo, naključno generirano nalogo in vrni nalogo s to številko.
+        Če je nalogo z isto številko hkrati ustvaril drug proces, se nova ne doda (zaporedne številke so enolične),
+        temveč vrnemo tisto, ki je bila dodana prva."""
+        with self._transakcija():
+            self._vstavi_naloge([nakljucna_naloga(zaporedna_stevilka).shrani_v_slovar()], prezri_obstojece=True)
+        return self.poisci_nalogo(zaporedna_stevilka)
+
+    def stevilo_zaporedno_resenih_nalog(self, uporabnik: Uporabnik):
+        """Vrni, koliko nalog je uporabnik rešil po vrsti, začenši s prvo (glej Integrator)."""
+        return Integrator.stevilo_zaporedno_resenih_nalog(self, uporabnik)
+
+    def lestvica_naloge(self, id_naloge):
+        """Vrni lestvico naloge (glej Lestvica)."""
+        lestvica, zadnja_oddaja = self._lestvice.get(id_naloge, (None, 0))
+        if lestvica is None:
+            lestvica = Lestvica()
+        vrstice = self.povezava.execute(
+            "SELECT oddaje.zaporedje, uporabnisko_ime, rezultat, cas_oddaje FROM oddaje "
+            "JOIN uporabniki ON uporabniki.zaporedje = oddaje.uporabnik "
+            "WHERE naloga = ? AND oddaje.zaporedje > ? ORDER BY oddaje.zaporedje",
+            (id_naloge, zadnja_oddaja)
+        ).fetchall()
+        neocenjena = False
+        for zaporedje, uporabnisko_ime, rezultat, cas_oddaje in vrstice:
+            if rezultat is None:
+                # Neocenjeno oddajo upoštevamo, ko bo ocenjena; ponovno dodanih rezultatov lestvica ne upošteva dvakrat
+                neocenjena = True
+                continue
+            lestvica.dodaj_rezultat(rezultat, datetime.fromisoformat(cas_oddaje), uporabnisko_ime)
+            if not neocenjena:
+                zadnja_oddaja = zaporedje
+        self._lestvice[id_naloge] = (lestvica, zadnja_oddaja)
+        return lestvica
+
+    def nizi_funkcij(self):
+        """Vrni vse nize funkcij v nalogah in oddajah, od najstarejših do najnovejših oddaj."""
+        for naloga in self.naloge:
+            yield naloga.odvedena_funkcija.niz
+        for funkcija, in self.povezava.execute("SELECT funkcija FROM oddaje ORDER BY cas_oddaje"):
+            yield json.loads(funkcija)["niz"]
+
+    def ogrej_predpomnilnik_izrazov(self):
+        """Razčleni vse funkcije v bazi in jih shrani v skupni predpomnilnik izrazov."""
+        Funkcija.ogrej_predpomnilnik(self.nizi_funkcij())
+
+    def dodaj_oddajo(self, stevilka_naloge: int, uporabnik: Uporabnik, funkcijski_niz: str):
+        """Doda in oceni novo oddajo, vrne novo oddajo.
+        Vrne None, če je prišlo do težave (ni naloge, ...); če oddaja presega omejitve ocenjevalca,
+        sproži PrekoracenaOmejitev. Z vrsto za ocenjevanje oddajo doda neocenjeno (glej Integrator.dodaj_oddajo)."""
+        naloga = self.poisci_nalogo(str(stevilka_naloge))
+        if naloga is None:
+            return None
+
+        try:
+            funkcija, tocke = oceni_niz(naloga, funkcijski_niz, self.predpomnilnik_ocen, self.ocenjevalec,
+                                        v_ozadju=self.vrsta_ocenjevanja is not None)
+        except PrekoracenaOmejitev:
+            raise
+        except Exception:
+            return None
+
+        oddaja = uporabnik.ustvari_oddajo(naloga._id, funkcija, datetime.now(), tocke)
+        with self._transakcija():
+            self._vstavi_oddaje(self._zaporedje_uporabnika(uporabnik), [oddaja.shrani_v_slovar()])
+        if tocke is None:
+            self.vrsta_ocenjevanja.dodaj(uporabnik, oddaja)
+        return oddaja
+
+    def nastavi_rezultat(self, uporabnik: Uporabnik, oddaja, rezultat: int, napaka=None):
+        """Nastavi rezultat neocenjene oddaje in morebitno sporočilo o napaki pri ocenjevanju.
+        Če jo je medtem ocenil že drug proces, rezultata ne spremeni."""
+        with self._transakcija() as povezava:
+            povezava.execute(
+                "UPDATE oddaje SET rezultat = ?, napaka = ? WHERE id = ? AND rezultat IS NULL",
+                (rezultat, napaka, oddaja._id)
+            )
+        oddaja.rezultat = rezultat
+        oddaja.napaka = napaka
+
+    def oceni_neocenjeno_oddajo(self, uporabnik: Uporabnik, oddaja):
+        """Oceni oddajo, ki je bila dodana neocenjena, in nastavi njen rezultat ter morebitno napako
+        (glej model.oceni_neocenjeno)."""
+        tocke, napaka = oceni_neocenjeno(
+            self.poisci_nalogo(_id=oddaja.naloga), oddaja, self.predpomnilnik_ocen, self.ocenjevalec
+        )
+        self.nastavi_rezultat(uporabnik, oddaja, tocke, napaka)
+
+    def neocenjene_oddaje(self):
+        """Vrni pare (uporabnik, oddaja) za vse oddaje, ki še niso ocenjene."""
+        vrstice = self.povezava.execute(
+            "SELECT uporabniki.zaporedje, uporabniki.id, uporabnisko_ime, sol, razprsitev, oddaje.id FROM oddaje "
+            "JOIN uporabniki ON uporabniki.zaporedje = oddaje.uporabnik "
+            "WHERE rezultat IS NULL ORDER BY oddaje.zaporedje"
+        ).fetchall()
+        neocenjene = []
+        for *vrstica, id_oddaje in vrstice:
+            uporabnik = self._uporabnik_iz_vrstice(vrstica)
+            neocenjene.append((uporabnik, uporabnik.poisci_oddajo(id_oddaje)))
+        return neocenjene
+
+    # Vstavljanje; klicoči poskrbi za transakcijo
+
+    def _vstavi_uporabnike(self, uporabniki):
+        for uporabnik in uporabniki:
+            zaporedje = self.povezava.execute(
+                "INSERT INTO uporabniki (id, uporabnisko_ime, sol, razprsitev) VALUES (?, ?, ?, ?)",
+                (uporabnik._id, uporabnik.uporabnisko_ime, uporabnik.sol, uporabnik.razprsitev)
+            ).lastrowid
+            self._vstavi_oddaje(zaporedje, [oddaja.shrani_v_slovar() for oddaja in uporabnik.oddaje])
+
+    def _vstavi_naloge(self, slovarji_nalog, prezri_obstojece=False):
+        """Vstavi naloge; če je prezri_obstojece True, izpusti naloge s številko, ki je že v bazi."""
+        self.povezava.executemany(
+            f"INSERT {'OR IGNORE ' if prezri_obstojece else ''}INTO naloge (id, zaporedna_stevilka, podatki) "
+            "VALUES (?, ?, ?)",
+            ((naloga["_id"], naloga["zaporedna_stevilka"], json.dumps(naloga)) for naloga in slovarji_nalog)
+        )
+
+    def _vstavi_oddaje(self, zaporedje_uporabnika, slovarji_oddaj):
+        self.povezava.executemany(
+            "INSERT INTO oddaje (id, uporabnik, naloga, funkcija, cas_oddaje, rezultat, napaka) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    oddaja["_id"],
+                    zaporedje_uporabnika,
+                    oddaja["naloga"],
+                    json.dumps(oddaja["funkcija"]),
+                    oddaja["cas_oddaje"],
+                    oddaja["rezultat"],
+                    oddaja.get("napaka")
+                )
+                for oddaja in slovarji_oddaj
+            )
+        )
+
+    def _vstavi_slovar(self, slovar):
+        self._vstavi_naloge(slovar["naloge"])
+        for uporabnik in slovar["uporabniki"]:
+            zaporedje = self.povezava.execute(
+                "INSERT INTO uporabniki (id, uporabnisko_ime, sol, razprsitev) VALUES (?, ?, ?, ?)",
+                (uporabnik["_id"], uporabnik["uporabnisko_ime"], uporabnik["sol"], uporabnik["razprsitev"])
+            ).lastrowid
+            self._vstavi_oddaje(zaporedje, uporabnik["oddaje"])
+
+    def uvozi_slovar(self, slovar):
+        """Uvozi podatke Integratorja, shranjene v slovarju (glej Integrator.shrani_v_slovar).
+        Podatkov ne pretvarjamo v objekte, zato je uvoz hiter tudi za velike baze."""
+        with self._transakcija():
+            self._vstavi_slovar(slovar)
+
+    def uvozi_ce_prazna(self, pridobi_slovar):
+        """Če v bazi še ni nalog, vanjo uvozi slovar, ki ga vrne pridobi_slovar() (glej uvozi_slovar).
+        Baza je med tem zaklenjena, zato uvoz izvede le en proces, tudi če jih hkrati zažene več."""
+        with self._transakcija() as povezava:
+            if povezava.execute("SELECT 1 FROM naloge LIMIT 1").fetchone() is None:
+                self._vstavi_slovar(pridobi_slovar())
+
+
+def uvozi(datoteka_json, datoteka_sqlite):
+    """Prenesi bazo iz datoteke JSON (npr. primer.json ali db.json) v novo bazo SQLite."""
+    with open(datoteka_json) as f:
+        slovar = json.load(f)
+    baza = IntegratorSQLite(datoteka_sqlite)
+    baza.uvozi_slovar(slovar)
+    baza.zapri()
+
+
+def _sinteticna_baza(stevilo_uporabnikov, stevilo_oddaj):
+    """Ustvari slovar baze s podanim številom uporabnikov in oddaj za naloge iz primer.json."""
+    import random
+
+    with open("primer.json") as f:
+        naloge = json.load(f)["naloge"]
+
+    random.seed(0)
+    uporabniki = []
+    for i in range(stevilo_uporabnikov):
+        uporabniki.append({
+            "_id": f"u{i:015d}",
+            "uporabnisko_ime": f"uporabnik{i}",
+            "sol": "0" * 32,
+            "razprsitev": "0" * 64,
+            "oddaje": []
+        })
+    for i in range(stevilo_oddaj):
+        naloga = random.choice(naloge)
+        random.choice(uporabniki)["oddaje"].append({
+            "_id": f"o{i:015d}",
+            "naloga": naloga["_id"],
+            "funkcija": {"_id": f"f{i:015d}", "niz": f"x^{i % 7}", "obmocje": naloga["odvedena_funkcija"]["obmocje"]},
+            "cas_oddaje": datetime(2022, 1, 1, 12, i % 60).isoformat(),
+            "rezultat": random.randint(0, 100)
+        })
+    return {"_id": "integrator", "naloge": naloge, "uporabniki": uporabniki}
+
+
+def primerjava(stevilo_uporabnikov=10000, stevilo_oddaj=200000):
+    """Primerjaj čas zagona in iskanja med bazo JSON (običajno in leno naloženo) in bazo SQLite na sintetični bazi."""
+    import os
+    import random
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as direktorij:
+        slovar = _sinteticna_baza(stevilo_uporabnikov, stevilo_oddaj)
+        datoteka_json = os.path.join(direktorij, "db.json")
+        datoteka_sqlite = os.path.join(direktorij, "db.sqlite")
+        with open(datoteka_json, "w") as f:
+            json.dump(slovar, f)
+        del slovar
+
+        zacetek = time.perf_counter()
+        uvozi(datoteka_json, datoteka_sqlite)
+        print(f"uvoz: {time.perf_counter() - zacetek:.2f} s")
+
+        imena = [f"uporabnik{random.randrange(stevilo_uporabnikov)}" for __ in range(1000)]
+
+        for ime, odpri in [
+            ("JSON", lambda: Integrator.ustvari_iz_datoteke(datoteka_json)),
+            ("JSON (leno)", lambda: Integrator.ustvari_iz_datoteke(datoteka_json, leno=True)),
+            ("SQLite", lambda: IntegratorSQLite(datoteka_sqlite)),
+        ]:
+            zacetek = time.perf_counter()
+            baza = odpri()
+            zagon = time.perf_counter() - zacetek
+
+            zacetek = time.perf_counter()
+            for uporabnisko_ime in imena:
+                baza.poisci_uporabnika(uporabnisko_ime)
+            iskanje = (time.perf_counter() - zacetek) / len(imena)
+
+            zacetek = time.perf_counter()
+            for stevilka in range(1, 6):
+                baza.poisci_nalogo(stevilka)
+            iskanje_naloge = (time.perf_counter() - zacetek) / 5
+
+            print(f"{ime}: zagon {zagon:.2f} s, iskanje uporabnika {iskanje * 1e6:.0f} µs, "
+                  f"iskanje naloge {iskanje_naloge * 1e6:.0f} µs")
+            del baza
+
+
+def primerjava_pomnilnika(stevilo_uporabnikov=1000, stevilo_oddaj=100000):
+    """Izmeri, koliko pomnilnika porabi ena oddaja, če baze JSON hranimo v pomnilniku na različne načine."""
+    import gc
+    import tracemalloc
+
+    besedilo = json.dumps(_sinteticna_baza(stevilo_uporabnikov, stevilo_oddaj))
+
+    for ime, argumenti in [
+        ("objekti", {}),
+        ("slovarji (leno)", {"leno": True}),
+        ("stolpci", {"stolpcno": True}),
+    ]:
+        gc.collect()
+        tracemalloc.start()
+        integrator = Integrator(slovar=json.loads(besedilo), **argumenti)
+        gc.collect()
+        poraba = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{ime}: {poraba / stevilo_oddaj:.0f} bajtov na oddajo")
+        del integrator
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "uvozi":
+        uvozi(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) >= 2 and sys.argv[1] == "primerjava":
+        primerjava(*(int(argument) for argument in sys.argv[2:]))
+    elif len(sys.argv) >= 2 and sys.argv[1] == "pomnilnik":
+        primerjava_pomnilnika(*(int(argument) for argument in sys.argv[2:]))
+    else:
+        print(__doc__)
@@ -0,0 +1,192 @@
+"""Shranjevanje baze v dnevnik sprememb. Vsako spremembo (nov uporabnik, oddaja, naloga, novo geslo) dopišemo
+na konec dnevnika kot eno vrstico JSON, zato zapis traja enako dolgo ne glede na velikost baze.
+Občasno celotno bazo zapišemo v posnetek in dnevnik izpraznimo; ob zagonu preberemo posnetek in ponovimo dnevnik."""
+
+import json
+import os
+import threading
+
+import model
+
+
+class Dnevnik:
+    """Dnevnik sprememb baze skupaj s posnetkom baze.
+    Zapise takoj predamo operacijskemu sistemu, na disk (fsync) pa jih zapišemo v paketih: ko se nabere
+    velikost_paketa zapisov ali najkasneje cas_paketa sekund po prvem nezapisanem zapisu.
+    Ko dnevnik vsebuje zapisov_do_stiskanja zapisov, ga v ločeni niti stisnemo v nov posnetek."""
+
+    def __init__(self, datoteka_s_posnetkom, datoteka_z_dnevnikom, velikost_paketa=100, cas_paketa=1.0,
+                 zapisov_do_stiskanja=10000):
+        self.datoteka_s_posnetkom = datoteka_s_posnetkom
+        self.datoteka_z_dnevnikom = datoteka_z_dnevnikom
+        self.velikost_paketa = velikost_paketa
+        self.cas_paketa = cas_paketa
+        self.zapisov_do_stiskanja = zapisov_do_stiskanja
+
+        self.integrator = None
+        self.stevilo_zapisov = 0    # število zapisov v dnevniku od zadnjega stiskanja
+        self._nesinhronizirani = 0  # število zapisov, ki še niso zagotovo na disku
+        self._casovnik = None
+        self._stiskanje = None      # nit, ki stiska dnevnik, ali None
+        self._datoteka = None
+        self._kljucavnica = threading.RLock()
+        self._kljucavnica_stiskanja = threading.Lock()
+
+    def nalozi(self, **argumenti):
+        """Preberi posnetek, ponovi vse zapise v dnevniku in vrni Integrator, ki nadaljnje spremembe beleži v dnevnik.
+        Zadnja vrstica je lahko nepopolna, če se je program sredi pisanja zrušil; tako vrstico odrežemo.
+        Argumente (leno, stolpcno) podamo Integratorju."""
+        integrator = model.Integrator.ustvari_iz_datoteke(self.datoteka_s_posnetkom, **argumenti)
+
+        dolzina = 0
+        if os.path.exists(self.datoteka_z_dnevnikom):
+            with open(self.datoteka_z_dnevnikom, "rb") as f:
+                for vrstica in f:
+                    if not vrstica.endswith(b"\n"):
+                        break
+                    try:
+                        zapis = json.loads(vrstica)
+                    except ValueError:
+                        break
+                    integrator.uporabi_zapis(zapis)
+                    dolzina += len(vrstica)
+                    self.stevilo_zapisov += 1
+
+        self._datoteka = open(self.datoteka_z_dnevnikom, "a", encoding="utf8")
+        self._datoteka.truncate(dolzina)
+
+        self.integrator = integrator
+        integrator.dnevnik = self
+        return integrator
+
+    def zapisi(self, zapis):
+        """Dopiši zapis na konec dnevnika."""
+        with self._kljucavnica:
+            self._datoteka.write(json.dumps(zapis, separators=(",", ":")) + "\n")
+            self._datoteka.flush()
+            self.stevilo_zapisov += 1
+            self._nesinhronizirani += 1
+
+            if self.stevilo_zapisov >= self.zapisov_do_stiskanja and self._stiskanje is None:
+                self._stiskanje = threading.Thread(target=self._stisni_v_ozadju, daemon=True)
+                self._stiskanje.start()
+            if self._nesinhronizirani >= self.velikost_paketa:
+                self.sinhroniziraj()
+            elif self._casovnik is None:
+                self._casovnik = threading.Timer(self.cas_paketa, self.sinhroniziraj)
+                self._casovnik.daemon = True
+                self._casovnik.start()
+
+    def sinhroniziraj(self):
+        """Zagotovi, da so vsi zapisi na disku."""
+        with self._kljucavnica:
+            if self._casovnik is not None:
+                self._casovnik.cancel()
+                self._casovnik = None
+            if self._nesinhronizirani and self._datoteka is not None:
+                os.fsync(self._datoteka.fileno())
+                self._nesinhronizirani = 0
+
+    def _stisni_v_ozadju(self):
+        try:
+            self.stisni()
+        finally:
+            with self._kljucavnica:
+                self._stiskanje = None
+
+    def stisni(self):
+        """Zapiši celotno bazo v nov posnetek in iz dnevnika odstrani zapise, ki jih posnetek vsebuje.
+        Med pisanjem posnetka na disk lahko druge niti dnevnik še naprej dopolnjujejo. Posnetek in nato dnevnik
+        zamenjamo atomarno; če se program zruši vmes, se zapisi ob naslednjem zagonu ponovijo na posnetku,
+        ki jih že vsebuje, in se preskočijo (glej Integrator.uporabi_zapis)."""
+        with self._kljucavnica_stiskanja:
+            with self._kljucavnica:
+                if self._datoteka is None:
+                    return
+                posnetek = json.dumps(self.integrator.shrani_v_slovar())
+                dolzina = os.fstat(self._datoteka.fileno()).st_size
+                stevilo_zapisov = self.stevilo_zapisov
+
+            zacasna_datoteka = f"{self.datoteka_s_posnetkom}.{os.getpid()}.tmp"
+            with open(zacasna_datoteka, "w") as f:
+                f.write(posnetek)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(zacasna_datoteka, self.datoteka_s_posnetkom)
+            _sinhroniziraj_direktorij(self.datoteka_s_posnetkom)
+
+            with self._kljucavnica:
+                # Zapise, dodane med pisanjem posnetka, prepišemo v nov dnevnik
+                with open(self.datoteka_z_dnevnikom, "rb") as f:
+                    f.seek(dolzina)
+                    novi_zapisi = f.read()
+                zacasna_datoteka = f"{self.datoteka_z_dnevnikom}.{os.getpid()}.tmp"
+                with open(zacasna_datoteka, "wb") as f:
+                    f.write(novi_zapisi)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._datoteka.close()
+                os.replace(zacasna_datoteka, self.datoteka_z_dnevnikom)
+                _sinhroniziraj_direktorij(self.datoteka_z_dnevnikom)
+                self._datoteka = open(self.datoteka_z_dnevnikom, "a", encoding="utf8")
+                self._nesinhronizirani = 0
+                self.stevilo_zapisov -= stevilo_zapisov
+
+    def zapri(self):
+        """Počakaj na stiskanje v teku, stisni dnevnik in ga zapri."""
+        stiskanje = self._stiskanje
+        if stiskanje is not None:
+            stiskanje.join()
+        with self._kljucavnica:
+            self.stisni()
+            self._datoteka.close()
+            self._datoteka = None
+            self.integrator.dnevnik = None
+
+
+def _sinhroniziraj_direktorij(ime_datoteke):
+    """Zagotovi, da je preimenovanje datoteke zapisano na disk."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    direktorij = os.open(os.path.dirname(os.path.abspath(ime_datoteke)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(direktorij)
+    finally:
+        os.close(direktorij)
+
+
+if __name__ == "__main__":
+    # Primerjava hitrosti zapisa oddaje z dnevnikom in s prepisom celotne baze
+    import shutil
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as direktorij:
+        posnetek = os.path.join(direktorij, "db.json")
+        shutil.copy("primer.json", posnetek)
+
+        dnevnik = Dnevnik(posnetek, os.path.join(direktorij, "db.dnevnik"))
+        integrator = dnevnik.nalozi()
+        integrator.ustvari_uporabnika("preizkus", "geslo")
+        uporabnik = integrator.poisci_uporabnika("preizkus")
+
+        STEVILO_ODDAJ = 1000
+        zacetek = time.perf_counter()
+        for i in range(STEVILO_ODDAJ):
+            integrator.dodaj_oddajo(1, uporabnik, f"x^{i % 5}")
+        dnevnik.sinhroniziraj()
+        trajanje = time.perf_counter() - zacetek
+        print(f"dnevnik: {STEVILO_ODDAJ / trajanje:.0f} oddaj na sekundo")
+
+        zacetek = time.perf_counter()
+        for i in range(100):
+            integrator.shrani_v_datoteko(os.path.join(direktorij, "prepis.json"))
+        trajanje = time.perf_counter() - zacetek
+        print(f"prepis baze: {100 / trajanje:.0f} prepisov na sekundo")
+
+        # Po ponovnem branju morajo biti uporabniki in oddaje enaki
+        stanje = integrator.shrani_v_slovar()["uporabniki"]
+        assert Dnevnik(posnetek, dnevnik.datoteka_z_dnevnikom).nalozi().shrani_v_slovar()["uporabniki"] == stanje
+        dnevnik.zapri()
+        assert model.Integrator.ustvari_iz_datoteke(posnetek).shrani_v_slovar()["uporabniki"] == stanje
+        print("Ponovljen dnevnik in stisnjen posnetek se ujemata z bazo.")
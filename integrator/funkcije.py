@@ -1,10 +1,15 @@
 """Zbirka orodij za obdelovanje funkcij, vpisanih v matematičnem zapisu - parsing, evalvacija, ..."""
 
 import random
+from collections import Counter
+from contextlib import contextmanager
 
 import pyparsing as pp
 import math
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.transforms import nonsingular
+import numpy as np
 
 from pomozne_funkcije import linspace
 
@@ -59,6 +64,29 @@ OPERACIJE = {
 # na narisanem grafu izgledal zelo nekonstanten, če tega ne naredimo
 MINIMALNA_VELIKOST_GRAFA = 0.05
 
+# Delež razpona vrednosti, ki ga dodamo nad in pod graf; enako kot privzeto v matplotlib
+ROB_GRAFA = 0.05
+
+# Točke grafa izbiramo prilagodljivo (glej prilagodljive_tocke): začnemo z enakomerno razporejenimi točkami
+# in razpolavljamo intervale, kjer se graf ukrivlja ali skoči, dokler ne dosežemo največjega števila točk
+ZACETNO_STEVILO_TOCK_GRAFA = 33
+NAJVECJE_STEVILO_TOCK_GRAFA = 200
+# Interval razpolovimo, če sredinska točka odstopa od daljice med sosedama ali če se vrednost na njem spremeni
+# za več kot dani delež razpona vrednosti
+PRAG_UKRIVLJENOSTI = 0.002
+PRAG_SKOKA = 0.05
+# Intervalov, krajših od tega deleža območja, ne razpolavljamo več; skok na takem intervalu je nezveznost
+NAJMANJSI_INTERVAL_GRAFA = 1e-4
+# Vrednosti, ki so od pasu med 10. in 90. percentilom oddaljene za več kot toliko širin pasu (npr. ob polih),
+# ne razširijo meja y osi, zato tam oblike grafa ne izboljšujemo
+SIRINA_VIDNEGA_OBMOCJA = 10
+# Ob spremembi izbire točk grafa povečamo, da se shranjene točke in narisani grafi izračunajo znova
+RAZLICICA_TOCK_GRAFA = 2
+# Ob spremembi načina ocenjevanja (npr. prehodu s številskega na simbolni odvod) povečamo, da se ocene
+# iz predpomnilnika ne uporabijo znova. Rezultati že shranjenih oddaj ostanejo nespremenjeni.
+# Različica 3: v vsaki točki upoštevamo boljšega od simbolnega in številskega odvoda (glej odvoda_za_ocenjevanje)
+RAZLICICA_OCENJEVANJA = 3
+
 
 def pridobi_parser():
     """Ustvari nov razčlenjevalnik za interpretacijo matematičnih izrazov."""
@@ -114,67 +142,68 @@ def ustvari_izraz(niz: str, parser):
     return predelaj_izraz(izraz)
 
 
-def evaluiraj_izraz(ociscen_izraz: list, x: float):
-    """Evaluiraj izraz, predstavljen s seznamom, pri vrednosti x"""
+def _rekurzivna_evalvacija(izraz, kontekst):
+    """Rekurzivno evaluiraj izraz. Napak ne obravnava; za to poskrbi evaluiraj_izraz."""
 
-    def rekurzivna_evalvacija(izraz, kontekst):
-        """Rekurzivno evaluiraj izraz"""
+    if not isinstance(izraz, list):
+        if isinstance(izraz, str):
+            return kontekst.get(izraz, 0)
 
-        if not isinstance(izraz, list):
-            if isinstance(izraz, str):
-                return kontekst.get(izraz, 0)
+        # Če je vse po sreči, je izraz sedaj float ali int
+        return izraz
 
-            # Če je vse po sreči, je izraz sedaj float ali int
-            return izraz
-
-        # Izraz je sedaj ena ali več levo asociranih binarnih operacij, ali klic funkcije
+    # Izraz je sedaj ena ali več levo asociranih binarnih operacij, ali klic funkcije
 
-        # Unarni plus ali minus na začetku (ali tik po oklepaju) se evaluirata drugače kot drugje v izrazu,
-        # zato potrebujemo za njiju poseben test
-        leva_vrednost = izraz[0]
-        indeks = 1  # indeks naslednjega (do sedaj neuporabljenega) dela izraza
-        levi_unarni = 1  # +1 ali -1
-        while isinstance(leva_vrednost, str) and leva_vrednost in "+-":
-            levi_unarni *= {"+": 1, "-": -1}[leva_vrednost]
-            leva_vrednost = izraz[indeks]
-            indeks += 1
+    # Unarni plus ali minus na začetku (ali tik po oklepaju) se evaluirata drugače kot drugje v izrazu,
+    # zato potrebujemo za njiju poseben test
+    leva_vrednost = izraz[0]
+    indeks = 1  # indeks naslednjega (do sedaj neuporabljenega) dela izraza
+    levi_unarni = 1  # +1 ali -1
+    while isinstance(leva_vrednost, str) and leva_vrednost in "+-":
+        levi_unarni *= {"+": 1, "-": -1}[leva_vrednost]
+        leva_vrednost = izraz[indeks]
+        indeks += 1
 
-        # Funkcije se parsajo na sledeč način:
-        # "3 + cos(x)" --> [3, "+", "cos", "x"]
-        if isinstance(leva_vrednost, str) and leva_vrednost in FUNKCIJE:
-            leva_vrednost = FUNKCIJE[leva_vrednost](rekurzivna_evalvacija(izraz[indeks], kontekst))
+    # Funkcije se parsajo na sledeč način:
+    # "3 + cos(x)" --> [3, "+", "cos", "x"]
+    if isinstance(leva_vrednost, str) and leva_vrednost in FUNKCIJE:
+        leva_vrednost = FUNKCIJE[leva_vrednost](_rekurzivna_evalvacija(izraz[indeks], kontekst))
+        indeks += 1
+    else:
+        leva_vrednost = _rekurzivna_evalvacija(leva_vrednost, kontekst)
+
+    leva_vrednost *= levi_unarni
+
+    # Ko smo obdelali najbolj levo vrednost, eno po eno obdelamo vse operacije na tem nivoju
+    # Levo asocirane operacije z enako precedenco se parsajo na sledeč način:
+    # "3 + 2 + 5" --> [3, "+", 2, "+", 5]
+    while indeks < len(izraz):
+        operator = izraz[indeks]
+        indeks += 1
+        desna_vrednost = izraz[indeks]
+        indeks += 1
+
+        # Tudi desna vrednost je lahko funkcija
+        if isinstance(desna_vrednost, str) and desna_vrednost in FUNKCIJE:
+            desna_vrednost = FUNKCIJE[desna_vrednost](_rekurzivna_evalvacija(izraz[indeks], kontekst))
             indeks += 1
         else:
-            leva_vrednost = rekurzivna_evalvacija(leva_vrednost, kontekst)
+            desna_vrednost = _rekurzivna_evalvacija(desna_vrednost, kontekst)
 
-        leva_vrednost *= levi_unarni
+        # Da simuliramo levo asociranost, samo prepišemo levo vrednost za naslednjo iteracijo
+        leva_vrednost = OPERACIJE.get(operator, lambda a, b: 0)(leva_vrednost, desna_vrednost)
 
-        # Ko smo obdelali najbolj levo vrednost, eno po eno obdelamo vse operacije na tem nivoju
-        # Levo asocirane operacije z enako precedenco se parsajo na sledeč način:
-        # "3 + 2 + 5" --> [3, "+", 2, "+", 5]
-        while indeks < len(izraz):
-            operator = izraz[indeks]
-            indeks += 1
-            desna_vrednost = izraz[indeks]
-            indeks += 1
-
-            # Tudi desna vrednost je lahko funkcija
-            if isinstance(desna_vrednost, str) and desna_vrednost in FUNKCIJE:
-                desna_vrednost = FUNKCIJE[desna_vrednost](rekurzivna_evalvacija(izraz[indeks], kontekst))
-                indeks += 1
-            else:
-                desna_vrednost = rekurzivna_evalvacija(desna_vrednost, kontekst)
+    return leva_vrednost
 
-            # Da simuliramo levo asociranost, samo prepišemo levo vrednost za naslednjo iteracijo
-            leva_vrednost = OPERACIJE.get(operator, lambda a, b: 0)(leva_vrednost, desna_vrednost)
 
-        return leva_vrednost
+def evaluiraj_izraz(ociscen_izraz: list, x: float):
+    """Evaluiraj izraz, predstavljen s seznamom, pri vrednosti x"""
 
     # Kontekst je skupek vseh vrednosti spremenljivk ob nekem času.
     kontekst = dict(KONSTANTE)
     kontekst["x"] = x
     try:
-        return rekurzivna_evalvacija(ociscen_izraz, kontekst)
+        return _rekurzivna_evalvacija(ociscen_izraz, kontekst)
     except (OverflowError, ZeroDivisionError):
         return math.inf
     except ValueError:
@@ -182,74 +211,941 @@ def evaluiraj_izraz(ociscen_izraz: list, x: float):
         return 0
 
 
-def narisi_graf_iz_tock(x_tocke, y_tocke, ime_datoteke):
-    """Nariši graf iz podanih (x,y) točk, ter ga shrani v datoteko."""
-    fig = plt.figure()
-    axes = fig.add_subplot()
-    axes.plot(x_tocke, y_tocke)
+def razcleni_vozlisce(izraz: list):
+    """Razčleni vozlišče izraza na trojico (predznak, prvi operand, seznam parov (operator, operand)).
+    Operand je bodisi poddrevo (ali list) bodisi par (ime_funkcije, argument), ki predstavlja klic funkcije.
+    Če izraz nima veljavne oblike, sproži IndexError, tako kot evaluiraj_izraz."""
 
-    # Funkcije s konstantnim odvodom izgledajo sila neprijetno, ker matplotlib toliko poveča polje,
-    # da lepo vidimo celoten graf; četudi je potem skala na velikosti 1e-10
-    # Da to popravimo, na roke povečamo razpon y osi toliko, da je velik vsaj MININALNA_VELIKOST_GRAFA
+    def operand(indeks):
+        """Vrni operand, ki se začne na indeksu, in indeks prvega neuporabljenega dela izraza."""
+        vrednost = izraz[indeks]
+        if isinstance(vrednost, str) and vrednost in FUNKCIJE:
+            return (vrednost, izraz[indeks + 1]), indeks + 2
+        return vrednost, indeks + 1
 
-    spodnja, zgornja = axes.get_ybound()
-    if zgornja - spodnja < MINIMALNA_VELIKOST_GRAFA:
-        sredina = (zgornja + spodnja) / 2
-        axes.set_ybound(sredina - 0.5 * MINIMALNA_VELIKOST_GRAFA, sredina + 0.5 * MINIMALNA_VELIKOST_GRAFA)
+    indeks = 0
+    predznak = 1
+    while isinstance(izraz[indeks], str) and izraz[indeks] in "+-":
+        predznak *= {"+": 1, "-": -1}[izraz[indeks]]
+        indeks += 1
 
-    fig.savefig(ime_datoteke)
+    prvi, indeks = operand(indeks)
+    operacije = []
+    while indeks < len(izraz):
+        operator = izraz[indeks]
+        desni, indeks = operand(indeks + 1)
+        operacije.append((operator, desni))
 
+    return predznak, prvi, operacije
 
-def narisi_graf(izraz, obmocje, ime_datoteke):
-    """Nariši graf funkcije v izrazu na danem območju. Narisano sliko shrani v datoteko."""
 
-    xs = []
-    ys = []
+def sestavi_vozlisce(predznak, prvi, operacije):
+    """Sestavi vozlišče izraza iz delov, kot jih vrne razcleni_vozlisce."""
+
+    def deli_operanda(operand):
+        if isinstance(operand, tuple):
+            return list(operand)
+        return [operand]
+
+    vozlisce = ["-"] if predznak == -1 else []
+    vozlisce += deli_operanda(prvi)
+    for operator, operand in operacije:
+        vozlisce.append(operator)
+        vozlisce += deli_operanda(operand)
+
+    # Tako kot predelaj_izraz odstranimo odvečne sloje
+    if len(vozlisce) == 1:
+        return vozlisce[0]
+    return vozlisce
+
+
+# Največje celo število, ki ga float še predstavi natančno; večjih konstant ne izračunamo vnaprej,
+# saj bi se vrednost izraza lahko razlikovala od izračuna s števili float (glej evaluiraj_izraz_vektorsko)
+NAJVECJE_NATANCNO_CELO_STEVILO = 2 ** 53
+
+
+def kanonicna_oblika(ociscen_izraz):
+    """Vrni poenostavljen izraz v kanonični obliki, v kateri so izračunana vsa konstantna poddrevesa in konstantni
+    začetki verig levo asociranih operacij. Poenostavimo tudi operacije, ki vrednosti ne spremenijo (x + 0, x * 1,
+    x ^ 1, 0 + x, 1 * x ...), in vgnezdene predznake ter oklepaje (npr. -(-x) = x).
+    Kanonična oblika ima na vseh točkah natanko enako vrednost kot prvotni izraz, zato jo lahko uporabimo
+    namesto njega pri izračunu in kot ključ za predpomnjenje. Poddreves, katerih izračun sproži napako,
+    ne poenostavimo, tako da napaka ostane napaka celotnega izraza."""
+
+    def je_konstanta(izraz):
+        return isinstance(izraz, (int, float))
+
+    def izracunaj(izraz):
+        """Izračunaj vrednost konstantnega izraza; None, če pri tem pride do napake."""
+        try:
+            vrednost = _rekurzivna_evalvacija(izraz, dict(KONSTANTE))
+        except Exception:
+            return None
+        if isinstance(vrednost, int) and abs(vrednost) > NAJVECJE_NATANCNO_CELO_STEVILO:
+            return None
+        return vrednost
+
+    def je_nevtralna(operator, operand):
+        """Ali operacija z desnim operandom ne spremeni leve vrednosti."""
+        return je_konstanta(operand) and (
+            (operator in ("+", "-") and operand == 0) or (operator in ("*", "/", "^") and operand == 1)
+        )
+
+    def rekurzivno(izraz):
+        if not isinstance(izraz, list):
+            if isinstance(izraz, str) and izraz != "x":
+                # Konstante in neznane spremenljivke zamenjamo z njihovimi vrednostmi
+                return KONSTANTE.get(izraz, 0)
+            return izraz
 
-    for x in linspace(obmocje[0], obmocje[1]):
         try:
-            y = evaluiraj_izraz(izraz, x)
-        except (ZeroDivisionError, OverflowError):
-            # Overflow se lahko pojavi pri npr. visokih potencah
-            y = math.inf
+            predznak, prvi, operacije = razcleni_vozlisce(izraz)
+        except IndexError:
+            return izraz
 
-        xs.append(x)
-        ys.append(y)
+        def kanoniziraj_operand(operand):
+            if isinstance(operand, tuple):
+                ime, argument = operand
+                argument = rekurzivno(argument)
+                if je_konstanta(argument) and (vrednost := izracunaj([ime, argument])) is not None:
+                    return vrednost
+                return ime, argument
+            return rekurzivno(operand)
+
+        prvi = kanoniziraj_operand(prvi)
+        operacije = [(operator, kanoniziraj_operand(operand)) for operator, operand in operacije]
+
+        # Poenostavitve ponavljamo, dokler se vozlišče spreminja, saj ena poenostavitev lahko omogoči drugo
+        spremenjeno = True
+        while spremenjeno:
+            spremenjeno = False
+
+            # Vgnezdeno vozlišče na začetku verige združimo z verigo, saj se operacije izvajajo od leve proti desni;
+            # z vozliščem brez operacij lahko združimo tudi predznak
+            if isinstance(prvi, list):
+                notranji_predznak, notranji_prvi, notranje_operacije = razcleni_vozlisce(prvi)
+                if predznak == 1 or not notranje_operacije:
+                    predznak *= notranji_predznak
+                    prvi = notranji_prvi
+                    operacije = notranje_operacije + operacije
+                    spremenjeno = True
+
+            # Predznak vključimo v prvi operand, če je ta konstanten
+            if je_konstanta(prvi) and predznak == -1 and (vrednost := izracunaj(["-", prvi])) is not None:
+                predznak, prvi = 1, vrednost
+                spremenjeno = True
+
+            # Izračunamo konstantni začetek verige; zaradi leve asociranosti to ne spremeni vrednosti izraza
+            while je_konstanta(prvi) and predznak == 1 and operacije and je_konstanta(operacije[0][1]):
+                vrednost = izracunaj(sestavi_vozlisce(1, prvi, operacije[:1]))
+                if vrednost is None:
+                    break
+                prvi = vrednost
+                operacije = operacije[1:]
+                spremenjeno = True
+
+            # Izpustimo operacije, ki vrednosti ne spremenijo
+            if any(je_nevtralna(operator, operand) for operator, operand in operacije):
+                operacije = [(operator, operand) for operator, operand in operacije
+                             if not je_nevtralna(operator, operand)]
+                spremenjeno = True
+
+            # Izpustimo nevtralen začetek verige (0 + y = y, 0 - y = -y, 1 * y = y)
+            if je_konstanta(prvi) and predznak == 1 and operacije:
+                operator, operand = operacije[0]
+                if (prvi == 0 and operator in ("+", "-")) or (prvi == 1 and operator == "*"):
+                    predznak = -1 if operator == "-" else 1
+                    prvi = operand
+                    operacije = operacije[1:]
+                    spremenjeno = True
+
+        return sestavi_vozlisce(predznak, prvi, operacije)
+
+    return rekurzivno(ociscen_izraz)
+
+
+# Vektorska evalvacija izračuna izraz v vseh točkah naenkrat s pomočjo numpy.
+# Namesto izjem vsaka vektorska funkcija vrne trojico (vrednosti, maska_preliva, maska_domene);
+# maske označujejo točke, v katerih bi ustrezna funkcija iz math sprožila OverflowError oz. ValueError
+
+def _brez_napak(ufunc):
+    """Vektorska funkcija, ki nikoli ne sproži napake."""
+    def vektorska(a):
+        y = ufunc(a)
+        return y, np.zeros(y.shape, dtype=bool), np.zeros(y.shape, dtype=bool)
+    return vektorska
+
+
+def _z_domeno(ufunc, izven_domene):
+    """Vektorska funkcija, ki ima omejeno definicijsko območje in lahko tudi preliva."""
+    def vektorska(a):
+        y = ufunc(a)
+        domena = izven_domene(a)
+        preliv = np.isinf(y) & np.isfinite(a) & ~domena
+        return y, preliv, domena
+    return vektorska
+
+
+def _zaokrozevanje(ufunc):
+    """Vektorska funkcija za floor in ceil; ti na neskončnosti prelijeta, na nan pa javita napako domene."""
+    def vektorska(a):
+        return ufunc(a), np.isinf(a), np.isnan(a)
+    return vektorska
+
+
+def _gama(a):
+    """Vektorska funkcija gama; numpy je ne podpira, zato jo izračunamo po točkah."""
+    y = np.empty(a.shape)
+    preliv = np.zeros(a.shape, dtype=bool)
+    domena = np.zeros(a.shape, dtype=bool)
+    for i, vrednost in enumerate(a.flat):
+        try:
+            y.flat[i] = math.gamma(vrednost)
+        except OverflowError:
+            y.flat[i] = math.inf
+            preliv.flat[i] = True
+        except ValueError:
+            y.flat[i] = 0
+            domena.flat[i] = True
+    return y, preliv, domena
+
+
+def _sin_cos_tan(ufunc):
+    return _z_domeno(ufunc, np.isinf)
+
+
+def _logaritem(ufunc):
+    return _z_domeno(ufunc, lambda a: a <= 0)
+
+
+VEKTORSKE_FUNKCIJE = {
+    "abs": _brez_napak(np.abs),
+    "acos": _z_domeno(np.arccos, lambda a: np.abs(a) > 1),
+    "arccos": _z_domeno(np.arccos, lambda a: np.abs(a) > 1),
+    "acosh": _z_domeno(np.arccosh, lambda a: a < 1),
+    "asin": _z_domeno(np.arcsin, lambda a: np.abs(a) > 1),
+    "arcsin": _z_domeno(np.arcsin, lambda a: np.abs(a) > 1),
+    "asinh": _brez_napak(np.arcsinh),
+    "atan": _brez_napak(np.arctan),
+    "arctan": _brez_napak(np.arctan),
+    "atanh": _z_domeno(np.arctanh, lambda a: np.abs(a) >= 1),
+    "ceil": _zaokrozevanje(np.ceil),
+    "cos": _sin_cos_tan(np.cos),
+    "cosh": _z_domeno(np.cosh, lambda a: np.zeros(a.shape, dtype=bool)),
+    "exp": _z_domeno(np.exp, lambda a: np.zeros(a.shape, dtype=bool)),
+    "floor": _zaokrozevanje(np.floor),
+    "gamma": _gama,
+    "log": _logaritem(np.log),
+    "ln": _logaritem(np.log),
+    "log10": _logaritem(np.log10),
+    "log2": _logaritem(np.log2),
+    "sin": _sin_cos_tan(np.sin),
+    "sinh": _z_domeno(np.sinh, lambda a: np.zeros(a.shape, dtype=bool)),
+    "sqrt": _z_domeno(np.sqrt, lambda a: a < 0),
+    "tan": _sin_cos_tan(np.tan),
+    "tanh": _brez_napak(np.tanh),
+}
 
-    narisi_graf_iz_tock(xs, ys, ime_datoteke)
 
+def _vektorsko_deljenje(a, b):
+    """Deljenje z ničlo da neskončno, tako kot v OPERACIJE."""
+    ni_napak = np.zeros(np.broadcast(a, b).shape, dtype=bool)
+    return np.where(b == 0, math.inf, a / b), ni_napak, ni_napak
 
-def narisi_dvojni_graf_iz_tock(x_tocke, y1_tocke, y2_tocke, naslov1, naslov2, ime_datoteke):
-    """Nariši grafa dveh funkcij, združena na enem koordinatnem sistemu. naslov1 in naslov2 označujeta imena
-    funkcij na legendi."""
-    fig = plt.figure()
-    axes = fig.add_subplot()
-    axes.plot(x_tocke, y1_tocke, label=naslov1)
-    axes.plot(x_tocke, y2_tocke, label=naslov2)
-    axes.legend()
-
-    # Po potrebi popravimo y meje
-    spodnja, zgornja = axes.get_ybound()
-    if zgornja - spodnja < MINIMALNA_VELIKOST_GRAFA:
-        sredina = (zgornja + spodnja) / 2
-        axes.set_ybound(sredina - 0.5 * MINIMALNA_VELIKOST_GRAFA, sredina + 0.5 * MINIMALNA_VELIKOST_GRAFA)
 
-    fig.savefig(ime_datoteke)
+def _vektorsko_potenciranje(a, b):
+    """Potenciranje s pravili math.pow: negativna osnova z necelim eksponentom in ničla z negativnim
+    eksponentom sta izven domene, končna osnova in eksponent s prevelikim rezultatom prelijeta."""
+    y = np.power(a, b)
+    koncna = np.isfinite(a) & np.isfinite(b)
+    domena = koncna & (((a == 0) & (b < 0)) | ((a < 0) & (b != np.floor(b))))
+    preliv = koncna & np.isinf(y) & ~domena
+    return y, preliv, domena
+
+
+VEKTORSKE_OPERACIJE = {
+    "+": lambda a, b: np.add(a, b),
+    "*": lambda a, b: np.multiply(a, b),
+    "-": lambda a, b: np.subtract(a, b),
+}
+
+
+class _VseTockeNapacne(Exception):
+    """Vektorska evalvacija se lahko konča predčasno, če so vse točke že naletele na napako."""
+
 
+def evaluiraj_izraz_vektorsko(ociscen_izraz: list, xs):
+    """Evaluiraj izraz, predstavljen s seznamom, v vseh točkah xs naenkrat. Vrne numpy tabelo.
+    Pravila so enaka kot pri evaluiraj_izraz: če bi v neki točki prišlo do preliva, je vrednost v njej
+    neskončna, če bi prišlo do napake domene, pa 0. Odloča prva napaka po vrstnem redu evalvacije.
+    Za večkratno evalvacijo istega izraza uporabi prevedi_izraz."""
+    return prevedi_izraz(ociscen_izraz)(xs)
 
-def izracunaj_odvod(izraz, tocka):
-    """Izračunaj numerični približek odvoda izraza v dani točki."""
+
+def prevedi_izraz(ociscen_izraz: list):
+    """Prevedi izraz, predstavljen s seznamom, v funkcijo, ki ga evaluira v vseh točkah naenkrat
+    (glej evaluiraj_izraz_vektorsko). Drevo izraza obdelamo le ob prevajanju, ne ob vsaki evalvaciji."""
+    izracunaj = prevedi_izraze([ociscen_izraz])
+
+    def prevedena(xs):
+        vrednosti, __ = izracunaj(xs)
+        return vrednosti[0]
+    return prevedena
+
+
+def _zabelezi_napake(stanje, preliv, domena):
+    """Zabeleži napake v točkah, kjer do sedaj še ni prišlo do napake."""
+    brez_napake = stanje == 0
+    stanje[brez_napake & preliv] = 1
+    stanje[brez_napake & domena] = 2
+
+
+def _neveljavna_oblika(xs, stanje, spomin):
+    """Interpreter ob neveljavni obliki izraza sproži IndexError; a le v točkah, kjer ni že prej naletel
+    na drugo napako."""
+    if (stanje == 0).any():
+        raise IndexError("Neveljavna oblika izraza")
+    raise _VseTockeNapacne()
+
+
+def _sprozi(napaka):
+    """Vrni prevedeno vozlišče ali operacijo, ki ob evalvaciji sproži napako; tako napake neveljavnih izrazov javimo
+    na istem mestu kot interpreter."""
+    def vozlisce(*argumenti):
+        raise napaka
+    return vozlisce
+
+
+def _prevedi_operacijo(operator):
+    """Vrni funkcijo (a, b, xs, stanje), ki izvede binarno operacijo in zabeleži njene napake."""
+    try:
+        operacija = VEKTORSKE_OPERACIJE.get(operator)
+    except TypeError as napaka:
+        # Neveljaven operator; interpreter bi napako sprožil šele ob uporabi operacije
+        return _sprozi(napaka)
+
+    if operacija is not None:
+        return lambda a, b, xs, stanje: operacija(a, b)
+    if operator == "/":
+        # Deljenje ne povzroča napak
+        return lambda a, b, xs, stanje: _vektorsko_deljenje(a, b)[0]
+    if operator == "^":
+        def potenciranje(a, b, xs, stanje):
+            vrednosti, preliv, domena = _vektorsko_potenciranje(a, b)
+            _zabelezi_napake(stanje, preliv, domena)
+            return vrednosti
+        return potenciranje
+    return lambda a, b, xs, stanje: np.zeros(xs.shape)
+
+
+def prevedi_izraze(izrazi):
+    """Prevedi izraze v funkcijo, ki jih po vrsti evaluira v vseh točkah xs naenkrat kot evaluiraj_izraz_vektorsko.
+    Prevedena funkcija vrne par (seznam vrednosti izrazov, stanje); stanje za vsako točko pove, ali je v katerem
+    od izrazov prišlo do napake (0 - brez napake, 1 - preliv, 2 - napaka domene).
+    Vsako vozlišče prevedemo v funkcijo (xs, stanje, spomin), ki neposredno kliče funkcije svojih operandov.
+    Poddrevesa, ki se pojavijo večkrat (npr. v izrazu in njegovem odvodu, glej odvod_izraza), ob evalvaciji
+    izračunamo le enkrat in si njihove vrednosti zapomnimo v spominu."""
+
+    # Število pojavitev vozlišč po id; drevesa med prevajanjem ostanejo živa, zato se id ne ponovijo
+    pojavitve = Counter()
+
+    def prestej(izraz):
+        if isinstance(izraz, list):
+            pojavitve[id(izraz)] += 1
+            if pojavitve[id(izraz)] == 1:
+                for podizraz in izraz:
+                    prestej(podizraz)
+
+    for izraz in izrazi:
+        prestej(izraz)
+
+    prevedena_vozlisca = {}
+
+    def prevedi(izraz):
+        if not isinstance(izraz, list):
+            if isinstance(izraz, str):
+                if izraz == "x":
+                    return lambda xs, stanje, spomin: xs
+                vrednost = KONSTANTE.get(izraz, 0)
+            else:
+                vrednost = izraz
+            return lambda xs, stanje, spomin: np.full(xs.shape, vrednost, dtype=float)
+
+        if id(izraz) not in prevedena_vozlisca:
+            vozlisce = prevedi_vozlisce(izraz)
+            if pojavitve[id(izraz)] > 1:
+                vozlisce = zapomni(vozlisce, len(prevedena_vozlisca))
+            prevedena_vozlisca[id(izraz)] = vozlisce
+        return prevedena_vozlisca[id(izraz)]
+
+    def zapomni(vozlisce, kljuc):
+        def zapomnjeno(xs, stanje, spomin):
+            if kljuc not in spomin:
+                spomin[kljuc] = vozlisce(xs, stanje, spomin)
+            return spomin[kljuc]
+        return zapomnjeno
+
+    def prevedi_operand(izraz, operand, indeks):
+        """Prevedi operand vozlišča; funkcija vzame še naslednji element kot argument.
+        Vrni par (prevedeni operand, indeks naslednjega elementa)."""
+        if not (isinstance(operand, str) and operand in FUNKCIJE):
+            return prevedi(operand), indeks
+        if indeks >= len(izraz):
+            return _neveljavna_oblika, indeks
+        funkcija = VEKTORSKE_FUNKCIJE[operand]
+        argument = prevedi(izraz[indeks])
+
+        def uporabi_funkcijo(xs, stanje, spomin):
+            vrednosti, preliv, domena = funkcija(argument(xs, stanje, spomin))
+            _zabelezi_napake(stanje, preliv, domena)
+            return vrednosti
+        return uporabi_funkcijo, indeks + 1
+
+    def prevedi_vozlisce(izraz):
+        """Prevedi vozlišče; struktura sledi evaluiraj_izraz."""
+        if not izraz:
+            return _sprozi(IndexError("Neveljavna oblika izraza"))
+
+        leva = izraz[0]
+        indeks = 1
+        levi_unarni = 1
+        while isinstance(leva, str) and leva in "+-":
+            if leva not in ("+", "-"):
+                return _sprozi(KeyError(leva))
+            levi_unarni *= {"+": 1, "-": -1}[leva]
+            if indeks >= len(izraz):
+                return _neveljavna_oblika
+            leva = izraz[indeks]
+            indeks += 1
+        levi, indeks = prevedi_operand(izraz, leva, indeks)
+
+        operacije = []
+        while indeks < len(izraz):
+            operacija = _prevedi_operacijo(izraz[indeks])
+            indeks += 1
+            if indeks >= len(izraz):
+                operacije.append((operacija, _neveljavna_oblika))
+                break
+            desni, indeks = prevedi_operand(izraz, izraz[indeks], indeks + 1)
+            operacije.append((operacija, desni))
+
+        if levi_unarni == -1:
+            prvi = levi
+
+            def levi(xs, stanje, spomin):
+                return -prvi(xs, stanje, spomin)
+
+        if not operacije:
+            return levi
+        if len(operacije) == 1:
+            ((operacija, desni),) = operacije
+
+            def binarno(xs, stanje, spomin):
+                a = levi(xs, stanje, spomin)
+                return operacija(a, desni(xs, stanje, spomin), xs, stanje)
+            return binarno
+
+        def veriga(xs, stanje, spomin):
+            a = levi(xs, stanje, spomin)
+            for operacija, desni in operacije:
+                a = operacija(a, desni(xs, stanje, spomin), xs, stanje)
+            return a
+        return veriga
+
+    koreni = [prevedi(izraz) for izraz in izrazi]
+
+    def izracunaj(xs):
+        xs = np.asarray(xs, dtype=float)
+        # Stanje posamezne točke: 0 - brez napake, 1 - preliv, 2 - napaka domene
+        stanje = np.zeros(xs.shape, dtype=np.int8)
+        spomin = {}
+
+        vrednosti = []
+        with np.errstate(all="ignore"):
+            for koren in koreni:
+                try:
+                    vrednosti.append(np.array(koren(xs, stanje, spomin), dtype=float))
+                except _VseTockeNapacne:
+                    vrednosti.append(np.zeros(xs.shape))
+
+        for ys in vrednosti:
+            ys[stanje == 1] = math.inf
+            ys[stanje == 2] = 0
+        return vrednosti, stanje
+    return izracunaj
+
+
+# Sestavljanje izrazov za odvod; sproti poenostavimo množenje z 0 in 1 ter prištevanje 0,
+# da izrazi za odvod ne rastejo po nepotrebnem
+
+def _je_stevilo(izraz):
+    return isinstance(izraz, (int, float))
+
+
+def _vsota(a, b):
+    if _je_stevilo(a) and _je_stevilo(b):
+        return a + b
+    if _je_stevilo(a) and a == 0:
+        return b
+    if _je_stevilo(b) and b == 0:
+        return a
+    return [a, "+", b]
+
+
+def _nasprotna_vrednost(a):
+    if _je_stevilo(a):
+        return -a
+    return ["-", a]
+
+
+def _razlika(a, b):
+    if _je_stevilo(a) and _je_stevilo(b):
+        return a - b
+    if _je_stevilo(b) and b == 0:
+        return a
+    if _je_stevilo(a) and a == 0:
+        return _nasprotna_vrednost(b)
+    return [a, "-", b]
+
+
+def _produkt(a, b):
+    if _je_stevilo(a) and _je_stevilo(b):
+        return a * b
+    if (_je_stevilo(a) and a == 0) or (_je_stevilo(b) and b == 0):
+        return 0
+    if _je_stevilo(a) and a == 1:
+        return b
+    if _je_stevilo(b) and b == 1:
+        return a
+    return [a, "*", b]
+
+
+def _kvocient(a, b):
+    if _je_stevilo(a) and a == 0:
+        return 0
+    if _je_stevilo(b) and b == 1:
+        return a
+    return [a, "/", b]
+
+
+def _kvadrat(a):
+    # Množenje je hitrejše od potenciranja; drugi operand je isto poddrevo, zato se izračuna le enkrat
+    return [a, "*", a]
+
+
+def _potenca(a, b):
+    if _je_stevilo(b) and b == 1:
+        return a
+    if _je_stevilo(b) and b == 2:
+        return _kvadrat(a)
+    return [a, "^", b]
+
+
+# Odvodi funkcij iz FUNKCIJE: vsaka iz argumenta u sestavi izraz za odvod funkcije po u.
+# Funkcije, ki niso povsod odvedljive (abs, ceil, floor), in gama, katere odvoda ne moremo zapisati s funkcijami
+# iz FUNKCIJE, imajo None; izraze z njimi odvajamo numerično.
+ODVODI_FUNKCIJ = {
+    "abs": None,
+    "acos": lambda u: ["-", [1, "/", ["sqrt", [1, "-", _kvadrat(u)]]]],
+    "arccos": lambda u: ["-", [1, "/", ["sqrt", [1, "-", _kvadrat(u)]]]],
+    "acosh": lambda u: [1, "/", ["sqrt", [_kvadrat(u), "-", 1]]],
+    "asin": lambda u: [1, "/", ["sqrt", [1, "-", _kvadrat(u)]]],
+    "arcsin": lambda u: [1, "/", ["sqrt", [1, "-", _kvadrat(u)]]],
+    "asinh": lambda u: [1, "/", ["sqrt", [_kvadrat(u), "+", 1]]],
+    "atan": lambda u: [1, "/", [1, "+", _kvadrat(u)]],
+    "arctan": lambda u: [1, "/", [1, "+", _kvadrat(u)]],
+    "atanh": lambda u: [1, "/", [1, "-", _kvadrat(u)]],
+    "ceil": None,
+    "cos": lambda u: ["-", ["sin", u]],
+    "cosh": lambda u: ["sinh", u],
+    "exp": lambda u: ["exp", u],
+    "floor": None,
+    "gamma": None,
+    "log": lambda u: [1, "/", u],
+    "ln": lambda u: [1, "/", u],
+    "log10": lambda u: [1, "/", [u, "*", math.log(10)]],
+    "log2": lambda u: [1, "/", [u, "*", math.log(2)]],
+    "sin": lambda u: ["cos", u],
+    "sinh": lambda u: ["cosh", u],
+    "sqrt": lambda u: [1, "/", [2, "*", ["sqrt", u]]],
+    "tan": lambda u: [1, "/", _kvadrat(["cos", u])],
+    "tanh": lambda u: [1, "-", _kvadrat(["tanh", u])],
+}
+
+
+class _BrezOdvoda(Exception):
+    """Izraz vsebuje funkcijo, katere odvoda ne znamo zapisati."""
+
+
+def odvod_izraza(ociscen_izraz):
+    """Vrni izraz za odvod izraza po x, v enaki obliki, kot jo vrne predelaj_izraz.
+    Vrni None, če izraz vsebuje funkcijo brez odvoda v ODVODI_FUNKCIJ ali nima veljavne oblike.
+    Izraz za odvod vsebuje poddrevesa prvotnega izraza (ne njihovih kopij), zato se nobenega od njiju ne sme spreminjati.
+    Odvod je pravilen povsod, kjer je izraz definiran in odvedljiv; drugje ga izracunaj_odvod_vektorsko
+    izračuna numerično."""
+
+    def drevo_operanda(operand):
+        if isinstance(operand, tuple):
+            return list(operand)
+        return operand
+
+    def odvod_operanda(operand):
+        if isinstance(operand, tuple):
+            ime, argument = operand
+            if ODVODI_FUNKCIJ[ime] is None:
+                raise _BrezOdvoda()
+            # Verižno pravilo
+            return _produkt(ODVODI_FUNKCIJ[ime](argument), rekurzivno(argument))
+        return rekurzivno(operand)
+
+    def rekurzivno(izraz):
+        if not isinstance(izraz, list):
+            # Konstante in neznane spremenljivke so konstantne
+            return 1 if izraz == "x" else 0
+
+        predznak, prvi, operacije = razcleni_vozlisce(izraz)
+        leva = drevo_operanda(prvi)
+        odvod = odvod_operanda(prvi)
+        if predznak == -1:
+            leva, odvod = ["-", leva], _nasprotna_vrednost(odvod)
+
+        # Verigo levo asociranih operacij odvajamo od leve proti desni; leva je izraz za dosedanji del verige
+        for operator, operand in operacije:
+            desna = drevo_operanda(operand)
+            odvod_desne = odvod_operanda(operand)
+            if operator == "+":
+                odvod = _vsota(odvod, odvod_desne)
+            elif operator == "-":
+                odvod = _razlika(odvod, odvod_desne)
+            elif operator == "*":
+                odvod = _vsota(_produkt(odvod, desna), _produkt(leva, odvod_desne))
+            elif operator == "/":
+                odvod = _kvocient(
+                    _razlika(_produkt(odvod, desna), _produkt(leva, odvod_desne)),
+                    _potenca(desna, 2)
+                )
+            elif operator == "^":
+                if _je_stevilo(odvod_desne) and odvod_desne == 0:
+                    # Konstanten eksponent
+                    odvod = _produkt(_produkt(desna, _potenca(leva, _razlika(desna, 1))), odvod)
+                else:
+                    odvod = _produkt(
+                        [leva, "^", desna],
+                        _vsota(_produkt(odvod_desne, ["ln", leva]), _kvocient(_produkt(desna, odvod), leva))
+                    )
+            else:
+                # Neznane operacije imajo vrednost 0 (glej OPERACIJE)
+                odvod = 0
+            leva = [leva, operator, desna]
+
+        return odvod
+
+    try:
+        return rekurzivno(ociscen_izraz)
+    except (_BrezOdvoda, IndexError, RecursionError):
+        return None
+
+
+def izracunaj_odvod_vektorsko(izraz, tocke):
+    """Izračunaj odvod izraza v vseh danih točkah naenkrat. Vrne numpy tabelo.
+    Za večkratni izračun odvoda istega izraza uporabi prevedi_odvod."""
+    return prevedi_odvod(izraz)(tocke)
+
+
+def prevedi_odvod(izraz, izracunaj_izraz=None):
+    """Vrni funkcijo, ki izračuna odvod izraza v vseh danih točkah naenkrat; izraz za odvod sestavimo
+    (glej odvod_izraza) in prevedemo le enkrat. Izraz in njegov odvod evaluiramo skupaj, tako da se skupna
+    poddrevesa izračunajo le enkrat. V točkah, kjer izraz ali njegov odvod nista definirana, in za izraze,
+    ki jih ne znamo odvajati, uporabimo numerični približek (glej numericni_odvod_vektorsko).
+    izracunaj_izraz je že prevedeni izraz (glej prevedi_izraz), če ga imamo."""
+    if izracunaj_izraz is None:
+        izracunaj_izraz = prevedi_izraz(izraz)
+
+    odvod = odvod_izraza(izraz)
+    if odvod is None:
+        return lambda tocke: numericni_odvod_vektorsko(izracunaj_izraz, tocke)
+
+    izracunaj_oba = prevedi_izraze([izraz, odvod])
+
+    def izracunaj_odvod(tocke):
+        tocke = np.asarray(tocke, dtype=float)
+
+        # Izraz evaluiramo le zato, da vemo, kje ni definiran
+        (__, vrednosti), stanje = izracunaj_oba(tocke)
+
+        numericno = (stanje != 0) | ~np.isfinite(vrednosti)
+        if numericno.any():
+            vrednosti[numericno] = numericni_odvod_vektorsko(izracunaj_izraz, tocke[numericno])
+        return vrednosti
+    return izracunaj_odvod
+
+
+def relativna_razlika(y1, y2):
+    """Razlika vrednosti, relativna glede na vsoto njunih absolutnih vrednosti, a nikoli večja od absolutne."""
+    with np.errstate(all="ignore"):
+        return np.abs(y1 - y2) / np.maximum(np.abs(y1) + np.abs(y2), 1)
+
+
+def odvoda_za_ocenjevanje(izracunaj_izraz, izracunaj_odvod, tocke, pricakovane, meja):
+    """Vrni tabelo z dvema vrsticama približkov odvoda v danih točkah: številskega (glej numericni_odvod_vektorsko)
+    in točnega (glej prevedi_odvod). Ocenjevanje v vsaki točki upošteva bolje ocenjenega (glej
+    model.Naloga.oceni_odvod), tako da oddaja nikoli ne dobi manj točk kot s številskim odvodom: ta je ob
+    nezveznostih in na mejah kriterija ocenjevanja lahko ugodnejši od točnega.
+    Točni odvod izračunamo le v točkah, kjer se številski od pričakovanih vrednosti razlikuje za vsaj mejo
+    (glej relativna_razlika); drugod je že ocenjen z vsemi točkami. Tako točne oddaje ocenimo enako hitro kot
+    s številskim odvodom, izraza za odvod pa za njih niti ne sestavimo."""
+    tocke = np.asarray(tocke, dtype=float)
+    stevilski = numericni_odvod_vektorsko(izracunaj_izraz, tocke)
+
+    tocni = stevilski.copy()
+    ni_tocen = ~((relativna_razlika(pricakovane, stevilski) < meja) | (pricakovane == stevilski))
+    if ni_tocen.any():
+        tocni[ni_tocen] = izracunaj_odvod(tocke[ni_tocen])
+    return np.array([stevilski, tocni])
+
+
+def numericni_odvod_vektorsko(izracunaj_izraz, tocke):
+    """Izračunaj numerični približek odvoda v vseh danih točkah naenkrat. Vrne numpy tabelo.
+    izracunaj_izraz je prevedeni izraz (glej prevedi_izraz); točke levo in desno evaluiramo v enem klicu."""
+    tocke = np.asarray(tocke, dtype=float)
 
     # Na visokih koordinatah je napaka računanja odvoda večja; to poskusimo rešiti tako,
     # da povečamo razpon točk za računanje
     # Pri mnogo funkcijah to dobro deluje, z nekaterimi izjemami; npr. sinus ali kosinus, kjer
     # večje območje pripomore k večji napaki
-    EPS = 1e-6 * max(abs(tocka), 1)
+    eps = 1e-6 * np.maximum(np.abs(tocke), 1)
 
-    desno = evaluiraj_izraz(izraz, tocka+EPS)
-    levo = evaluiraj_izraz(izraz, tocka-EPS)
+    desno, levo = np.split(izracunaj_izraz(np.concatenate([tocke + eps, tocke - eps])), 2)
 
-    return (desno - levo) / 2 / EPS
+    with np.errstate(all="ignore"):
+        return (desno - levo) / 2 / eps
+
+
+@contextmanager
+def nov_graf(ime_datoteke):
+    """Ustvari sliko s koordinatnim sistemom, v katerega rišemo znotraj bloka with.
+    Ob izhodu iz bloka sliko shrani v datoteko in jo sprosti.
+    Ne uporabljamo pyplot, ki si zapomni vse kdaj ustvarjene slike, zato bi strežniku poraba pomnilnika rasla
+    brez meja."""
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    try:
+        axes = fig.add_subplot()
+        yield axes
+        fig.savefig(ime_datoteke)
+    finally:
+        fig.clear()
+
+
+def narisi_graf_iz_tock(x_tocke, y_tocke, ime_datoteke):
+    """Nariši graf iz podanih (x,y) točk, ter ga shrani v datoteko."""
+    with nov_graf(ime_datoteke) as axes:
+        axes.plot(x_tocke, y_tocke)
+        axes.set_ybound(*meje_y([y_tocke]))
+
+
+def popravi_meje_y(spodnja, zgornja):
+    """Vrni meje y osi grafa, po potrebi razširjene."""
+
+    # Funkcije s konstantnim odvodom izgledajo sila neprijetno, ker matplotlib toliko poveča polje,
+    # da lepo vidimo celoten graf; četudi je potem skala na velikosti 1e-10
+    # Da to popravimo, na roke povečamo razpon y osi toliko, da je velik vsaj MININALNA_VELIKOST_GRAFA
+
+    if zgornja - spodnja < MINIMALNA_VELIKOST_GRAFA:
+        sredina = (zgornja + spodnja) / 2
+        return sredina - 0.5 * MINIMALNA_VELIKOST_GRAFA, sredina + 0.5 * MINIMALNA_VELIKOST_GRAFA
+    return spodnja, zgornja
+
+
+def _vidno_obmocje(ys):
+    """Vrni spodnje in zgornje meje vidnih vrednosti serij v tabeli ys ter razpone serij, vse kot stolpce,
+    primerne za računanje s tabelo ys. Razpon merimo med 10. in 90. percentilom, da ga posamezne zelo velike
+    vrednosti ne povečajo; ničeln razpon zamenjamo z 1. Vidno območje je pas, razširjen za
+    SIRINA_VIDNEGA_OBMOCJA razponov."""
+    spodnje, zgornje, razponi = np.zeros((len(ys), 1)), np.zeros((len(ys), 1)), np.ones((len(ys), 1))
+    for i, y in enumerate(ys):
+        koncne = y[np.isfinite(y)]
+        if len(koncne) > 0:
+            spodnje[i], zgornje[i] = np.percentile(koncne, [10, 90])
+            if zgornje[i] > spodnje[i]:
+                razponi[i] = zgornje[i] - spodnje[i]
+    return spodnje - SIRINA_VIDNEGA_OBMOCJA * razponi, zgornje + SIRINA_VIDNEGA_OBMOCJA * razponi, razponi
+
+
+def meje_y(serije):
+    """Vrni meje y osi grafa s seznamom serij vrednosti. Meje izračunamo enako, kot jih izračuna matplotlib,
+    le da neskončnih vrednosti in vrednosti izven vidnega območja (glej _vidno_obmocje) ne upoštevamo."""
+    vse_vrednosti = np.concatenate([np.asarray(y_tocke, dtype=float).ravel() for y_tocke in serije])
+    koncne_vrednosti = vse_vrednosti[np.isfinite(vse_vrednosti)]
+    if len(koncne_vrednosti) > 0:
+        spodnja, zgornja, __ = _vidno_obmocje([koncne_vrednosti])
+        koncne_vrednosti = koncne_vrednosti[(spodnja[0, 0] <= koncne_vrednosti) & (koncne_vrednosti <= zgornja[0, 0])]
+
+        # Tako kot matplotlib konstantne vrednosti razširimo na neničeln razpon
+        spodnja, zgornja = nonsingular(float(koncne_vrednosti.min()), float(koncne_vrednosti.max()), expander=0.05)
+        rob = ROB_GRAFA * (zgornja - spodnja)
+        spodnja, zgornja = spodnja - rob, zgornja + rob
+    else:
+        spodnja, zgornja = 0, 1
+    return popravi_meje_y(spodnja, zgornja)
+
+
+def prilagodljive_tocke(izracunaj, obmocje, xs=None, ys=None, najvecje_stevilo_tock=NAJVECJE_STEVILO_TOCK_GRAFA):
+    """Izberi točke za risanje grafa ene ali več serij na območju. izracunaj vrne vrednosti serij (tabelo z
+    vrstico za vsako serijo ali eno samo vrstico) v danih x koordinatah naenkrat.
+    Začnemo z ZACETNO_STEVILO_TOCK_GRAFA enakomerno razporejenimi točkami oziroma s podanimi xs in vrednostmi ys,
+    nato pa razpolavljamo intervale, na katerih se katera od serij ukrivlja ali skoči; najprej tiste z
+    največjim odstopanjem. Vrni urejene x koordinate in tabelo vrednosti serij v njih."""
+    if xs is None:
+        xs = np.linspace(obmocje[0], obmocje[1], ZACETNO_STEVILO_TOCK_GRAFA)
+        ys = izracunaj(xs)
+    xs = np.asarray(xs, dtype=float)
+    ys = np.array(ys, dtype=float, ndmin=2)
+    spodnja, zgornja, razpon = _vidno_obmocje(ys)
+    najmanjsi_interval = NAJMANJSI_INTERVAL_GRAFA * (obmocje[1] - obmocje[0])
+
+    while len(xs) < najvecje_stevilo_tock:
+        # Vrednosti izven vidnega območja obravnavamo kot vrednosti na njegovem robu
+        vidne = np.clip(ys, spodnja, zgornja)
+        with np.errstate(all="ignore"):
+            # Skoki; interval, na katerem je le eno krajišče končno, razpolovimo v vsakem primeru
+            koncne = np.isfinite(ys)
+            skok = np.nan_to_num(np.abs(np.diff(vidne, axis=1)) / razpon, nan=0)
+            skok[koncne[:, 1:] != koncne[:, :-1]] = np.inf
+            ocena = (skok / PRAG_SKOKA).max(axis=0)
+
+            # Ukrivljenost: odstopanje notranjih točk od daljice med sosedama pripišemo obema intervaloma
+            delez = (xs[1:-1] - xs[:-2]) / (xs[2:] - xs[:-2])
+            daljica = vidne[:, :-2] + delez * (vidne[:, 2:] - vidne[:, :-2])
+            odstopanje = np.nan_to_num(np.abs(vidne[:, 1:-1] - daljica) / razpon, nan=0, posinf=0)
+            ukrivljenost = (odstopanje / PRAG_UKRIVLJENOSTI).max(axis=0)
+
+        ocena[:-1] = np.maximum(ocena[:-1], ukrivljenost)
+        ocena[1:] = np.maximum(ocena[1:], ukrivljenost)
+        ocena[np.diff(xs) <= najmanjsi_interval] = 0
+
+        izbrani = np.flatnonzero(ocena > 1)
+        if len(izbrani) == 0:
+            break
+        izbrani = izbrani[np.argsort(-ocena[izbrani], kind="stable")][:najvecje_stevilo_tock - len(xs)]
+
+        # Nove točke izračunamo naenkrat in jih uvrstimo med obstoječe
+        nove_xs = (xs[izbrani] + xs[izbrani + 1]) / 2
+        nove_ys = np.array(izracunaj(nove_xs), dtype=float, ndmin=2)
+        vrstni_red = np.argsort(np.concatenate([xs, nove_xs]), kind="stable")
+        xs = np.concatenate([xs, nove_xs])[vrstni_red]
+        ys = np.concatenate([ys, nove_ys], axis=1)[:, vrstni_red]
+
+    return xs, ys
+
+
+def prekini_skoke(izracunaj, obmocje, xs, ys):
+    """Poišči nezveznosti serij v točkah xs z vrednostmi ys (glej prilagodljive_tocke) in jih označi, da črta grafa
+    ne poteka čez njih. Kandidati so intervali, na katerih serija skoči, naklon pa je mnogo večji kot na sosednjih
+    intervalih ali pa ima na obeh nasprotni predznak (npr. ob polu funkcije 1/x). Kandidate razpolavljamo in
+    obdržimo polovico z večjim skokom; strmi zvezni funkciji se skok pri tem zmanjša, pri nezveznosti pa ostane
+    tudi na intervalu, krajšem od najmanjšega. Tja vstavimo točko, v kateri ima serija vrednost nan, ostalim
+    serijam pa vrednost interpoliramo. Vrni nove x koordinate in tabelo vrednosti."""
+    xs = np.asarray(xs, dtype=float)
+    ys = np.array(ys, dtype=float, ndmin=2)
+    if len(xs) < 2:
+        return xs, ys
+    spodnja, zgornja, razpon = _vidno_obmocje(ys)
+    najmanjsi_interval = NAJMANJSI_INTERVAL_GRAFA * (obmocje[1] - obmocje[0])
+
+    def skok(serije, y_levo, y_desno):
+        return np.abs(np.clip(y_desno, spodnja[serije, 0], zgornja[serije, 0]) -
+                      np.clip(y_levo, spodnja[serije, 0], zgornja[serije, 0])) / razpon[serije, 0]
+
+    koncne = np.isfinite(ys)
+    dy = np.diff(np.clip(ys, spodnja, zgornja), axis=1)
+    with np.errstate(all="ignore"):
+        naklon = np.abs(dy / np.diff(xs))
+        kandidati = (np.abs(dy) / razpon > PRAG_SKOKA) & koncne[:, 1:] & koncne[:, :-1]
+        sosednji = np.pad(naklon, ((0, 0), (1, 1)))
+        predznak = np.sign(np.pad(dy, ((0, 0), (1, 1))))
+        kandidati &= (naklon > 4 * np.maximum(sosednji[:, :-2], sosednji[:, 2:])) | (
+            (predznak[:, 1:-1] * predznak[:, :-2] < 0) & (predznak[:, 1:-1] * predznak[:, 2:] < 0)
+        )
+
+    serije, intervali = np.nonzero(kandidati)
+    levo, desno = xs[intervali], xs[intervali + 1]
+    y_levo, y_desno = ys[serije, intervali], ys[serije, intervali + 1]
+    nove_xs, nove_ys = [xs], [ys]
+    while (aktivni := np.flatnonzero(desno - levo > najmanjsi_interval)).size > 0:
+        # Sredine vseh aktivnih kandidatov izračunamo naenkrat
+        sredine = (levo[aktivni] + desno[aktivni]) / 2
+        vrednosti = np.array(izracunaj(sredine), dtype=float, ndmin=2)
+        nove_xs.append(sredine)
+        nove_ys.append(vrednosti)
+
+        y_sredine = vrednosti[serije[aktivni], np.arange(len(aktivni))]
+        leva_polovica = (skok(serije[aktivni], y_levo[aktivni], y_sredine) >=
+                         skok(serije[aktivni], y_sredine, y_desno[aktivni]))
+        desno[aktivni[leva_polovica]] = sredine[leva_polovica]
+        y_desno[aktivni[leva_polovica]] = y_sredine[leva_polovica]
+        levo[aktivni[~leva_polovica]] = sredine[~leva_polovica]
+        y_levo[aktivni[~leva_polovica]] = y_sredine[~leva_polovica]
+
+    vrstni_red = np.argsort(np.concatenate(nove_xs), kind="stable")
+    xs = np.concatenate(nove_xs)[vrstni_red]
+    ys = np.concatenate(nove_ys, axis=1)[:, vrstni_red]
+
+    # Nezveznosti so intervali, na katerih je skok ostal
+    with np.errstate(invalid="ignore"):
+        nezvezni = skok(serije, y_levo, y_desno) > PRAG_SKOKA
+    prekinitve = np.zeros((len(ys), len(xs) - 1), dtype=bool)
+    prekinitve[serije[nezvezni], np.searchsorted(xs, levo[nezvezni])] = True
+    stolpci = np.flatnonzero(prekinitve.any(axis=0))
+    if len(stolpci) == 0:
+        return xs, ys
+
+    nove_ys = (ys[:, stolpci] + ys[:, stolpci + 1]) / 2
+    nove_ys[prekinitve[:, stolpci]] = np.nan
+    nove_xs = (xs[stolpci] + xs[stolpci + 1]) / 2
+    return np.insert(xs, stolpci + 1, nove_xs), np.insert(ys, stolpci + 1, nove_ys, axis=1)
+
+
+def tocke_grafa(izraz, obmocje):
+    """Vrni x in y koordinate točk, v katerih rišemo graf funkcije v izrazu na danem območju.
+    Na nezveznostih je vrednost nan (glej prekini_skoke)."""
+
+    # Preliv (npr. pri visokih potencah) da neskončno vrednost
+    izracunaj = prevedi_izraz(izraz)
+
+    xs, ys = prekini_skoke(izracunaj, obmocje, *prilagodljive_tocke(izracunaj, obmocje))
+    return xs, ys[0]
+
+
+def narisi_graf(izraz, obmocje, ime_datoteke):
+    """Nariši graf funkcije v izrazu na danem območju. Narisano sliko shrani v datoteko."""
+    narisi_graf_iz_tock(*tocke_grafa(izraz, obmocje), ime_datoteke)
+
+
+def narisi_dvojni_graf_iz_tock(x_tocke, y1_tocke, y2_tocke, naslov1, naslov2, ime_datoteke):
+    """Nariši grafa dveh funkcij, združena na enem koordinatnem sistemu. naslov1 in naslov2 označujeta imena
+    funkcij na legendi."""
+    with nov_graf(ime_datoteke) as axes:
+        axes.plot(x_tocke, y1_tocke, label=naslov1)
+        axes.plot(x_tocke, y2_tocke, label=naslov2)
+        axes.legend()
+        axes.set_ybound(*meje_y([y1_tocke, y2_tocke]))
+
+
+def podatki_grafa(x_tocke, serije):
+    """Pripravi točke grafa za risanje v brskalniku, v obliki, primerni za JSON.
+    serije je seznam parov (oznaka, y_tocke); oznaka je lahko None, če grafa ne označimo na legendi.
+    Meje y osi izračunamo z meje_y, neskončne vrednosti in vrednosti nan pa zamenjamo z None."""
+
+    def zaokrozi(tocke):
+        # Več kot 6 mest za risanje ne potrebujemo, zapis pa je tako precej krajši
+        return [float(f"{tocka:.6g}") if math.isfinite(tocka) else None for tocka in tocke]
+
+    return {
+        "x": zaokrozi(x_tocke),
+        "serije": [{"oznaka": oznaka, "y": zaokrozi(y_tocke)} for oznaka, y_tocke in serije],
+        "meje_y": meje_y([y_tocke for __, y_tocke in serije]),
+    }
 
 
 def generiraj_funkcijo(globina):
@@ -290,3 +1186,33 @@ if __name__ == "__main__":
     zahteven_izraz = ustvari_izraz(zahteven_izraz, parser)
     narisi_graf(zahteven_izraz, [-100, 100], "zahteven_test.png")
     print("Narisan graf shranjen v zahteven_test.png")
+
+    # Preizkus porabe pomnilnika: narišemo veliko grafov in preverimo, da največja poraba ne narašča
+    import gc
+    import os
+    import resource
+    import tempfile
+
+    STEVILO_GRAFOV = 2000
+    izrazi = []
+    while len(izrazi) < 50:
+        izraz = ustvari_izraz(generiraj_funkcijo(4), parser)
+        try:
+            evaluiraj_izraz_vektorsko(izraz, list(linspace(-1, 1)))
+        except IndexError:
+            continue
+        izrazi.append(izraz)
+
+    with tempfile.TemporaryDirectory() as direktorij:
+        poraba = []
+        for i in range(STEVILO_GRAFOV):
+            narisi_graf(izrazi[i % len(izrazi)], [-1, 1], os.path.join(direktorij, "graf.png"))
+            if (i + 1) % (STEVILO_GRAFOV // 10) == 0:
+                gc.collect()
+                # Na Linuxu je ru_maxrss v KiB
+                poraba.append(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+                print(f"{i + 1} grafov: {poraba[-1] / 2**10:.1f} MiB")
+
+    # Po ogrevanju se največja poraba ne sme bistveno povečati
+    assert poraba[-1] < 1.1 * poraba[1], "Poraba pomnilnika pri risanju narašča."
+    print("Poraba pomnilnika pri risanju je omejena.")
@@ -75,13 +75,17 @@ else:
 
 # Če že obstaja naloga s to številko, jo prepišemo; sicer ustvarimo novo nalogo
 if (naloga := integrator.poisci_nalogo(zaporedna_stevilka=zaporedna_stevilka)) is not None:
-    integrator.naloge.remove(naloga)
+    integrator.odstrani_nalogo(naloga)
 
-nova_naloga = integrator.naloge.append(model.Naloga(
+nova_naloga = model.Naloga(
     ime_templata,
     odvedena_funkcija,
     str(zaporedna_stevilka),
     tocke_za_preverjanje
-))
+)
+
+# Vrednosti podane funkcije izračunamo vnaprej, da se shranijo skupaj z nalogo
+nova_naloga.izracunaj_vrednosti()
+integrator.dodaj_nalogo(nova_naloga)
 
 integrator.shrani_v_datoteko(DATOTEKA)
\ No newline at end of file
@@ -1,14 +1,23 @@
+import bisect
 import math
 import random
 import string
+import sys
+import threading
+import weakref
+from array import array
 from random import choice as random_choice
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from hashlib import sha256
 import secrets
 
+import numpy as np
+
 import funkcije
-from pomozne_funkcije import linspace
+import razclenjevalnik
+from ocenjevanje import PrekoracenaOmejitev
+from pomozne_funkcije import linspace, LRUPredpomnilnik
 
 
 def predelaj_niz_za_latex(niz):
@@ -93,12 +102,39 @@ def predelaj_niz_za_latex(niz):
     return rezultat
 
 
+# Čase oddaj hranimo kot celo število mikrosekund od začetka leta 1970 (brez časovnega pasu)
+EPOHA = datetime(1970, 1, 1)
+MIKROSEKUNDA = timedelta(microseconds=1)
+
+
+def cas_v_stevilo(cas: datetime):
+    return (cas - EPOHA) // MIKROSEKUNDA
+
+
+def stevilo_v_cas(stevilo: int):
+    return EPOHA + stevilo * MIKROSEKUNDA
+
+
+# Območja funkcij so večinoma enaka (vse oddaje za nalogo imajo njeno območje), zato si enaka območja delijo
+# isti seznam. Ključ je repr, da se npr. [-1, 1] in [-1.0, 1.0] ne zamenjata.
+_obmocja = {}
+
+
+def interniraj_obmocje(obmocje: list):
+    """Vrni seznam, enak obmocje, ki si ga delijo vse funkcije z enakim območjem. Seznama se ne sme spreminjati."""
+    return _obmocja.setdefault(repr(obmocje), obmocje)
+
+
 class ShranljivObjekt:
     """Osnovni razred za vse razrede, ki se lahko shranijo v datoteko."""
 
+    __slots__ = ("_id", "__weakref__")
+
     # shranjuje "pare"  _id : objekt, da lahko hitro najdemo že ustvarjene objekte
-    # in hitro preverimo, če je nek id že zaseden
-    ustvarjeni_objekti = {}
+    # in hitro preverimo, če je nek id že zaseden. Vsak razred ima svoj register (glej __init_subclass__).
+    # Register hrani šibke reference, zato objekte, ki jih nihče več ne uporablja (npr. funkcije zavrnjenih
+    # oddaj), Python lahko sprosti
+    ustvarjeni_objekti = weakref.WeakValueDictionary()
 
     # znaki, ki jih dovoljujemo v idjih
     ZNAKI_ZA_ID = string.ascii_letters + string.digits
@@ -115,6 +151,10 @@ class ShranljivObjekt:
 
         self.ustvarjeni_objekti[self._id] = self
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.ustvarjeni_objekti = weakref.WeakValueDictionary()
+
     @classmethod
     def generiraj_id(cls):
         """Ustvari nov id - niz dolžine 16, ki pripada vsakemu shranljivemu objektu.
@@ -126,7 +166,9 @@ class ShranljivObjekt:
 
     @classmethod
     def pridobi_nov_id(cls):
-        """Pridobi nov unikaten id."""
+        """Pridobi nov id, ki ga nima noben obstoječ objekt tega razreda.
+        Idji sproščenih ali še ne ustvarjenih objektov (glej Integrator(leno=True)) niso preverjeni, a je pri
+        62^16 možnih idjih ponovitev praktično nemogoča."""
         while (nov_id := cls.generiraj_id()) in cls.ustvarjeni_objekti:
             pass
         return nov_id
@@ -141,16 +183,28 @@ class ShranljivObjekt:
             json.dump(self.shrani_v_slovar(), f)
 
     @classmethod
-    def ustvari_iz_datoteke(cls, ime_datoteke: str):
+    def ustvari_iz_datoteke(cls, ime_datoteke: str, **argumenti):
         with open(ime_datoteke) as f:
-            return cls(slovar=json.load(f))
+            return cls(slovar=json.load(f), **argumenti)
 
 
 class Funkcija(ShranljivObjekt):
 
+    # Funkcij je veliko (vsaka oddaja ima svojo), zato nimajo slovarja atributov
+    __slots__ = ("niz", "obmocje", "_izraz", "_prevedena", "_preveden_odvod")
+
+    # Razčlenjevalnik nizov: "pratt" (hitrejši, glej razclenjevalnik.py) ali "pyparsing".
+    # Oba vračata enake izraze.
+    RAZCLENJEVALNIK = "pratt"
+
     # Parser za spremembo niza v 'pravo' funkcijo potrebujemo konstruirati le enkrat
     _parser = None
 
+    # Skupen predpomnilnik izrazov za vse funkcije; ključ je niz funkcije.
+    # Izrazi so v predpomnilniku deljeni med funkcijami, zato se jih ne sme spreminjati
+    VELIKOST_PREDPOMNILNIKA_IZRAZOV = 10000
+    predpomnilnik_izrazov = LRUPredpomnilnik(VELIKOST_PREDPOMNILNIKA_IZRAZOV)
+
     def __init__(self, niz=None, obmocje=None, slovar=None):
         super(Funkcija, self).__init__(slovar=slovar)
         if slovar is not None:
@@ -162,11 +216,16 @@ class Funkcija(ShranljivObjekt):
         if any(var is None for var in [niz, obmocje]):
             raise ValueError("Niz ni bil podan.")
 
-        self.niz = niz
-        self.obmocje = obmocje
+        # Enaki nizi se pogosto ponavljajo (npr. "x^2"), zato jih interniramo
+        self.niz = sys.intern(niz)
+        self.obmocje = interniraj_obmocje(obmocje)
 
         # Izraz, ki ga lahko evaluiramo
         self._izraz = None
+        # Izraz, preveden v funkcijo za evaluacijo v več točkah naenkrat
+        self._prevedena = None
+        # Funkcija za izračun odvoda (glej funkcije.prevedi_odvod)
+        self._preveden_odvod = None
 
     def shrani_v_slovar(self):
         slovar = super(Funkcija, self).shrani_v_slovar()
@@ -204,23 +263,93 @@ class Funkcija(ShranljivObjekt):
     def izraz(self):
         """Pridobi izraz, ki pripada funkciji"""
         if self._izraz is None:
-            self._izraz = funkcije.ustvari_izraz(self.niz, self._pridobi_parser())
+            self._izraz = self.pridobi_izraz(self.niz)
         return self._izraz
 
+    @classmethod
+    def pridobi_izraz(cls, niz):
+        """Pridobi izraz za dani niz; če ga ni v predpomnilniku, ga razčleni, poenostavi in shrani."""
+        izraz = cls.predpomnilnik_izrazov.pridobi(niz)
+        if izraz is None:
+            if cls.RAZCLENJEVALNIK == "pyparsing":
+                izraz = funkcije.ustvari_izraz(niz, cls._pridobi_parser())
+            else:
+                izraz = razclenjevalnik.razcleni(niz)
+            # Poenostavljen izraz ima enake vrednosti, a manj vozlišč za izračun
+            izraz = funkcije.kanonicna_oblika(izraz)
+            cls.predpomnilnik_izrazov.shrani(niz, izraz)
+        return izraz
+
+    @classmethod
+    def ogrej_predpomnilnik(cls, nizi):
+        """Vnaprej razčleni vse podane nize in jih shrani v predpomnilnik izrazov.
+        Nizov, ki jih ni mogoče razčleniti, ne shrani."""
+        for niz in nizi:
+            if niz in cls.predpomnilnik_izrazov:
+                continue
+            try:
+                cls.pridobi_izraz(niz)
+            except Exception:
+                pass
+
+    def kanonicni_kljuc(self):
+        """Vrni niz, ki je enak za vse funkcije z enako kanonično obliko izraza (glej funkcije.kanonicna_oblika).
+        Takšne funkcije imajo v vseh točkah enake vrednosti. Izraz je že v kanonični obliki (glej pridobi_izraz)."""
+        return repr(self.izraz)
+
+    def prevedi(self):
+        """Pridobi izraz, preveden v funkcijo, ki ga evaluira v vseh točkah naenkrat (glej funkcije.prevedi_izraz).
+        Prevede se le ob prvem klicu."""
+        if self._prevedena is None:
+            self._prevedena = funkcije.prevedi_izraz(self.izraz)
+        return self._prevedena
+
+    def prevedi_odvod(self):
+        """Pridobi funkcijo, ki izračuna odvod v vseh točkah naenkrat (glej funkcije.prevedi_odvod).
+        Izraz za odvod se sestavi in prevede le ob prvem klicu."""
+        if self._preveden_odvod is None:
+            self._preveden_odvod = funkcije.prevedi_odvod(self.izraz, self.prevedi())
+        return self._preveden_odvod
+
     def narisi_graf(self, ime_datoteke):
         """Nariši graf funkcije na podanem območju in ga shrani v datoteko"""
         funkcije.narisi_graf(self.izraz, self.obmocje, ime_datoteke)
 
-    def izracunaj_odvod(self, tocka):
-        """Izračunaj približek odvoda v točki."""
-        return funkcije.izracunaj_odvod(self.izraz, tocka)
+    def podatki_grafa(self):
+        """Vrni točke grafa funkcije na podanem območju za risanje v brskalniku (glej funkcije.podatki_grafa)."""
+        xs, ys = funkcije.tocke_grafa(self.izraz, self.obmocje)
+        return funkcije.podatki_grafa(xs, [(None, ys)])
+
+    def evaluiraj_vektorsko(self, xs):
+        """Evaluiraj funkcijo v vseh točkah xs naenkrat; vrne numpy tabelo."""
+        return self.prevedi()(xs)
 
-    def evaluiraj(self, x):
-        """Evaluiraj funkcijo v x."""
-        return funkcije.evaluiraj_izraz(self.izraz, x)
+    def izracunaj_odvod_vektorsko(self, tocke):
+        """Izračunaj odvod v vseh točkah naenkrat; vrne numpy tabelo."""
+        return self.prevedi_odvod()(tocke)
+
+    def odvoda_za_ocenjevanje(self, tocke, pricakovane, meja):
+        """Vrni približke odvoda v točkah za ocenjevanje (glej funkcije.odvoda_za_ocenjevanje)."""
+        return funkcije.odvoda_za_ocenjevanje(self.prevedi(), self.izracunaj_odvod_vektorsko, tocke, pricakovane, meja)
 
 
 class Naloga(ShranljivObjekt):
+
+    # Ocenjevanje poteka po kriteriju; ta vsebuje pare (meja, vrednost)
+    # če se prava funkcija in odvod oddane funkcije v neki
+    # točki razlikujeta za manj kot meja, potem dobi oddaja za to točko vrednost% možnih točk
+    # Meja je relativna glede na vsoto absolutnih vrednosti obeh funkcij, a nikoli manjša od absolutne
+    KRITERIJ = [
+        (1e-5, 100),
+        (1e-3, 90),
+        (1e-1, 80),
+        (1e0, 30),
+        (1e1, 10),
+        (math.inf, 0)
+    ]
+    _MEJE_KRITERIJA = np.array([meja for meja, __ in KRITERIJ])
+    _VREDNOSTI_KRITERIJA = np.array([vrednost for __, vrednost in KRITERIJ], dtype=float)
+
     def __init__(
             self,
             ime_templata=None,
@@ -247,6 +376,23 @@ class Naloga(ShranljivObjekt):
         # vseh odstotkov pripada tej točki
         self.tocke_za_preverjanje = tocke_za_preverjanje
 
+        # Vrednosti odvedene funkcije v točkah za preverjanje ter točke in vrednosti za risanje grafa;
+        # izračunajo se ob prvi uporabi in se shranijo skupaj z nalogo
+        self._vrednosti_na_tockah = None
+        self._tocke_grafa = None
+        self._vrednosti_na_grafu = None
+
+        # Shranjene vrednosti uporabimo le, če so bile izračunane za enako funkcijo in točke;
+        # če je bila naloga medtem spremenjena, jih izračunamo znova
+        if slovar is not None and "vrednosti" in slovar:
+            vrednosti = slovar["vrednosti"]
+            if vrednosti.get("podpis") == self._podpis_vrednosti():
+                if vrednosti.get("tocke") is not None:
+                    self._vrednosti_na_tockah = np.array(vrednosti["tocke"], dtype=float)
+                if vrednosti.get("graf") is not None and vrednosti.get("tocke_grafa") is not None:
+                    self._tocke_grafa = np.array(vrednosti["tocke_grafa"], dtype=float)
+                    self._vrednosti_na_grafu = np.array(vrednosti["graf"], dtype=float)
+
     def shrani_v_slovar(self):
         slovar = super(Naloga, self).shrani_v_slovar()
         slovar.update({
@@ -255,6 +401,13 @@ class Naloga(ShranljivObjekt):
             "zaporedna_stevilka": self.zaporedna_stevilka,
             "tocke_za_preverjanje": self.tocke_za_preverjanje,
         })
+        if self._vrednosti_na_tockah is not None or self._vrednosti_na_grafu is not None:
+            slovar["vrednosti"] = {
+                "podpis": self._podpis_vrednosti(),
+                "tocke": None if self._vrednosti_na_tockah is None else self._vrednosti_na_tockah.tolist(),
+                "tocke_grafa": None if self._tocke_grafa is None else self._tocke_grafa.tolist(),
+                "graf": None if self._vrednosti_na_grafu is None else self._vrednosti_na_grafu.tolist(),
+            }
         return slovar
 
     def __str__(self):
@@ -263,49 +416,98 @@ class Naloga(ShranljivObjekt):
     def __lt__(self, o):
         return int(self.zaporedna_stevilka) < int(o.zaporedna_stevilka)
 
+    def _podpis_vrednosti(self):
+        """Vrni podpis podatkov, od katerih so odvisne vrednosti funkcije na točkah in na grafu."""
+        podatki = json.dumps([
+            self.odvedena_funkcija.niz,
+            self.odvedena_funkcija.obmocje,
+            self.tocke_za_preverjanje,
+            funkcije.RAZLICICA_TOCK_GRAFA
+        ])
+        return sha256(podatki.encode('utf8')).hexdigest()
+
+    def tocke_grafa(self):
+        """Vrni numpy tabelo x koordinat točk, v katerih rišemo graf naloge (glej funkcije.prilagodljive_tocke).
+        Tako kot vrednosti na točkah za preverjanje se točke in vrednosti v njih izračunajo le enkrat."""
+        if self._tocke_grafa is None:
+            funkcija = self.odvedena_funkcija
+            xs, ys = funkcije.prilagodljive_tocke(funkcija.evaluiraj_vektorsko, funkcija.obmocje)
+            self._tocke_grafa, self._vrednosti_na_grafu = xs, ys[0]
+        return self._tocke_grafa
+
+    def vrednosti_na_grafu(self):
+        """Vrni numpy tabelo vrednosti podane funkcije v točkah tocke_grafa."""
+        self.tocke_grafa()
+        return self._vrednosti_na_grafu
+
+    def izracunaj_vrednosti(self):
+        """Vnaprej izračunaj vse vrednosti podane funkcije, ki jih potrebujemo pri ocenjevanju in risanju."""
+        self.vrednosti_na_tockah()
+        self.vrednosti_na_grafu()
+
+    def vrednosti_na_tockah(self):
+        """Vrni numpy tabelo vrednosti podane funkcije v točkah za preverjanje.
+        Funkcija in točke se ne spreminjata, zato vrednosti izračunamo le enkrat."""
+        if self._vrednosti_na_tockah is None:
+            xs = [x for x, __ in self.tocke_za_preverjanje]
+            self._vrednosti_na_tockah = self.odvedena_funkcija.evaluiraj_vektorsko(xs)
+        return self._vrednosti_na_tockah
+
+    def x_tocke_za_preverjanje(self):
+        """Vrni x koordinate točk, v katerih preverjamo odvod oddane funkcije."""
+        return [x for x, __ in self.tocke_za_preverjanje]
+
     def oceni_oddajo(self, oddana_funkcija: Funkcija):
         """Oceni oddano funkcijo in vrni številsko vrednost pridobljenih točk."""
+        return self.oceni_odvod(oddana_funkcija.odvoda_za_ocenjevanje(*self.podatki_za_ocenjevanje()))
 
-        # Ocenjevanje poteka po kriteriju; ta vsebuje pare (meja, vrednost)
-        # če se prava funkcija in odvod oddane funkcije v neki
-        # točki razlikujeta za manj kot meja, potem dobi oddaja za to točko vrednost% možnih točk
-        KRITERIJ = [
-            (1e-5, 100),
-            (1e-3, 90),
-            (1e-1, 80),
-            (1e0, 30),
-            (1e1, 10),
-            (math.inf, 0)
-        ]
+    def podatki_za_ocenjevanje(self):
+        """Vrni točke za preverjanje, pravilne vrednosti odvoda v njih in mejo relativne razlike, pod katero
+        dobi točka vse točke (glej funkcije.odvoda_za_ocenjevanje)."""
+        return self.x_tocke_za_preverjanje(), self.vrednosti_na_tockah(), self.KRITERIJ[0][0]
 
-        skupna_teza = sum(teza for __, teza in self.tocke_za_preverjanje)
-        skupne_tocke = 0
+    def oceni_odvod(self, vrednosti_odvoda):
+        """Oceni vrednosti odvoda oddane funkcije v točkah za preverjanje (glej x_tocke_za_preverjanje)
+        in vrni številsko vrednost pridobljenih točk.
+        Podamo lahko tudi več vrstic približkov odvoda (glej funkcije.odvoda_za_ocenjevanje); v vsaki točki
+        upoštevamo najbolje ocenjenega."""
 
-        for x, teza in self.tocke_za_preverjanje:
-            y1 = self.odvedena_funkcija.evaluiraj(x)
-            y2 = oddana_funkcija.izracunaj_odvod(x)
+        teze = np.array([teza for __, teza in self.tocke_za_preverjanje], dtype=float)
 
-            if y1 == y2:
-                # primer, ko sta obe števili neskončni, moramo obravnavati posebaj
-                skupne_tocke += teza
-                continue
+        # Vse točke ocenimo naenkrat
+        y1 = self.vrednosti_na_tockah()
+        y2 = np.atleast_2d(np.asarray(vrednosti_odvoda, dtype=float))
 
-            delta = float(abs(y1 - y2))
+        with np.errstate(all="ignore"):
+            delta = np.abs(y1 - y2)
+        relativna_razlika = funkcije.relativna_razlika(y1, y2)
 
-            if math.isinf(delta) or math.isnan(delta):
-                # Neskončna razlika pomeni 0 točk
-                continue
+        # Za vsako točko poiščemo prvo mejo v kriteriju, ki je večja od relativne razlike
+        indeksi = np.searchsorted(self._MEJE_KRITERIJA, relativna_razlika, side="right")
+        odstotki = self._VREDNOSTI_KRITERIJA[np.minimum(indeksi, len(self.KRITERIJ) - 1)]
+
+        # Neskončna razlika pomeni 0 točk
+        odstotki[~np.isfinite(delta)] = 0
 
-            for meja, vrednost in KRITERIJ:
-                if delta < meja * max(abs(y1) + abs(y2), 1):
-                    skupne_tocke += teza * vrednost / 100
-                    break
+        # primer, ko sta obe števili neskončni, moramo obravnavati posebaj
+        odstotki[y1 == y2] = 100
+        odstotki = odstotki.max(axis=0)
+
+        # Seštevamo po vrsti, da se vsota zaokroži enako kot pri seštevanju točko po točko
+        skupne_tocke = sum((teze * odstotki / 100).tolist())
+        skupna_teza = sum(teza for __, teza in self.tocke_za_preverjanje)
 
         return round(skupne_tocke * 100 / skupna_teza)
 
 
 class Oddaja(ShranljivObjekt):
-    def __init__(self, naloga=None, funkcija=None, cas_oddaje=None, rezultat=None, slovar=None):
+
+    __slots__ = ("naloga", "funkcija", "_cas_oddaje", "rezultat", "napaka")
+
+    def __init__(self, naloga=None, funkcija=None, cas_oddaje=None, rezultat=None, slovar=None, napaka=None):
+        """Čas oddaje je lahko datetime, niz v obliki ISO ali število mikrosekund (glej cas_v_stevilo).
+        Rezultat je None, dokler oddaja ni ocenjena (glej ocenjevanje.VrstaOcenjevanja).
+        Napaka je sporočilo o napaki pri ocenjevanju v ozadju; taka oddaja dobi 0 točk."""
         super(Oddaja, self).__init__(slovar=slovar)
 
         if slovar is not None:
@@ -313,14 +515,25 @@ class Oddaja(ShranljivObjekt):
             funkcija = slovar.get("funkcija", funkcija)
             cas_oddaje = slovar.get("cas_oddaje", cas_oddaje)
             rezultat = slovar.get("rezultat", rezultat)
+            napaka = slovar.get("napaka", napaka)
 
-        if any(var is None for var in [naloga, funkcija, cas_oddaje, rezultat]):
+        if any(var is None for var in [naloga, funkcija, cas_oddaje]):
             raise ValueError("Ni dovolj podatkov za izgradnjo Oddaje")
 
-        self.naloga = naloga  # id naloge (str)
+        if isinstance(cas_oddaje, str):
+            cas_oddaje = datetime.fromisoformat(cas_oddaje)
+        if isinstance(cas_oddaje, datetime):
+            cas_oddaje = cas_v_stevilo(cas_oddaje)
+
+        self.naloga = sys.intern(naloga)  # id naloge (str)
         self.funkcija = Funkcija.ustvari_funkcijo(funkcija)
-        self.cas_oddaje = datetime.fromisoformat(cas_oddaje) if isinstance(cas_oddaje, str) else cas_oddaje
-        self.rezultat = rezultat  # int (0-100)
+        self._cas_oddaje = cas_oddaje
+        self.rezultat = rezultat  # int (0-100) ali None
+        self.napaka = napaka
+
+    @property
+    def cas_oddaje(self):
+        return stevilo_v_cas(self._cas_oddaje)
 
     def shrani_v_slovar(self):
         slovar = super(Oddaja, self).shrani_v_slovar()
@@ -330,19 +543,210 @@ class Oddaja(ShranljivObjekt):
             "cas_oddaje": self.cas_oddaje.isoformat(),
             "rezultat": self.rezultat
         })
+        # Napake so redke, zato jo shranimo le, če obstaja
+        if self.napaka is not None:
+            slovar["napaka"] = self.napaka
         return slovar
 
     def __str__(self):
         return f"Oddaja za nalogo {self.naloga} s funkcijo {self.funkcija}"
 
 
+class _StolpecNizov:
+    """Zaporedje nizov, shranjenih zaporedoma v enem bajtnem nizu. Vsak niz porabi le svojo dolžino in 4 bajte."""
+
+    def __init__(self):
+        self._podatki = bytearray()
+        self._konci = array("I")
+
+    def __len__(self):
+        return len(self._konci)
+
+    def _zacetek(self, indeks):
+        return self._konci[indeks - 1] if indeks > 0 else 0
+
+    def __getitem__(self, indeks):
+        if indeks < 0:
+            indeks += len(self)
+        return self._podatki[self._zacetek(indeks):self._konci[indeks]].decode()
+
+    def append(self, niz: str):
+        self._podatki += niz.encode()
+        self._konci.append(len(self._podatki))
+
+
+class StolpcneOddaje:
+    """Zaporedje oddaj, shranjenih po stolpcih: čase in rezultate hranimo v tabelah, nize in območja funkcij
+    pa kot skupne (internirane) objekte. Porabi precej manj pomnilnika kot seznam oddaj.
+    Oddaja se ustvari šele ob dostopu, zato vsak dostop vrne nov objekt."""
+
+    # Rezultat neocenjene oddaje v tabeli rezultatov
+    NEOCENJENA = -1
+
+    def __init__(self):
+        self._idji = _StolpecNizov()
+        # Kazalo ID oddaje -> indeks, da iskanje oddaje ne preiskuje vseh ID-jev
+        self._indeksi = {}
+        self._naloge = []
+        self._idji_funkcij = _StolpecNizov()
+        self._nizi = []
+        self._obmocja = []
+        self._casi = array("q")
+        self._rezultati = array("h")
+        # Napake pri ocenjevanju so redke, zato jih hranimo le za oddaje, ki jih imajo (indeks -> sporočilo)
+        self._napake = {}
+
+    def __len__(self):
+        return len(self._idji)
+
+    def __getitem__(self, indeks):
+        return Oddaja(slovar={
+            "_id": self._idji[indeks],
+            "naloga": self._naloge[indeks],
+            "funkcija": {
+                "_id": self._idji_funkcij[indeks],
+                "niz": self._nizi[indeks],
+                "obmocje": self._obmocja[indeks]
+            },
+            "cas_oddaje": self._casi[indeks],
+            "rezultat": None if self._rezultati[indeks] == self.NEOCENJENA else self._rezultati[indeks],
+            "napaka": self._napake.get(indeks)
+        })
+
+    def __iter__(self):
+        for indeks in range(len(self)):
+            yield self[indeks]
+
+    def indeks(self, id_oddaje):
+        """Vrni indeks oddaje z danim ID-jem, ali None, če je ni."""
+        return self._indeksi.get(id_oddaje)
+
+    def _dodaj(self, _id, naloga, id_funkcije, niz, obmocje, cas, rezultat, napaka):
+        if napaka is not None:
+            self._napake[len(self)] = napaka
+        self._indeksi[_id] = len(self)
+        self._idji.append(_id)
+        self._naloge.append(sys.intern(naloga))
+        self._idji_funkcij.append(id_funkcije)
+        self._nizi.append(sys.intern(niz))
+        self._obmocja.append(interniraj_obmocje(obmocje))
+        self._casi.append(cas)
+        self._rezultati.append(self.NEOCENJENA if rezultat is None else rezultat)
+
+    def append(self, oddaja: Oddaja):
+        funkcija = oddaja.funkcija
+        self._dodaj(oddaja._id, oddaja.naloga, funkcija._id, funkcija.niz, funkcija.obmocje, oddaja._cas_oddaje,
+                    oddaja.rezultat, oddaja.napaka)
+
+    def dodaj_slovar(self, slovar):
+        """Dodaj oddajo, shranjeno v slovarju (glej Oddaja.shrani_v_slovar), ne da bi jo ustvarili."""
+        funkcija = slovar["funkcija"]
+        self._dodaj(slovar["_id"], slovar["naloga"], funkcija["_id"], funkcija["niz"], funkcija["obmocje"],
+                    cas_v_stevilo(datetime.fromisoformat(slovar["cas_oddaje"])), slovar["rezultat"],
+                    slovar.get("napaka"))
+
+    def nastavi_rezultat(self, indeks, rezultat, napaka=None):
+        self._rezultati[indeks] = rezultat
+        if napaka is not None:
+            self._napake[indeks] = napaka
+
+    def rezultati(self):
+        """Vrni trojke (id naloge, rezultat, čas oddaje) za vse ocenjene oddaje."""
+        return [
+            (naloga, rezultat, stevilo_v_cas(cas))
+            for naloga, rezultat, cas in zip(self._naloge, self._rezultati, self._casi)
+            if rezultat != self.NEOCENJENA
+        ]
+
+
+class PovzetekNaloge:
+    """Povzetek uporabnikovih oddaj za eno nalogo.
+    Naloga je rešena, ko katera izmed oddaj doseže vsaj MEJA_ZA_RESITEV odstotkov."""
+    MEJA_ZA_RESITEV = 80
+
+    def __init__(self, najboljsi_rezultat=None, stevilo_oddaj=0):
+        self.najboljsi_rezultat = None
+        self.stevilo_oddaj = stevilo_oddaj
+        self.resena = False
+        if najboljsi_rezultat is not None:
+            self._posodobi(najboljsi_rezultat)
+
+    def dodaj_oddajo(self, oddaja: Oddaja):
+        self.dodaj_rezultat(oddaja.rezultat)
+
+    def dodaj_rezultat(self, rezultat):
+        self._posodobi(rezultat)
+        self.stevilo_oddaj += 1
+
+    def _posodobi(self, rezultat):
+        if self.najboljsi_rezultat is None or rezultat > self.najboljsi_rezultat:
+            self.najboljsi_rezultat = rezultat
+        if rezultat >= self.MEJA_ZA_RESITEV:
+            self.resena = True
+
+
+class Lestvica:
+    """Lestvica najboljših rezultatov uporabnikov pri eni nalogi.
+    Uporabniki so razvrščeni po najboljšem rezultatu; pri enakem rezultatu je višje tisti, ki ga je dosegel prej."""
+
+    def __init__(self):
+        # uporabniško ime -> (najboljši rezultat, čas prve oddaje s tem rezultatom)
+        self._najboljse = {}
+        # Urejen seznam ključev (-rezultat, čas, uporabniško ime); vrstni red je vrstni red na lestvici
+        self._razvrstitev = []
+
+    def __len__(self):
+        return len(self._razvrstitev)
+
+    def dodaj_oddajo(self, oddaja: Oddaja, uporabnisko_ime: str):
+        """Posodobi lestvico z novo oddajo."""
+        self.dodaj_rezultat(oddaja.rezultat, oddaja.cas_oddaje, uporabnisko_ime)
+
+    def dodaj_rezultat(self, rezultat, cas_oddaje: datetime, uporabnisko_ime: str):
+        """Posodobi lestvico z rezultatom oddaje, oddane ob cas_oddaje."""
+        nov_kljuc = (-rezultat, cas_oddaje, uporabnisko_ime)
+
+        prejsnja = self._najboljse.get(uporabnisko_ime, None)
+        if prejsnja is not None:
+            star_kljuc = (-prejsnja[0], prejsnja[1], uporabnisko_ime)
+            # Slabši rezultat ali enak rezultat, dosežen kasneje, lestvice ne spremeni
+            if nov_kljuc >= star_kljuc:
+                return
+            del self._razvrstitev[bisect.bisect_left(self._razvrstitev, star_kljuc)]
+
+        self._najboljse[uporabnisko_ime] = (rezultat, cas_oddaje)
+        bisect.insort(self._razvrstitev, nov_kljuc)
+
+    def vrstice(self, zacetek=0, stevilo=None):
+        """Vrni vrstice (mesto, uporabniško ime, rezultat, čas oddaje) lestvice, začenši z mestom zacetek + 1."""
+        konec = len(self._razvrstitev) if stevilo is None else zacetek + stevilo
+        return [
+            (zacetek + i + 1, uporabnisko_ime, -negativni_rezultat, cas)
+            for i, (negativni_rezultat, cas, uporabnisko_ime) in enumerate(self._razvrstitev[zacetek:konec])
+        ]
+
+    def mesto(self, uporabnisko_ime: str):
+        """Vrni mesto uporabnika na lestvici (prvo mesto je 1), ali None, če ga na lestvici ni."""
+        najboljsa = self._najboljse.get(uporabnisko_ime, None)
+        if najboljsa is None:
+            return None
+        return bisect.bisect_left(self._razvrstitev, (-najboljsa[0], najboljsa[1], uporabnisko_ime)) + 1
+
+
 class Uporabnik(ShranljivObjekt):
-    def __init__(self, oddaje=None, uporabnisko_ime=None, sol=None, razprsitev=None, slovar=None):
+    def __init__(self, oddaje=None, uporabnisko_ime=None, sol=None, razprsitev=None, slovar=None, leno=False,
+                 stolpcno=False):
+        """Če je leno True, se oddaje iz slovarja ustvarijo šele ob prvi uporabi.
+        Če je stolpcno True, so oddaje shranjene v StolpcneOddaje namesto v seznamu."""
         super(Uporabnik, self).__init__(slovar=slovar)
 
+        # Slovarji oddaj, ki še niso bile dodane, ali None, če so vse oddaje že dodane
+        self._surove_oddaje = None
+
         if slovar is not None:
             if "oddaje" in slovar:
-                oddaje = [Oddaja(slovar=oddaja) for oddaja in slovar["oddaje"]]
+                self._surove_oddaje = slovar["oddaje"]
+                oddaje = []
             uporabnisko_ime = slovar.get("uporabnisko_ime", uporabnisko_ime)
             sol = slovar.get("sol", sol)
             razprsitev = slovar.get("razprsitev", razprsitev)
@@ -350,15 +754,74 @@ class Uporabnik(ShranljivObjekt):
         if any(var is None for var in [oddaje, uporabnisko_ime, sol, razprsitev]):
             raise ValueError("Ni dovolj podatkov za izgradnjo Uporabnika")
 
-        self.oddaje = oddaje
+        self.stolpcno = stolpcno
+        self._oddaje = StolpcneOddaje() if stolpcno else []
         self.uporabnisko_ime = uporabnisko_ime
         self.sol = sol   # 16 bajtov, shranjenih v hex
         self.razprsitev = razprsitev   # sha-256 hash, shranjen v hex, od geslo+sol
 
+        # Kazala za hitro iskanje oddaj in povzetki oddaj po nalogah; posodabljamo jih ob vsaki novi oddaji.
+        # Kazala hranijo indekse oddaj v self._oddaje. Stolpčno shranjene oddaje imajo kazalo po ID-ju že same
+        # (glej StolpcneOddaje.indeks)
+        self._oddaje_po_id = None if stolpcno else {}
+        self._oddaje_po_nalogi = {}   # id naloge -> tabela indeksov, od najstarejše do najnovejše oddaje
+        self._povzetki = {}   # id naloge -> PovzetekNaloge
+        # Število nalog, ki jih je uporabnik rešil po vrsti od prve naprej (glej
+        # Integrator.stevilo_zaporedno_resenih_nalog)
+        self._zaporedno_resene = 0
+        for oddaja in oddaje:
+            self._dodaj_oddajo(oddaja)
+        if not leno:
+            self._ustvari_oddaje()
+
+    @property
+    def oddaje(self):
+        """Seznam vseh uporabnikovih oddaj, od najstarejše do najnovejše."""
+        self._ustvari_oddaje()
+        return self._oddaje
+
+    def _ustvari_oddaje(self):
+        """Dodaj oddaje, ki so bile prebrane le kot slovarji."""
+        if self._surove_oddaje is None:
+            return
+        surove_oddaje, self._surove_oddaje = self._surove_oddaje, None
+        for slovar in surove_oddaje:
+            if self.stolpcno:
+                self._oddaje.dodaj_slovar(slovar)
+                self._dodaj_v_kazala(len(self._oddaje) - 1, slovar["_id"], slovar["naloga"], slovar["rezultat"])
+            else:
+                self._dodaj_oddajo(Oddaja(slovar=slovar))
+
+    def rezultati(self):
+        """Vrni trojke (id naloge, rezultat, čas oddaje) za vse ocenjene oddaje, ne da bi ustvarili oddaje."""
+        if self._surove_oddaje is not None:
+            return [
+                (oddaja["naloga"], oddaja["rezultat"], datetime.fromisoformat(oddaja["cas_oddaje"]))
+                for oddaja in self._surove_oddaje
+                if oddaja["rezultat"] is not None
+            ]
+        if self.stolpcno:
+            return self._oddaje.rezultati()
+        return [
+            (oddaja.naloga, oddaja.rezultat, oddaja.cas_oddaje)
+            for oddaja in self._oddaje
+            if oddaja.rezultat is not None
+        ]
+
+    def neocenjene_oddaje(self):
+        """Vrni seznam oddaj, ki še niso ocenjene."""
+        if self._surove_oddaje is not None and all(oddaja["rezultat"] is not None for oddaja in self._surove_oddaje):
+            return []
+        return [oddaja for oddaja in self.oddaje if oddaja.rezultat is None]
+
     def shrani_v_slovar(self):
         slovar = super(Uporabnik, self).shrani_v_slovar()
+        if self._surove_oddaje is not None:
+            oddaje = self._surove_oddaje
+        else:
+            oddaje = [oddaja.shrani_v_slovar() for oddaja in self._oddaje]
         slovar.update({
-            "oddaje": [oddaja.shrani_v_slovar() for oddaja in self.oddaje],
+            "oddaje": oddaje,
             "uporabnisko_ime": self.uporabnisko_ime,
             "sol": self.sol,
             "razprsitev": self.razprsitev
@@ -376,13 +839,14 @@ class Uporabnik(ShranljivObjekt):
         return sha256((geslo+sol).encode('utf8')).hexdigest()
 
     @classmethod
-    def ustvari_uporabnika(cls, uporabnisko_ime, geslo):
+    def ustvari_uporabnika(cls, uporabnisko_ime, geslo, stolpcno=False):
         sol = cls.pridobi_sol()
         return Uporabnik(
             oddaje=[],
             uporabnisko_ime=uporabnisko_ime,
             sol=sol,
-            razprsitev=Uporabnik.razprsi(geslo, sol)
+            razprsitev=Uporabnik.razprsi(geslo, sol),
+            stolpcno=stolpcno
         )
 
     def __str__(self):
@@ -396,42 +860,123 @@ class Uporabnik(ShranljivObjekt):
         """Nastavi geslo na novo vrednost"""
         self.razprsitev = Uporabnik.razprsi(novo_geslo, self.sol)
 
+    def _dodaj_v_kazala(self, indeks, id_oddaje, id_naloge, rezultat):
+        if self._oddaje_po_id is not None:
+            self._oddaje_po_id[id_oddaje] = indeks
+        self._oddaje_po_nalogi.setdefault(id_naloge, array("I")).append(indeks)
+        if rezultat is not None:
+            self._povzetki.setdefault(id_naloge, PovzetekNaloge()).dodaj_rezultat(rezultat)
+
+    def _dodaj_oddajo(self, oddaja: Oddaja):
+        self._oddaje.append(oddaja)
+        self._dodaj_v_kazala(len(self._oddaje) - 1, oddaja._id, oddaja.naloga, oddaja.rezultat)
+
     def ustvari_oddajo(self, id_naloge, oddana_funkcija, cas_oddaje, rezultat):
         """Ustvari novo oddajo in jo dodaj v svoj seznam. Vrni novo oddajo."""
-        self.oddaje.append(Oddaja(
+        oddaja = Oddaja(
             id_naloge,
             oddana_funkcija,
             cas_oddaje,
             rezultat
-        ))
-        return self.oddaje[-1]
+        )
+        self.dodaj_oddajo(oddaja)
+        return oddaja
+
+    def dodaj_oddajo(self, oddaja: Oddaja):
+        """Dodaj obstoječo oddajo."""
+        self._ustvari_oddaje()
+        self._dodaj_oddajo(oddaja)
+
+    def _indeks_oddaje(self, _id):
+        self._ustvari_oddaje()
+        if self._oddaje_po_id is None:
+            return self._oddaje.indeks(_id)
+        return self._oddaje_po_id.get(_id, None)
 
     def poisci_oddajo(self, _id):
         """Poišči oddajo ali vrni None, če ne obstaja"""
-        objekt = Oddaja.ustvarjeni_objekti.get(_id, None)
-        if isinstance(objekt, Oddaja) and objekt in self.oddaje:
-            return objekt
-        return None
+        indeks = self._indeks_oddaje(_id)
+        if indeks is None:
+            return None
+        return self._oddaje[indeks]
+
+    def nastavi_rezultat(self, id_oddaje, rezultat, napaka=None):
+        """Nastavi rezultat (in morebitno napako pri ocenjevanju) neocenjene oddaje in ga upoštevaj v povzetku
+        naloge. Vrni oddajo."""
+        indeks = self._indeks_oddaje(id_oddaje)
+        if self.stolpcno:
+            self._oddaje.nastavi_rezultat(indeks, rezultat, napaka)
+        else:
+            self._oddaje[indeks].rezultat = rezultat
+            self._oddaje[indeks].napaka = napaka
+        oddaja = self._oddaje[indeks]
+        self._povzetki.setdefault(oddaja.naloga, PovzetekNaloge()).dodaj_rezultat(rezultat)
+        return oddaja
 
-    def je_resil_nalogo(self, naloga: str, meja: int):
-        """Vrne True, če je vsaj ena uporabnikova oddaja pri nalogi dobila višji rezultat od meje."""
-        return any(oddaja.naloga == naloga and oddaja.rezultat >= meja for oddaja in self.oddaje)
+    def oddaje_za_nalogo(self, id_naloge):
+        """Vrni seznam uporabnikovih oddaj za nalogo, od najstarejše do najnovejše."""
+        self._ustvari_oddaje()
+        return [self._oddaje[indeks] for indeks in self._oddaje_po_nalogi.get(id_naloge, [])]
+
+    def povzetek_naloge(self, id_naloge):
+        """Vrni povzetek uporabnikovih oddaj za nalogo, ali None, če naloge še ni poskusil rešiti."""
+        self._ustvari_oddaje()
+        return self._povzetki.get(id_naloge, None)
+
+    def je_resil_nalogo(self, naloga: str):
+        """Vrne True, če je uporabnik nalogo rešil (glej PovzetekNaloge)."""
+        povzetek = self.povzetek_naloge(naloga)
+        return povzetek is not None and povzetek.resena
 
 
 class Integrator(ShranljivObjekt):
-    def __init__(self, naloge=None, uporabniki=None, slovar=None):
+
+    # Največje število ocen, ki si jih zapomnimo
+    VELIKOST_PREDPOMNILNIKA_OCEN = 10000
+
+    def __init__(self, naloge=None, uporabniki=None, slovar=None, leno=False, stolpcno=False):
+        """Če je leno True, se oddaje uporabnikov ustvarijo šele, ko jih kdo potrebuje, kazala oddaj pa se
+        zgradijo ob prvi uporabi. Tako je zagon hiter tudi pri veliki bazi.
+        Če je stolpcno True, uporabniki oddaje hranijo v StolpcneOddaje (glej Uporabnik)."""
         super(Integrator, self).__init__(slovar=slovar)
         if slovar is not None:
             if "naloge" in slovar:
                 naloge = [Naloga(slovar=naloga) for naloga in slovar["naloge"]]
             if "uporabniki" in slovar:
-                uporabniki = [Uporabnik(slovar=uporabnik) for uporabnik in slovar["uporabniki"]]
+                uporabniki = [
+                    Uporabnik(slovar=uporabnik, leno=leno, stolpcno=stolpcno) for uporabnik in slovar["uporabniki"]
+                ]
 
         if any(var is None for var in [naloge, uporabniki]):
             raise ValueError("Ni dovolj podatkov za izgradnjo Integratorja")
 
         self.naloge = naloge
         self.uporabniki = uporabniki
+        self.stolpcno = stolpcno
+
+        # Kazala za hitro iskanje; posodabljamo jih ob vsaki spremembi, zato naloge, uporabnike in oddaje
+        # dodajamo le z metodami Integratorja
+        self._uporabniki_po_imenu = {uporabnik.uporabnisko_ime: uporabnik for uporabnik in self.uporabniki}
+        self._naloge_po_stevilki = {}
+        for naloga in self.naloge:
+            self._naloge_po_stevilki.setdefault(naloga.zaporedna_stevilka, naloga)
+        self._naloge_po_id = {naloga._id: naloga for naloga in self.naloge}
+        self._lestvice = None   # id naloge -> Lestvica; None, dokler je ne zgradimo
+        if not leno:
+            self._zgradi_lestvice()
+
+        # Mnogo oddaj za isto nalogo je enakih ali trivialno enakovrednih; njihove ocene si zapomnimo
+        # Ključ je par (id naloge, kanonični ključ funkcije)
+        self.predpomnilnik_ocen = LRUPredpomnilnik(self.VELIKOST_PREDPOMNILNIKA_OCEN)
+        # Ocenjevalec, ki oddaje oceni v ločenih procesih (glej ocenjevanje.py); None, če jih ocenimo kar tu
+        self.ocenjevalec = None
+        # Vrsta, v kateri se oddaje ocenijo v ozadju (glej ocenjevanje.py); None, če jih ocenimo ob oddaji
+        self.vrsta_ocenjevanja = None
+        # Oddaje lahko dodajamo in ocenjujemo v več nitih hkrati, spremembe pa morajo biti v dnevniku v pravem vrstnem redu
+        self._kljucavnica = threading.RLock()
+
+        # Dnevnik, v katerega zapisujemo spremembe (glej dnevnik.py); None, če sprememb ne beležimo
+        self.dnevnik = None
 
     def shrani_v_slovar(self):
         slovar = super(Integrator, self).shrani_v_slovar()
@@ -441,138 +986,329 @@ class Integrator(ShranljivObjekt):
         })
         return slovar
 
+    def nizi_funkcij(self):
+        """Vrni vse nize funkcij v nalogah in oddajah, od najstarejših do najnovejših oddaj."""
+        for naloga in self.naloge:
+            yield naloga.odvedena_funkcija.niz
+        for oddaja in sorted((oddaja for up in self.uporabniki for oddaja in up.oddaje), key=lambda o: o.cas_oddaje):
+            yield oddaja.funkcija.niz
+
+    def ogrej_predpomnilnik_izrazov(self):
+        """Razčleni vse funkcije v bazi in jih shrani v skupni predpomnilnik izrazov."""
+        Funkcija.ogrej_predpomnilnik(self.nizi_funkcij())
+
     def poisci_uporabnika(self, uporabnisko_ime: str):
         """Poišči in vrni uporabnika z podanim imenom. Če tak uporabnik ne obstaja, vrni None"""
-        for up in self.uporabniki:
-            if up.uporabnisko_ime == uporabnisko_ime:
-                return up
-        return None
+        return self._uporabniki_po_imenu.get(uporabnisko_ime, None)
+
+    def _zabelezi(self, zapis):
+        """Zapiši spremembo v dnevnik, če ga imamo."""
+        if self.dnevnik is not None:
+            self.dnevnik.zapisi(zapis)
+
+    def dodaj_uporabnika(self, uporabnik: Uporabnik):
+        """Dodaj obstoječega uporabnika."""
+        self.uporabniki.append(uporabnik)
+        self._uporabniki_po_imenu[uporabnik.uporabnisko_ime] = uporabnik
+        for oddaja in uporabnik.oddaje:
+            self._dodaj_oddajo_v_kazala(oddaja, uporabnik)
+        self._zabelezi({"vrsta": "uporabnik", "uporabnik": uporabnik.shrani_v_slovar()})
+
+    def _dodaj_oddajo_v_kazala(self, oddaja: Oddaja, uporabnik: Uporabnik):
+        if self._lestvice is not None and oddaja.rezultat is not None:
+            self._lestvice.setdefault(oddaja.naloga, Lestvica()).dodaj_oddajo(oddaja, uporabnik.uporabnisko_ime)
+
+    def _zgradi_lestvice(self):
+        """Zgradi lestvice vseh nalog. Potrebujemo le rezultate oddaj, zato oddaj ne ustvarjamo."""
+        self._lestvice = {}
+        for uporabnik in self.uporabniki:
+            for id_naloge, rezultat, cas_oddaje in uporabnik.rezultati():
+                self._lestvice.setdefault(id_naloge, Lestvica()).dodaj_rezultat(
+                    rezultat, cas_oddaje, uporabnik.uporabnisko_ime
+                )
 
     def ustvari_uporabnika(self, uporabnisko_ime, geslo):
         """Ustvari novega uporabnika."""
-        self.uporabniki.append(Uporabnik.ustvari_uporabnika(uporabnisko_ime, geslo))
+        self.dodaj_uporabnika(Uporabnik.ustvari_uporabnika(uporabnisko_ime, geslo, self.stolpcno))
+
+    def nastavi_geslo(self, uporabnik: Uporabnik, novo_geslo: str):
+        """Nastavi uporabnikovo geslo na novo vrednost."""
+        uporabnik.nastavi_geslo(novo_geslo)
+        self._zabelezi({
+            "vrsta": "geslo",
+            "uporabnisko_ime": uporabnik.uporabnisko_ime,
+            "razprsitev": uporabnik.razprsitev
+        })
 
     def poisci_funkcijo(self, id_funkcije):
         """Poišči in vrni funkcijo z danim ID-jem. Če ne obstaja, vrni None."""
-
-        objekt = Funkcija.ustvarjeni_objekti.get(id_funkcije, None)
-
-        if isinstance(objekt, Funkcija):
-            return objekt
-
-        return None
+        return Funkcija.ustvarjeni_objekti.get(id_funkcije, None)
 
     def poisci_nalogo(self, zaporedna_stevilka=None, _id=None):
         """Vrni nalogo z dano zaporedno številko oz. ID-jem, ali None, če taka naloga ne obstaja."""
         if zaporedna_stevilka is not None:
-            zaporedna_stevilka = str(zaporedna_stevilka)
-            for naloga in self.naloge:
-                if naloga.zaporedna_stevilka == zaporedna_stevilka:
-                    return naloga
-            return None
+            return self._naloge_po_stevilki.get(str(zaporedna_stevilka), None)
 
         if _id is not None:
-            objekt = Naloga.ustvarjeni_objekti.get(_id, None)
-            if isinstance(objekt, Naloga):
-                return objekt
-            return None
+            return self._naloge_po_id.get(_id, None)
 
         return None
 
+    def dodaj_nalogo(self, naloga: Naloga):
+        """Dodaj nalogo."""
+        self.naloge.append(naloga)
+        self._naloge_po_stevilki.setdefault(naloga.zaporedna_stevilka, naloga)
+        self._naloge_po_id[naloga._id] = naloga
+        self._zabelezi({"vrsta": "naloga", "naloga": naloga.shrani_v_slovar()})
+
+    def odstrani_nalogo(self, naloga: Naloga):
+        """Odstrani nalogo. Oddaje zanjo ostanejo shranjene pri uporabnikih."""
+        self.naloge.remove(naloga)
+        if self._naloge_po_stevilki.get(naloga.zaporedna_stevilka) is naloga:
+            del self._naloge_po_stevilki[naloga.zaporedna_stevilka]
+        self._naloge_po_id.pop(naloga._id, None)
+
+        # Zaporedje nalog se je spremenilo
+        for uporabnik in self.uporabniki:
+            uporabnik._zaporedno_resene = 0
+
+    def stevilo_zaporedno_resenih_nalog(self, uporabnik: Uporabnik):
+        """Vrni, koliko nalog je uporabnik rešil po vrsti, začenši s prvo.
+        Rešena naloga ostane rešena, zato si število zapomnimo in ga le povečujemo."""
+        stevilo = uporabnik._zaporedno_resene
+        while (naloga := self.poisci_nalogo(stevilo + 1)) is not None and uporabnik.je_resil_nalogo(naloga._id):
+            stevilo += 1
+        uporabnik._zaporedno_resene = stevilo
+        return stevilo
+
     def dodaj_oddajo(self, stevilka_naloge: int, uporabnik: Uporabnik, funkcijski_niz: str):
         """Doda in oceni novo oddajo, vrne novo oddajo.
-        Vrne None, če je prišlo do težave (ni naloge, ...)"""
+        Vrne None, če je prišlo do težave (ni naloge, ...); če oddaja presega omejitve ocenjevalca,
+        sproži PrekoracenaOmejitev.
+        Če imamo vrsto za ocenjevanje in ocene ni v predpomnilniku, oddajo dodamo neocenjeno (z rezultatom None)
+        in jo postavimo v vrsto, ki jo oceni v ozadju."""
         stevilka_naloge = str(stevilka_naloge)
         naloga = self.poisci_nalogo(stevilka_naloge)
         if naloga is None:
             return None
 
         try:
-            funkcija = Funkcija(funkcijski_niz, naloga.odvedena_funkcija.obmocje)
-            tocke = naloga.oceni_oddajo(funkcija)
+            funkcija, tocke = oceni_niz(naloga, funkcijski_niz, self.predpomnilnik_ocen, self.ocenjevalec,
+                                        v_ozadju=self.vrsta_ocenjevanja is not None)
+        except PrekoracenaOmejitev:
+            raise
         except Exception:
             return None
 
-        oddaja = uporabnik.ustvari_oddajo(naloga._id, funkcija, datetime.now(), tocke)
+        with self._kljucavnica:
+            oddaja = uporabnik.ustvari_oddajo(naloga._id, funkcija, datetime.now(), tocke)
+            self._dodaj_oddajo_v_kazala(oddaja, uporabnik)
+            self._zabelezi({
+                "vrsta": "oddaja",
+                "uporabnisko_ime": uporabnik.uporabnisko_ime,
+                "oddaja": oddaja.shrani_v_slovar()
+            })
+        if tocke is None:
+            self.vrsta_ocenjevanja.dodaj(uporabnik, oddaja)
         return oddaja
 
-    def poisci_oddaje_za_nalogo(self, id_naloge):
-        """Poišči vse oddaje, ki pripadajo nalogi. Vrača pare (oddaja, uporabnik)"""
-        for uporabnik in self.uporabniki:
-            for oddaja in uporabnik.oddaje:
-                if oddaja.naloga == id_naloge:
-                    yield oddaja, uporabnik
+    def nastavi_rezultat(self, uporabnik: Uporabnik, oddaja: Oddaja, rezultat: int, napaka=None):
+        """Nastavi rezultat neocenjene oddaje in morebitno sporočilo o napaki pri ocenjevanju."""
+        with self._kljucavnica:
+            oddaja.rezultat = rezultat
+            oddaja.napaka = napaka
+            oddaja = uporabnik.nastavi_rezultat(oddaja._id, rezultat, napaka)
+            if self._lestvice is not None:
+                self._lestvice.setdefault(oddaja.naloga, Lestvica()).dodaj_oddajo(oddaja, uporabnik.uporabnisko_ime)
+            zapis = {
+                "vrsta": "rezultat",
+                "uporabnisko_ime": uporabnik.uporabnisko_ime,
+                "id_oddaje": oddaja._id,
+                "rezultat": rezultat
+            }
+            if napaka is not None:
+                zapis["napaka"] = napaka
+            self._zabelezi(zapis)
+
+    def oceni_neocenjeno_oddajo(self, uporabnik: Uporabnik, oddaja: Oddaja):
+        """Oceni oddajo, ki je bila dodana neocenjena, in nastavi njen rezultat ter morebitno napako
+        (glej oceni_neocenjeno)."""
+        tocke, napaka = oceni_neocenjeno(
+            self.poisci_nalogo(_id=oddaja.naloga), oddaja, self.predpomnilnik_ocen, self.ocenjevalec
+        )
+        self.nastavi_rezultat(uporabnik, oddaja, tocke, napaka)
+
+    def neocenjene_oddaje(self):
+        """Vrni pare (uporabnik, oddaja) za vse oddaje, ki še niso ocenjene."""
+        return [(uporabnik, oddaja) for uporabnik in self.uporabniki for oddaja in uporabnik.neocenjene_oddaje()]
+
+    def uporabi_zapis(self, zapis):
+        """Ponovi spremembo, zapisano v dnevniku. Spremembe, ki so že upoštevane, preskoči,
+        zato lahko dnevnik varno ponovimo tudi na posnetku, ki že vsebuje del zapisov."""
+        vrsta = zapis["vrsta"]
+        if vrsta == "uporabnik":
+            if self.poisci_uporabnika(zapis["uporabnik"]["uporabnisko_ime"]) is None:
+                self.dodaj_uporabnika(Uporabnik(slovar=zapis["uporabnik"], stolpcno=self.stolpcno))
+        elif vrsta == "naloga":
+            if self.poisci_nalogo(_id=zapis["naloga"]["_id"]) is None:
+                self.dodaj_nalogo(Naloga(slovar=zapis["naloga"]))
+        elif vrsta == "oddaja":
+            uporabnik = self.poisci_uporabnika(zapis["uporabnisko_ime"])
+            if uporabnik.poisci_oddajo(zapis["oddaja"]["_id"]) is None:
+                oddaja = Oddaja(slovar=zapis["oddaja"])
+                uporabnik.dodaj_oddajo(oddaja)
+                self._dodaj_oddajo_v_kazala(oddaja, uporabnik)
+        elif vrsta == "rezultat":
+            uporabnik = self.poisci_uporabnika(zapis["uporabnisko_ime"])
+            oddaja = uporabnik.poisci_oddajo(zapis["id_oddaje"])
+            if oddaja.rezultat is None:
+                self.nastavi_rezultat(uporabnik, oddaja, zapis["rezultat"], zapis.get("napaka"))
+        elif vrsta == "geslo":
+            self.poisci_uporabnika(zapis["uporabnisko_ime"]).razprsitev = zapis["razprsitev"]
+        else:
+            raise ValueError(f"Neznana vrsta zapisa v dnevniku: {vrsta}")
+
+    def lestvica_naloge(self, id_naloge):
+        """Vrni lestvico naloge (glej Lestvica)."""
+        if self._lestvice is None:
+            # Med gradnjo ocenjevanje v ozadju ne sme spreminjati rezultatov
+            with self._kljucavnica:
+                self._zgradi_lestvice()
+        return self._lestvice.get(id_naloge, Lestvica())
 
     def ustvari_nakljucno_nalogo(self, zaporedna_stevilka):
         """Ustvari novo, naključno generirano nalogo."""
+        self.dodaj_nalogo(nakljucna_naloga(zaporedna_stevilka))
+        return self.naloge[-1]
 
-        # Koliko je minimalna in koliko maksimalna globina funkcije
-        KOMPLEKSNOST = (2, 4)
 
-        obmocje = [-1, 1]
-        niz_funkcije = funkcije.generiraj_funkcijo(random.randint(*KOMPLEKSNOST))
-        funkcija = Funkcija(niz_funkcije, obmocje)
+def nakljucna_naloga(zaporedna_stevilka):
+    """Vrni novo, naključno generirano nalogo z dano zaporedno številko."""
 
-        # Poskusimo narisati graf; če nam to ne uspe (npr. če smo poskusili izračunali atanh(6)), zgeneriramo funkcijo
-        # znova
+    # Koliko je minimalna in koliko maksimalna globina funkcije
+    KOMPLEKSNOST = (2, 4)
 
-        funkcija_deluje = False
-        while not funkcija_deluje:
-            try:
-                funkcija.narisi_graf(f"grafi/{funkcija._id}.png")
-            except ValueError:  # math domain error
-                niz_funkcije = funkcije.generiraj_funkcijo(random.randint(*KOMPLEKSNOST))
-                funkcija = Funkcija(niz_funkcije, obmocje)
-            else:
-                funkcija_deluje = True
-
-        self.naloge.append(Naloga(
-            "splosna_naloga.html",
-            funkcija,
-            str(zaporedna_stevilka),
-            [(x, 1) for x in funkcije.linspace(*obmocje, 20)]
-        ))
-        return self.naloge[-1]
+    obmocje = [-1, 1]
+    niz_funkcije = funkcije.generiraj_funkcijo(random.randint(*KOMPLEKSNOST))
+    funkcija = Funkcija(niz_funkcije, obmocje)
+
+    # Poskusimo izračunati vrednosti za graf; če nam to ne uspe, zgeneriramo funkcijo znova.
+    # Sam graf se nariše šele, ko ga kdo zahteva (glej risanje.py)
+
+    funkcija_deluje = False
+    while not funkcija_deluje:
+        try:
+            funkcija.evaluiraj_vektorsko(list(linspace(*obmocje)))
+        except (ValueError, IndexError):
+            niz_funkcije = funkcije.generiraj_funkcijo(random.randint(*KOMPLEKSNOST))
+            funkcija = Funkcija(niz_funkcije, obmocje)
+        else:
+            funkcija_deluje = True
+
+    return Naloga(
+        "splosna_naloga.html",
+        funkcija,
+        str(zaporedna_stevilka),
+        [(x, 1) for x in funkcije.linspace(*obmocje, 20)]
+    )
+
+
+def oceni_niz(naloga: Naloga, funkcijski_niz: str, predpomnilnik_ocen: LRUPredpomnilnik, ocenjevalec=None,
+              v_ozadju=False):
+    """Ustvari funkcijo iz oddanega niza in jo oceni. Vrni par (funkcija, tocke).
+    Ocene shranjujemo v predpomnilnik pod ključem (id naloge, kanonični ključ funkcije, različica ocenjevanja).
+    Če je podan ocenjevalec (glej ocenjevanje.OcenjevalecOddaj), ta niz preveri že pred razčlenjevanjem
+    in funkcijo oceni v ločenem procesu; če oddaja presega njegove omejitve, sproži PrekoracenaOmejitev.
+    Če je v_ozadju True in ocene ni v predpomnilniku, funkcijo le razčleni in preveri, namesto točk pa vrne None."""
+    if ocenjevalec is not None:
+        ocenjevalec.preveri_niz(funkcijski_niz)
+    funkcija = Funkcija(funkcijski_niz, naloga.odvedena_funkcija.obmocje)
+    kljuc = (naloga._id, funkcija.kanonicni_kljuc(), funkcije.RAZLICICA_OCENJEVANJA)
+    tocke = predpomnilnik_ocen.pridobi(kljuc)
+    if tocke is None:
+        if ocenjevalec is not None:
+            ocenjevalec.preveri_funkcijo(funkcija)
+        if v_ozadju:
+            return funkcija, None
+        if ocenjevalec is None:
+            tocke = naloga.oceni_oddajo(funkcija)
+        else:
+            tocke = ocenjevalec.oceni(naloga, funkcija)
+        predpomnilnik_ocen.shrani(kljuc, tocke)
+    return funkcija, tocke
+
+
+def oceni_neocenjeno(naloga: Naloga, oddaja: Oddaja, predpomnilnik_ocen: LRUPredpomnilnik, ocenjevalec=None):
+    """Oceni oddajo, ki je bila dodana neocenjena. Vrni par (tocke, sporočilo o napaki ali None);
+    oddaja, ki je ni mogoče oceniti, dobi 0 točk."""
+    try:
+        __, tocke = oceni_niz(naloga, oddaja.funkcija.niz, predpomnilnik_ocen, ocenjevalec)
+    except PrekoracenaOmejitev as napaka:
+        return 0, str(napaka)
+    except Exception:
+        return 0, "Pri izračunu odvoda funkcije je prišlo do napake."
+    return tocke, None
 
 
 def graf_naloge_in_odvoda_oddaje(naloga: Naloga, oddaja: Oddaja, ime_datoteke: str):
     """Nariši graf v nalogi podane funkcije in odvoda oddane funkcije v istem koordinatnem sistemu."""
-    xs = []
-    ys1 = []
-    ys2 = []
+    narisi_graf_naloge_in_odvoda(
+        naloga.odvedena_funkcija, naloga.tocke_grafa(), naloga.vrednosti_na_grafu(), oddaja.funkcija, ime_datoteke
+    )
 
-    for x in funkcije.linspace(naloga.odvedena_funkcija.obmocje[0], naloga.odvedena_funkcija.obmocje[1]):
-        try:
-            y1 = naloga.odvedena_funkcija.evaluiraj(x)
-        except (ZeroDivisionError, OverflowError):
-            y1 = math.inf
 
-        try:
-            y2 = oddaja.funkcija.izracunaj_odvod(x)
-        except (ZeroDivisionError, OverflowError):
-            y2 = math.inf
+def podatki_grafa_naloge_in_odvoda_oddaje(naloga: Naloga, oddaja: Oddaja):
+    """Vrni točke grafa v nalogi podane funkcije in odvoda oddane funkcije za risanje v brskalniku."""
+    xs, ys_naloge, ys_odvoda = tocke_grafa_naloge_in_odvoda(
+        naloga.odvedena_funkcija, naloga.tocke_grafa(), naloga.vrednosti_na_grafu(), oddaja.funkcija
+    )
+    return funkcije.podatki_grafa(xs, [
+        ("Podana funkcija", ys_naloge),
+        ("Odvod oddane funkcije", ys_odvoda),
+    ])
+
+
+def tocke_grafa_naloge_in_odvoda(podana_funkcija: Funkcija, xs, ys_naloge, funkcija: Funkcija):
+    """Vrni x koordinate in vrednosti podane funkcije in odvoda funkcije za skupni graf. Začnemo s točkami
+    grafa naloge xs, v katerih ima podana funkcija vrednosti ys_naloge, in jih dodamo, kjer se odvod ukrivlja
+    ali skoči (glej funkcije.prilagodljive_tocke). Na nezveznostih je vrednost nan."""
+    def izracunaj(xs):
+        return [podana_funkcija.evaluiraj_vektorsko(xs), funkcija.izracunaj_odvod_vektorsko(xs)]
+
+    obmocje = podana_funkcija.obmocje
+    xs, ys = funkcije.prilagodljive_tocke(
+        izracunaj,
+        obmocje,
+        xs,
+        [ys_naloge, funkcija.izracunaj_odvod_vektorsko(xs)],
+        len(xs) + funkcije.NAJVECJE_STEVILO_TOCK_GRAFA
+    )
+    xs, (ys_naloge, ys_odvoda) = funkcije.prekini_skoke(izracunaj, obmocje, xs, ys)
+    return xs, ys_naloge, ys_odvoda
+
 
-        xs.append(x)
-        ys1.append(y1)
-        ys2.append(y2)
+def narisi_graf_naloge_in_odvoda(podana_funkcija: Funkcija, xs, ys_naloge, funkcija: Funkcija, ime_datoteke: str):
+    """Nariši graf podane funkcije, ki ima v točkah xs vrednosti ys_naloge, in odvoda funkcije v istem
+    koordinatnem sistemu (glej tocke_grafa_naloge_in_odvoda)."""
+    xs, ys_naloge, ys_odvoda = tocke_grafa_naloge_in_odvoda(podana_funkcija, xs, ys_naloge, funkcija)
 
     funkcije.narisi_dvojni_graf_iz_tock(
-        xs, ys1, ys2, "Podana funkcija", "Odvod oddane funkcije", ime_datoteke
+        xs, ys_naloge, ys_odvoda, "Podana funkcija", "Odvod oddane funkcije", ime_datoteke
     )
 
 
 if __name__ == "__main__":
     primer = Integrator.ustvari_iz_datoteke("primer.json")
-    primer.uporabniki.append(Uporabnik.ustvari_uporabnika("janez", "novak"))
+    primer.ustvari_uporabnika("janez", "novak")
     funkcija = Funkcija("2*x", [-5, 5])
     integrirana = Funkcija("x^2 + 3", [-5, 5])
-    primer.naloge.append(Naloga("primer.html", funkcija, 1))
-    primer.uporabniki[0].oddaje.append(Oddaja(
+    primer.dodaj_nalogo(Naloga("primer.html", funkcija, 1))
+    primer.uporabniki[0].ustvari_oddajo(
         primer.naloge[0]._id,
         integrirana,
         "2022-03-22 03:33:22",
         100
-    ))
+    )
     primer.shrani_v_datoteko("prebavljen_primer.json")
 
 
@@ -0,0 +1,123 @@
+"""Obremenitveni test spletnega vmesnika z bazo SQLite pri različnem številu delovnih procesov (glej streznik.py).
+Za vsako število procesov zaženemo strežnik na prazni kopiji baze primer.json, nato več odjemalcev hkrati
+pošilja zahteve, kot bi jih pošiljali uporabniki (pregled nalog, naloga, oddaja, lestvica).
+
+Uporaba:
+    python obremenitev.py [stevilo_zahtev] [stevilo_odjemalcev] [stevila_delavcev ...]
+npr. python obremenitev.py 2000 16 1 2 4"""
+
+import http.cookiejar
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import baza_sqlite
+
+
+def _prosta_vrata():
+    with socket.socket() as vticnica:
+        vticnica.bind(("127.0.0.1", 0))
+        return vticnica.getsockname()[1]
+
+
+def _zazeni_streznik(direktorij, vrata, delavci):
+    datoteka_sqlite = os.path.join(direktorij, "db.sqlite")
+    # Bazo pripravimo vnaprej, da strežnik ne uvozi db.json iz trenutnega direktorija
+    baza_sqlite.uvozi("primer.json", datoteka_sqlite)
+    okolje = dict(
+        os.environ,
+        BAZA_SQLITE=datoteka_sqlite,
+        STEVILO_DELAVCEV=str(delavci),
+        VRATA=str(vrata),
+        # Grafe rišemo v brskalniku, da merimo strežnik in ne risanja slik
+        RISANJE_V_BRSKALNIKU="1",
+    )
+    proces = subprocess.Popen(
+        [sys.executable, "spletni_vmesnik.py"], env=okolje, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    # Počakamo, da strežnik začne sprejemati povezave
+    for __ in range(200):
+        try:
+            with socket.create_connection(("127.0.0.1", vrata), timeout=1):
+                return proces
+        except OSError:
+            time.sleep(0.05)
+    proces.kill()
+    raise RuntimeError("Strežnik se ni zagnal.")
+
+
+class Odjemalec:
+    """Uporabnik, ki se registrira in nato zaporedoma pošilja zahteve."""
+
+    def __init__(self, naslov, uporabnisko_ime):
+        self.naslov = naslov
+        self.odpiralnik = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        self.poslji("/registracija/", {"uporabnisko_ime": uporabnisko_ime, "geslo": "geslo"})
+
+    def poslji(self, pot, podatki=None):
+        if podatki is not None:
+            podatki = urllib.parse.urlencode(podatki).encode()
+        with self.odpiralnik.open(self.naslov + pot, podatki, timeout=60) as odgovor:
+            odgovor.read()
+
+    def zahteva(self, i):
+        """Pošlji i-to zahtevo iz zaporedja, ki se ponavlja."""
+        korak = i % 4
+        if korak == 0:
+            self.poslji("/")
+        elif korak == 1:
+            self.poslji("/naloga/1/")
+        elif korak == 2:
+            self.poslji("/naloga/1/", {"funkcija": f"x^{i % 5} + {i % 3}"})
+        else:
+            self.poslji("/lestvica/1/")
+
+
+def izmeri(delavci, stevilo_zahtev, stevilo_odjemalcev):
+    """Vrni število obdelanih zahtev na sekundo pri danem številu delovnih procesov."""
+    with tempfile.TemporaryDirectory() as direktorij:
+        vrata = _prosta_vrata()
+        proces = _zazeni_streznik(direktorij, vrata, delavci)
+        try:
+            naslov = f"http://127.0.0.1:{vrata}"
+            odjemalci = [Odjemalec(naslov, f"obremenitev{i}") for i in range(stevilo_odjemalcev)]
+
+            stevec = iter(range(stevilo_zahtev))
+            kljucavnica = threading.Lock()
+
+            def delo(odjemalec):
+                while True:
+                    with kljucavnica:
+                        i = next(stevec, None)
+                    if i is None:
+                        return
+                    odjemalec.zahteva(i)
+
+            zacetek = time.perf_counter()
+            with ThreadPoolExecutor(stevilo_odjemalcev) as izvajalec:
+                for rezultat in [izvajalec.submit(delo, odjemalec) for odjemalec in odjemalci]:
+                    rezultat.result()
+            return stevilo_zahtev / (time.perf_counter() - zacetek)
+        finally:
+            proces.terminate()
+            proces.wait()
+
+
+if __name__ == "__main__":
+    argumenti = [int(argument) for argument in sys.argv[1:]]
+    stevilo_zahtev = argumenti[0] if len(argumenti) > 0 else 2000
+    stevilo_odjemalcev = argumenti[1] if len(argumenti) > 1 else 16
+    stevila_delavcev = argumenti[2:] or [1, 2, 4]
+
+    print(f"{os.cpu_count()} procesorskih jeder, {stevilo_odjemalcev} odjemalcev, {stevilo_zahtev} zahtev")
+    for delavci in stevila_delavcev:
+        print(f"{delavci} delovnih procesov: {izmeri(delavci, stevilo_zahtev, stevilo_odjemalcev):.0f} zahtev na sekundo")
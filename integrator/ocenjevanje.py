@@ -0,0 +1,229 @@
+"""Ocenjevanje oddaj v ločenih procesih, da zahtevna oddaja ne zaustavi strežnika za ostale uporabnike.
+Ocenjevanje ima omejeno velikost oddanega izraza in čas izračuna.
+Oddaje lahko ocenjujemo tudi v ozadju (glej VrstaOcenjevanja), tako da strežnik na oddajo odgovori takoj."""
+
+import multiprocessing
+import os
+import signal
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import funkcije
+
+
+class PrekoracenaOmejitev(Exception):
+    """Oddaje nismo ocenili, ker presega omejitve ocenjevanja."""
+
+
+class PrevelikIzraz(PrekoracenaOmejitev):
+    def __str__(self):
+        return "Funkcija je prevelika za ocenjevanje. Poskusite jo zapisati krajše."
+
+
+class PrekoracenCas(PrekoracenaOmejitev):
+    def __init__(self, cas):
+        super().__init__(cas)
+        self.cas = cas
+
+    def __str__(self):
+        return f"Ocenjevanje je trajalo predolgo (več kot {self.cas:g} s). Poskusite funkcijo zapisati preprosteje."
+
+
+def stevilo_vozlisc(izraz):
+    """Vrni število vozlišč (podizrazov, števil, operatorjev in imen) v očiščenem izrazu."""
+    stevilo = 0
+    sklad = [izraz]
+    while sklad:
+        vozlisce = sklad.pop()
+        stevilo += 1
+        if isinstance(vozlisce, list):
+            sklad.extend(vozlisce)
+    return stevilo
+
+
+# Naslednja funkcija se izvaja v delovnih procesih, zato sprejema le preproste podatke
+
+def _izracunaj_odvod(izraz, tocke, pricakovane, meja, cas):
+    """Izračunaj približke odvoda izraza v točkah (glej funkcije.odvoda_za_ocenjevanje); če izračun traja
+    več kot cas sekund, ga prekini s PrekoracenCas."""
+    def prekini(*argumenti):
+        raise PrekoracenCas(cas)
+
+    signal.signal(signal.SIGALRM, prekini)
+    signal.setitimer(signal.ITIMER_REAL, cas)
+    try:
+        izracunaj_izraz = funkcije.prevedi_izraz(izraz)
+
+        def izracunaj_odvod(tocke):
+            return funkcije.prevedi_odvod(izraz, izracunaj_izraz)(tocke)
+        return funkcije.odvoda_za_ocenjevanje(izracunaj_izraz, izracunaj_odvod, tocke, pricakovane, meja)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class OcenjevalecOddaj:
+    """Ocenjuje oddaje v skupini procesov (glej model.oceni_niz).
+    Niz oddaje sme imeti največ najvecja_dolzina znakov, njegov izraz pa največ najvecje_stevilo_vozlisc vozlišč.
+    Izračun odvoda v procesu prekinemo po cas sekundah. Če se proces ne odzove niti po dodatnih
+    CAS_ZA_ODZIV sekundah (npr. ker je obtičal v dolgem izračunu knjižnice numpy ali se je nepričakovano končal),
+    končamo vse procese skupine in ob naslednji oddaji ustvarimo novo skupino.
+    Skupina je multiprocessing.Pool, ki procese, ki se nepričakovano končajo, sama nadomesti, obtičale pa
+    lahko končamo z Pool.terminate."""
+
+    CAS_ZA_ODZIV = 1.0
+
+    def __init__(self, stevilo_procesov=None, cas=2.0, najvecja_dolzina=500, najvecje_stevilo_vozlisc=300,
+                 inicializator=None):
+        # Privzeto toliko procesov, kot je procesorskih jeder
+        self.stevilo_procesov = stevilo_procesov
+        # Funkcija, ki jo ob zagonu izvede vsak proces skupine (glej streznik.zapri_vticnico_streznika)
+        self.inicializator = inicializator
+        self.cas = cas
+        self.najvecja_dolzina = najvecja_dolzina
+        self.najvecje_stevilo_vozlisc = najvecje_stevilo_vozlisc
+        self._izvajalec = None
+        # Oddaje lahko ocenjujemo iz več niti hkrati (glej VrstaOcenjevanja)
+        self._kljucavnica = threading.Lock()
+
+    def _pridobi_izvajalca(self):
+        with self._kljucavnica:
+            if self._izvajalec is None:
+                self._izvajalec = multiprocessing.Pool(self.stevilo_procesov, initializer=self.inicializator)
+            return self._izvajalec
+
+    def preveri_niz(self, niz):
+        """Preveri dolžino niza, še preden ga razčlenimo."""
+        if len(niz) > self.najvecja_dolzina:
+            raise PrevelikIzraz()
+
+    def preveri_funkcijo(self, funkcija):
+        """Preveri velikost razčlenjene funkcije."""
+        self.preveri_niz(funkcija.niz)
+        if stevilo_vozlisc(funkcija.izraz) > self.najvecje_stevilo_vozlisc:
+            raise PrevelikIzraz()
+
+    def oceni(self, naloga, funkcija):
+        """Oceni oddano funkcijo za nalogo in vrni število točk."""
+        self.preveri_funkcijo(funkcija)
+
+        argumenti = (funkcija.izraz, *naloga.podatki_za_ocenjevanje(), self.cas)
+        # Skupino procesov lahko zaradi svoje oddaje konča druga nit; takrat oddajo ocenimo znova v novi skupini
+        for __ in range(2):
+            izvajalec = self._pridobi_izvajalca()
+            izracun = izvajalec.apply_async(_izracunaj_odvod, argumenti)
+            try:
+                odvod = izracun.get(timeout=self.cas + self.CAS_ZA_ODZIV)
+            except multiprocessing.TimeoutError:
+                if self._koncaj_procese(izvajalec):
+                    break
+                continue
+            return naloga.oceni_odvod(odvod)
+        raise PrekoracenCas(self.cas)
+
+    def _koncaj_procese(self, izvajalec):
+        """Končaj vse procese skupine, tudi tiste, ki se ne odzivajo. Vrni False, če je skupino že končala
+        druga nit."""
+        with self._kljucavnica:
+            if self._izvajalec is not izvajalec:
+                return False
+            self._izvajalec = None
+        izvajalec.terminate()
+        return True
+
+    def zaustavi(self):
+        if self._izvajalec is not None:
+            self._izvajalec.close()
+            self._izvajalec.join()
+            self._izvajalec = None
+
+
+class VrstaOcenjevanja:
+    """Oddaje, ki jih Integrator doda neocenjene (glej model.Integrator.dodaj_oddajo), oceni v ozadju
+    v stevilo_niti nitih. Ocena in morebitno sporočilo o napaki se zapišeta v bazo kot pri običajni oddaji,
+    zato ju lahko stran z oddajo sproti preverja v katerem koli procesu.
+    Niti ustvarimo šele ob prvi oddaji, po razcepu procesa (glej streznik.py) pa nove."""
+
+    # Sporočilo za oddajo, pri ocenjevanju katere je prišlo do nepričakovane napake
+    NEPRICAKOVANA_NAPAKA = "Pri ocenjevanju oddaje je prišlo do napake."
+
+    def __init__(self, integrator, stevilo_niti=1, ob_oceni=None):
+        self.integrator = integrator
+        self.stevilo_niti = stevilo_niti
+        # Funkcija (uporabnik, oddaja), ki jo pokličemo po uspešnem ocenjevanju (npr. za risanje grafa oddaje)
+        self.ob_oceni = ob_oceni
+        self._izvajalec = None
+        self._pid = None
+        self._kljucavnica = threading.Lock()
+
+    def _pridobi_izvajalca(self):
+        with self._kljucavnica:
+            if self._izvajalec is None or self._pid != os.getpid():
+                self._izvajalec = ThreadPoolExecutor(self.stevilo_niti, thread_name_prefix="ocenjevanje")
+                self._pid = os.getpid()
+            return self._izvajalec
+
+    def dodaj(self, uporabnik, oddaja):
+        """Postavi neocenjeno oddajo uporabnika v vrsto za ocenjevanje."""
+        self._pridobi_izvajalca().submit(self._oceni, uporabnik, oddaja)
+
+    def _oceni(self, uporabnik, oddaja):
+        try:
+            self.integrator.oceni_neocenjeno_oddajo(uporabnik, oddaja)
+        except Exception:
+            traceback.print_exc()
+            # Oddajo označimo kot neuspešno ocenjeno, da stran z oddajo ne čaka v nedogled
+            try:
+                self.integrator.nastavi_rezultat(uporabnik, oddaja, 0, self.NEPRICAKOVANA_NAPAKA)
+            except Exception:
+                # Oddaja ostane neocenjena; ponovno jo poskusimo oceniti ob ponovnem zagonu strežnika
+                traceback.print_exc()
+            return
+        if self.ob_oceni is not None and oddaja.napaka is None:
+            try:
+                self.ob_oceni(uporabnik, oddaja)
+            except Exception:
+                traceback.print_exc()
+
+    def zaustavi(self):
+        """Počakaj, da se ocenijo vse oddaje v vrsti."""
+        if self._izvajalec is not None and self._pid == os.getpid():
+            self._izvajalec.shutdown()
+            self._izvajalec = None
+
+
+if __name__ == "__main__":
+    # Preverjanje, da ocenjevanje nobene oddaje ne oceni slabše kot ocenjevanje s številskim odvodom;
+    # preverimo shranjene oddaje iz baze in naključne funkcije za vsako nalogo
+    import random
+    import sys
+
+    import model
+
+    integrator = model.Integrator.ustvari_iz_datoteke(sys.argv[1] if len(sys.argv) > 1 else "primer.json")
+
+    oddaje = [
+        (integrator.poisci_nalogo(_id=oddaja.naloga), oddaja.funkcija.niz)
+        for uporabnik in integrator.uporabniki for oddaja in uporabnik.oddaje
+    ]
+    random.seed(0)
+    for naloga in integrator.naloge:
+        oddaje += [(naloga, funkcije.generiraj_funkcijo(random.randint(1, 5))) for __ in range(50)]
+
+    boljse = slabse = 0
+    for naloga, niz in oddaje:
+        funkcija = model.Funkcija(niz, naloga.odvedena_funkcija.obmocje)
+        try:
+            ocena = naloga.oceni_oddajo(funkcija)
+        except Exception:
+            continue
+        stevilska_ocena = naloga.oceni_odvod(
+            funkcije.numericni_odvod_vektorsko(funkcija.prevedi(), naloga.x_tocke_za_preverjanje())
+        )
+        if ocena < stevilska_ocena:
+            slabse += 1
+            print(f"Slabša ocena za {niz!r} pri nalogi {naloga.zaporedna_stevilka}: {ocena} < {stevilska_ocena}")
+        elif ocena > stevilska_ocena:
+            boljse += 1
+    print(f"Primerjanih {len(oddaje)} oddaj: bolje ocenjenih {boljse}, slabše ocenjenih {slabse}")
+    sys.exit(1 if slabse else 0)
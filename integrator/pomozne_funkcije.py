@@ -1,9 +1,12 @@
 import secrets
 import string
+import threading
+from collections import OrderedDict
 
 
 def linspace(a, b, n=100):
-    """Generiraj n enakomerno razporejenih točk med a in b"""
+    """Generiraj n enakomerno razporejenih točk na polodprtem intervalu (a, b]; točka a ni vključena.
+    Iz teh točk so sestavljene točke za preverjanje naključnih nalog, zato razporeditve ne spreminjamo."""
     idx = 0
     while idx < n:
         idx += 1
@@ -14,3 +17,49 @@ def generiraj_skrivnost():
     """Generira nov string za uporabo kot skrivnost v spletnem vmesniku."""
     ABECEDA = string.ascii_letters + string.digits
     return "".join(secrets.choice(ABECEDA) for __ in range(16))
+
+
+class LRUPredpomnilnik:
+    """Predpomnilnik omejene velikosti. Ko je poln, zavrže vnos, ki najdlje ni bil uporabljen.
+    Šteje zadetke in zgrešitve, da lahko spremljamo njegovo učinkovitost.
+    Uporabljamo ga lahko iz več niti hkrati (npr. pri ocenjevanju v ozadju, glej ocenjevanje.py)."""
+
+    def __init__(self, kapaciteta):
+        self.kapaciteta = kapaciteta
+        self._vnosi = OrderedDict()
+        self.zadetki = 0
+        self.zgresitve = 0
+        self._kljucavnica = threading.Lock()
+
+    def __len__(self):
+        return len(self._vnosi)
+
+    def __contains__(self, kljuc):
+        return kljuc in self._vnosi
+
+    def pridobi(self, kljuc, privzeto=None):
+        """Vrni shranjeno vrednost za ključ, ali privzeto, če je ni."""
+        with self._kljucavnica:
+            if kljuc not in self._vnosi:
+                self.zgresitve += 1
+                return privzeto
+            self.zadetki += 1
+            self._vnosi.move_to_end(kljuc)
+            return self._vnosi[kljuc]
+
+    def shrani(self, kljuc, vrednost):
+        """Shrani vrednost pod ključ; po potrebi zavrže najdlje neuporabljen vnos."""
+        with self._kljucavnica:
+            self._vnosi[kljuc] = vrednost
+            self._vnosi.move_to_end(kljuc)
+            while len(self._vnosi) > self.kapaciteta:
+                self._vnosi.popitem(last=False)
+
+    def statistika(self):
+        """Vrni slovar s podatki o uporabi predpomnilnika."""
+        return {
+            "velikost": len(self._vnosi),
+            "kapaciteta": self.kapaciteta,
+            "zadetki": self.zadetki,
+            "zgresitve": self.zgresitve,
+        }
@@ -0,0 +1,216 @@
+"""Hiter, ročno napisan razčlenjevalnik matematičnih izrazov (Prattov razčlenjevalnik).
+Vrača enaka drevesa kot funkcije.ustvari_izraz s pyparsing razčlenjevalnikom, le da je precej hitrejši."""
+
+import re
+
+
+class NapakaPriRazclenjevanju(ValueError):
+    """Niza ni mogoče razčleniti."""
+
+
+# Žetoni: števila (enaka pravila kot pyparsing_common.number, a brez predznaka, ker se ta vedno razčleni kot
+# unarni operator), imena (zaporedja črk) in posamezni znaki. Presledke preskočimo tako kot pyparsing.
+ZETON = re.compile(
+    r"[ \t\n\r]*(?:"
+    r"(?P<stevilka>\d+(?:[eE][+-]?\d+)|(?:\d+\.\d*|\.\d+)(?:[eE][+-]?\d+)?|\d+)"
+    r"|(?P<ime>[A-Za-z]+)"
+    r"|(?P<znak>.)"
+    r")",
+    re.DOTALL
+)
+
+# Prednosti binarnih operatorjev; višja prednost pomeni, da operator veže močneje
+PREDNOSTI = {
+    "^": 40,
+    "*": 20,
+    "/": 20,
+    "+": 10,
+    "-": 10,
+}
+DESNO_ASOCIATIVNI = {"^"}
+PREDZNAKI = {"+", "-"}
+PREDNOST_PREDZNAKA = 30
+
+LEVI_OKLEPAJI_FUNKCIJ = {"(", "{"}
+DESNI_OKLEPAJI_FUNKCIJ = {")", "}"}
+
+# Vrste žetonov
+STEVILKA = 0
+IME = 1
+ZNAK = 2
+
+
+def razdeli_na_zetone(niz: str):
+    """Razdeli niz na seznam parov (vrsta, vrednost)."""
+    zetoni = []
+    for ujemanje in ZETON.finditer(niz):
+        if (stevilka := ujemanje.group("stevilka")) is not None:
+            if "." in stevilka or "e" in stevilka or "E" in stevilka:
+                zetoni.append((STEVILKA, float(stevilka)))
+            else:
+                zetoni.append((STEVILKA, int(stevilka)))
+        elif (ime := ujemanje.group("ime")) is not None:
+            zetoni.append((IME, ime))
+        elif (znak := ujemanje.group("znak")) is not None:
+            zetoni.append((ZNAK, znak))
+    return zetoni
+
+
+class _Razclenjevalnik:
+    """Razčleni seznam žetonov v drevo izraza.
+    Tako kot pri pyparsing se razčlenjevanje ustavi pri prvem žetonu, ki ne more nadaljevati izraza;
+    preostanek niza se ignorira."""
+
+    def __init__(self, zetoni):
+        self.zetoni = zetoni
+        self.indeks = 0
+
+    def _zeton(self, zamik=0):
+        """Vrni žeton na trenutnem mestu (plus zamik), ali None, če ga ni."""
+        if self.indeks + zamik < len(self.zetoni):
+            return self.zetoni[self.indeks + zamik]
+        return None
+
+    def _binarni_operator(self):
+        """Vrni binarni operator na trenutnem mestu, ali None, če ga ni."""
+        zeton = self._zeton()
+        if zeton is not None and zeton[0] == ZNAK and zeton[1] in PREDNOSTI:
+            return zeton[1]
+        return None
+
+    def izraz(self, najmanjsa_prednost=0):
+        """Razčleni izraz, v katerem imajo vsi binarni operatorji prednost večjo od najmanjsa_prednost."""
+        levi = self.operand()
+
+        while (operator := self._binarni_operator()) is not None:
+            prednost = PREDNOSTI[operator]
+            if prednost <= najmanjsa_prednost:
+                break
+            self.indeks += 1
+
+            if operator in DESNO_ASOCIATIVNI:
+                # "x ^ 2 ^ 3" --> ["x", "^", [2, "^", 3]]
+                levi = [levi, operator, self.izraz(prednost - 1)]
+                continue
+
+            # Levo asociirane operacije z enako prednostjo so v istem vozlišču:
+            # "3 + 2 - 5" --> [3, "+", 2, "-", 5]
+            vozlisce = [levi, operator, self.izraz(prednost)]
+            while (operator := self._binarni_operator()) is not None and PREDNOSTI[operator] == prednost:
+                self.indeks += 1
+                vozlisce += [operator, self.izraz(prednost)]
+            levi = vozlisce
+
+        return levi
+
+    def operand(self):
+        """Razčleni operand: unarni predznak, klic funkcije, število, spremenljivko ali izraz v oklepajih."""
+        zeton = self._zeton()
+        if zeton is None:
+            raise NapakaPriRazclenjevanju("Pričakovan operand, a niza je konec.")
+        vrsta, vrednost = zeton
+
+        if vrsta == ZNAK and vrednost in PREDZNAKI:
+            self.indeks += 1
+            return [vrednost, self.izraz(PREDNOST_PREDZNAKA)]
+
+        if vrsta == IME:
+            naslednji = self._zeton(1)
+            if naslednji is not None and naslednji[0] == ZNAK and naslednji[1] in LEVI_OKLEPAJI_FUNKCIJ:
+                klic = self._klic_funkcije()
+                if klic is not None:
+                    return klic
+            # Ime brez (veljavnih) oklepajev je spremenljivka
+            self.indeks += 1
+            return vrednost
+
+        if vrsta == STEVILKA:
+            self.indeks += 1
+            return vrednost
+
+        if vrsta == ZNAK and vrednost == "(":
+            self.indeks += 1
+            notranji = self.izraz()
+            if self._zeton() != (ZNAK, ")"):
+                raise NapakaPriRazclenjevanju("Manjka zaklepaj.")
+            self.indeks += 1
+            return notranji
+
+        raise NapakaPriRazclenjevanju(f"Nepričakovan znak {vrednost!r}.")
+
+    def _klic_funkcije(self):
+        """Poskusi razčleniti klic funkcije. Če to ne uspe, vrni None in se vrni na začetek klica."""
+        zacetek = self.indeks
+        ime = self.zetoni[zacetek][1]
+        self.indeks += 2
+        try:
+            argument = self.izraz()
+        except NapakaPriRazclenjevanju:
+            self.indeks = zacetek
+            return None
+
+        zeton = self._zeton()
+        if zeton is None or zeton[0] != ZNAK or zeton[1] not in DESNI_OKLEPAJI_FUNKCIJ:
+            self.indeks = zacetek
+            return None
+
+        self.indeks += 1
+        return [ime, argument]
+
+
+def razcleni(niz: str):
+    """Razčleni niz v očiščeno drevo izraza, enako tistemu, ki ga vrne funkcije.ustvari_izraz."""
+    try:
+        return _Razclenjevalnik(razdeli_na_zetone(niz)).izraz()
+    except RecursionError:
+        raise NapakaPriRazclenjevanju("Izraz je pregloboko gnezden.")
+
+
+if __name__ == "__main__":
+    # Primerjava s pyparsing razčlenjevalnikom na naključnih izrazih in meritev hitrosti
+    import random
+    import time
+
+    import funkcije
+
+    parser = funkcije.pridobi_parser()
+
+    def pyparsing_razcleni(niz):
+        try:
+            return funkcije.ustvari_izraz(niz, parser)
+        except Exception:
+            return "napaka"
+
+    def pratt_razcleni(niz):
+        try:
+            return razcleni(niz)
+        except Exception:
+            return "napaka"
+
+    def nakljucen_niz():
+        """Naključen niz iz koščkov, ki se pojavljajo v izrazih; pogosto tudi neveljaven."""
+        koscki = ["x", "e", "pi", "sin", "log", "2", "3.5", ".5", "1e3", "2E-2", "+", "-", "*", "/", "^",
+                  "(", ")", "{", "}", " ", "y", "7", "_"]
+        return "".join(random.choice(koscki) for __ in range(random.randint(1, 12)))
+
+    random.seed(0)
+    nizi = [funkcije.generiraj_funkcijo(random.randint(1, 6)) for __ in range(3000)]
+    nizi += [nakljucen_niz() for __ in range(20000)]
+
+    razlike = 0
+    for niz in nizi:
+        prvi = pyparsing_razcleni(niz)
+        drugi = pratt_razcleni(niz)
+        if repr(prvi) != repr(drugi):
+            razlike += 1
+            if razlike <= 10:
+                print(f"Razlika pri {niz!r}: {prvi} != {drugi}")
+    print(f"Primerjanih {len(nizi)} nizov, razlik: {razlike}")
+
+    veljavni = nizi[:3000]
+    for ime, razclenjevanje in [("pyparsing", pyparsing_razcleni), ("pratt", pratt_razcleni)]:
+        zacetek = time.perf_counter()
+        for niz in veljavni:
+            razclenjevanje(niz)
+        trajanje = time.perf_counter() - zacetek
+        print(f"{ime}: {len(veljavni) / trajanje:.0f} izrazov na sekundo")
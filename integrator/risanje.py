@@ -0,0 +1,319 @@
+"""Risanje grafov v ozadju, v ločenih procesih, da risanje ne zaustavi strežnika,
+in predpomnilnik narisanih grafov na disku."""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from hashlib import sha256
+
+import funkcije
+import model
+
+
+def _narisi_atomarno(risanje, ime_datoteke):
+    """Nariši graf v začasno datoteko in jo nato preimenuj, tako da nihče ne vidi napol zapisane slike."""
+    zacasna_datoteka = f"{ime_datoteke}.{os.getpid()}.png"
+    try:
+        risanje(zacasna_datoteka)
+        os.replace(zacasna_datoteka, ime_datoteke)
+    finally:
+        if os.path.exists(zacasna_datoteka):
+            os.remove(zacasna_datoteka)
+
+
+# Naslednji funkciji se izvajata v delovnih procesih, zato sprejemata le preproste podatke
+
+def _narisi_graf_funkcije(niz, obmocje, ime_datoteke):
+    funkcija = model.Funkcija(niz, obmocje)
+    _narisi_atomarno(funkcija.narisi_graf, ime_datoteke)
+
+
+def _narisi_graf_oddaje(niz_naloge, xs, ys_naloge, niz, obmocje, ime_datoteke):
+    podana_funkcija = model.Funkcija(niz_naloge, obmocje)
+    funkcija = model.Funkcija(niz, obmocje)
+    _narisi_atomarno(
+        lambda datoteka: model.narisi_graf_naloge_in_odvoda(podana_funkcija, xs, ys_naloge, funkcija, datoteka),
+        ime_datoteke
+    )
+
+
+def kljuc_grafa_funkcije(funkcija: model.Funkcija):
+    """Vrni ključ grafa funkcije. Funkcije z enako kanonično obliko na enakem območju imajo enak graf."""
+    podatki = ["funkcija", funkcija.kanonicni_kljuc(), funkcija.obmocje, funkcije.RAZLICICA_TOCK_GRAFA]
+    return sha256(json.dumps(podatki).encode()).hexdigest()
+
+
+def kljuc_grafa_oddaje(naloga: model.Naloga, oddaja: model.Oddaja):
+    """Vrni ključ grafa, ki primerja v nalogi podano funkcijo in odvod oddane funkcije."""
+    podatki = [
+        "oddaja",
+        naloga.odvedena_funkcija.kanonicni_kljuc(),
+        naloga.odvedena_funkcija.obmocje,
+        oddaja.funkcija.kanonicni_kljuc(),
+        oddaja.funkcija.obmocje,
+        funkcije.RAZLICICA_TOCK_GRAFA
+    ]
+    return sha256(json.dumps(podatki).encode()).hexdigest()
+
+
+class PredpomnilnikGrafov:
+    """Predpomnilnik narisanih grafov na disku. Datoteke so poimenovane po ključu grafa.
+    Kateri grafi so na disku, hrani v pomnilniku, zato pri iskanju ne dostopa do datotečnega sistema.
+    Ko skupna velikost grafov preseže najvecja_velikost (v bajtih), izbriše grafe, ki najdlje niso bili uporabljeni;
+    grafov, starejših od najvecja_starost sekund, ne uporablja več.
+
+    Če je predpomnilnik deljen, direktorij hkrati uporablja več procesov. Takrat pred uporabo grafa preverimo,
+    ali ga ni izbrisal drug proces, in vsaj vsakih cas_usklajevanja sekund znova preberemo, kateri grafi so na disku,
+    da upoštevamo tudi grafe drugih procesov."""
+
+    IME_DATOTEKE = re.compile(r"[0-9a-f]{64}\.png")
+    # Začasne datoteke, v katere rišemo (glej _narisi_atomarno)
+    IME_ZACASNE_DATOTEKE = re.compile(r"[0-9a-f]{64}\.png\.[0-9]+\.png")
+    # Začasno datoteko, starejšo od toliko sekund, je pustilo prekinjeno risanje
+    NAJDALJSE_RISANJE = 10 * 60
+
+    def __init__(self, direktorij, najvecja_velikost, najvecja_starost=None, deljen=False, cas_usklajevanja=60):
+        self.direktorij = direktorij
+        self.najvecja_velikost = najvecja_velikost
+        self.najvecja_starost = najvecja_starost
+        self.deljen = deljen
+        self.cas_usklajevanja = cas_usklajevanja
+        self._zadnje_usklajevanje = 0
+
+        # ključ -> (velikost, čas nastanka), urejeno od najdlje neuporabljenega grafa
+        self._grafi = OrderedDict()
+        self.velikost = 0
+        self.zadetki = 0
+        self.zgresitve = 0
+        self._kljucavnica = threading.Lock()
+
+        self._uskladi_z_diskom()
+
+    def _uskladi_z_diskom(self):
+        """Preberi, kateri grafi so že na disku. Izbriši datoteke, ki niso grafi iz predpomnilnika
+        (npr. ostanke prekinjenega risanja ali grafe, poimenovane na star način).
+        Začasnih datotek ne brišemo takoj, saj vanje morda ravno riše drug proces."""
+        os.makedirs(self.direktorij, exist_ok=True)
+
+        najdeni = []
+        zdaj = time.time()
+        with os.scandir(self.direktorij) as datoteke:
+            for datoteka in datoteke:
+                try:
+                    if not datoteka.is_file():
+                        continue
+                    podatki = datoteka.stat()
+                    if self.IME_DATOTEKE.fullmatch(datoteka.name) is None:
+                        if self.IME_ZACASNE_DATOTEKE.fullmatch(datoteka.name) is None or \
+                                zdaj - podatki.st_mtime > self.NAJDALJSE_RISANJE:
+                            os.remove(datoteka.path)
+                        continue
+                except FileNotFoundError:
+                    # Datoteko je medtem izbrisal ali preimenoval drug proces
+                    continue
+                najdeni.append((podatki.st_mtime, datoteka.name[:-len(".png")], podatki.st_size))
+
+        # Najstarejše datoteke štejemo kot najdlje neuporabljene
+        self._grafi.clear()
+        self.velikost = 0
+        for cas, kljuc, velikost in sorted(najdeni):
+            self._grafi[kljuc] = (velikost, cas)
+            self.velikost += velikost
+        self._zadnje_usklajevanje = zdaj
+        self._pocisti()
+
+    def ime_datoteke(self, kljuc):
+        return f"{kljuc}.png"
+
+    def pot(self, kljuc):
+        return os.path.join(self.direktorij, self.ime_datoteke(kljuc))
+
+    def vsebuje(self, kljuc):
+        """Ali je graf s tem ključem v predpomnilniku. Če je, ga označi kot nazadnje uporabljenega."""
+        with self._kljucavnica:
+            if self.deljen:
+                self._preveri_na_disku(kljuc)
+            if kljuc in self._grafi:
+                velikost, cas = self._grafi[kljuc]
+                if self.najvecja_starost is None or time.time() - cas <= self.najvecja_starost:
+                    self._grafi.move_to_end(kljuc)
+                    self.zadetki += 1
+                    return True
+                self._odstrani(kljuc)
+            self.zgresitve += 1
+            return False
+
+    def _preveri_na_disku(self, kljuc):
+        """Uskladi podatke o grafu s stanjem na disku, ki ga spreminjajo tudi drugi procesi."""
+        if time.time() - self._zadnje_usklajevanje > self.cas_usklajevanja:
+            self._uskladi_z_diskom()
+        try:
+            podatki = os.stat(self.pot(kljuc))
+        except FileNotFoundError:
+            # Graf je izbrisal drug proces
+            if kljuc in self._grafi:
+                self.velikost -= self._grafi.pop(kljuc)[0]
+            return
+        if kljuc not in self._grafi:
+            # Graf je narisal drug proces
+            self._grafi[kljuc] = (podatki.st_size, podatki.st_mtime)
+            self.velikost += podatki.st_size
+
+    def dodaj(self, kljuc):
+        """Zabeleži, da je bil graf s tem ključem ravnokar narisan. Po potrebi izbriši stare grafe."""
+        velikost = os.path.getsize(self.pot(kljuc))
+        with self._kljucavnica:
+            if kljuc in self._grafi:
+                self.velikost -= self._grafi[kljuc][0]
+            self._grafi[kljuc] = (velikost, time.time())
+            self._grafi.move_to_end(kljuc)
+            self.velikost += velikost
+            self._pocisti()
+
+    def _odstrani(self, kljuc):
+        velikost, __ = self._grafi.pop(kljuc)
+        self.velikost -= velikost
+        try:
+            os.remove(self.pot(kljuc))
+        except FileNotFoundError:
+            pass
+
+    def _pocisti(self):
+        """Odstrani prestare grafe in najdlje neuporabljene grafe, dokler niso skupaj dovolj majhni."""
+        if self.najvecja_starost is not None:
+            zdaj = time.time()
+            for kljuc in [kljuc for kljuc, (__, cas) in self._grafi.items() if zdaj - cas > self.najvecja_starost]:
+                self._odstrani(kljuc)
+
+        while self.velikost > self.najvecja_velikost and self._grafi:
+            self._odstrani(next(iter(self._grafi)))
+
+    def statistika(self):
+        with self._kljucavnica:
+            return {
+                "stevilo": len(self._grafi),
+                "velikost": self.velikost,
+                "najvecja_velikost": self.najvecja_velikost,
+                "zadetki": self.zadetki,
+                "zgresitve": self.zgresitve,
+            }
+
+
+class RisarGrafov:
+    """Vrsta za risanje grafov, ki jo izvaja skupina procesov.
+    Narisane grafe hrani v predpomnilniku; zahteve za graf, ki se še riše, se združijo v eno samo risanje."""
+
+    def __init__(self, predpomnilnik: PredpomnilnikGrafov, stevilo_procesov=2, inicializator=None):
+        self.predpomnilnik = predpomnilnik
+        # Pri 0 procesih rišemo kar v klicočem procesu (uporabno za razhroščevanje)
+        self.stevilo_procesov = stevilo_procesov
+        # Funkcija, ki jo ob zagonu izvede vsak proces skupine (glej streznik.zapri_vticnico_streznika)
+        self.inicializator = inicializator
+        self._izvajalec = None
+        # ključ -> (Future, ki ga vrnemo zahtevam, Future risanja v skupini procesov ali None)
+        self._v_teku = {}
+        self._kljucavnica = threading.Lock()
+
+    def _pridobi_izvajalca(self):
+        if self._izvajalec is None:
+            self._izvajalec = ProcessPoolExecutor(max_workers=self.stevilo_procesov, initializer=self.inicializator)
+        return self._izvajalec
+
+    def _oddaj(self, kljuc, funkcija, *argumenti):
+        """Oddaj risanje grafa s tem ključem, razen če je že narisan ali se že riše.
+        Vrni Future, katerega rezultat je ime datoteke z narisanim grafom v direktoriju predpomnilnika.
+        Pri 0 procesih graf nariše kar klicoča nit, a brez zaklepanja, tako da ostale zahteve ne čakajo nanjo."""
+        ime_datoteke = self.predpomnilnik.ime_datoteke(kljuc)
+
+        with self._kljucavnica:
+            if kljuc in self._v_teku:
+                return self._v_teku[kljuc][0]
+
+            if self.predpomnilnik.vsebuje(kljuc):
+                prihodnost = Future()
+                prihodnost.set_result(ime_datoteke)
+                return prihodnost
+
+            # Vrnjen Future se konča šele, ko je graf že dodan v predpomnilnik
+            prihodnost = Future()
+            pot = self.predpomnilnik.pot(kljuc)
+            if self.stevilo_procesov == 0:
+                self._v_teku[kljuc] = (prihodnost, None)
+            else:
+                try:
+                    risanje = self._pridobi_izvajalca().submit(funkcija, *argumenti, pot)
+                except BrokenProcessPool:
+                    # Eden izmed procesov se je nepričakovano končal; ustvarimo novo skupino procesov
+                    self._izvajalec = None
+                    risanje = self._pridobi_izvajalca().submit(funkcija, *argumenti, pot)
+                self._v_teku[kljuc] = (prihodnost, risanje)
+
+        if self.stevilo_procesov == 0:
+            risanje = Future()
+            try:
+                funkcija(*argumenti, pot)
+            except Exception as napaka:
+                risanje.set_exception(napaka)
+            else:
+                risanje.set_result(None)
+
+        risanje.add_done_callback(lambda koncano: self._koncano(kljuc, koncano, prihodnost))
+        return prihodnost
+
+    def _koncano(self, kljuc, risanje, prihodnost):
+        try:
+            risanje.result()
+            self.predpomnilnik.dodaj(kljuc)
+        except Exception as napaka:
+            prihodnost.set_exception(napaka)
+        else:
+            prihodnost.set_result(self.predpomnilnik.ime_datoteke(kljuc))
+        finally:
+            with self._kljucavnica:
+                # Risanje je morda že pozabljeno (glej pozabi) in se isti graf ponovno riše
+                if kljuc in self._v_teku and self._v_teku[kljuc][0] is prihodnost:
+                    del self._v_teku[kljuc]
+
+    def pozabi(self, prihodnost):
+        """Pozabi risanje, na katerega zahteva ni več pripravljena čakati (glej spletni_vmesnik.vrni_graf),
+        tako da naslednja zahteva za isti graf začne risati znova, namesto da čaka na morda obtičalo risanje.
+        Risanje, ki se še ni začelo, prekličemo."""
+        with self._kljucavnica:
+            kljuci = [kljuc for kljuc, (v_teku, __) in self._v_teku.items() if v_teku is prihodnost]
+            risanja = [self._v_teku.pop(kljuc)[1] for kljuc in kljuci]
+        # Preklic takoj pokliče _koncano, ki zaklepa, zato prekličemo šele po sprostitvi ključavnice
+        for risanje in risanja:
+            if risanje is not None:
+                risanje.cancel()
+
+    def narisi_graf_funkcije(self, funkcija: model.Funkcija):
+        """Oddaj risanje grafa funkcije."""
+        return self._oddaj(kljuc_grafa_funkcije(funkcija), _narisi_graf_funkcije, funkcija.niz, funkcija.obmocje)
+
+    def narisi_graf_oddaje(self, naloga: model.Naloga, oddaja: model.Oddaja):
+        """Oddaj risanje grafa podane funkcije in odvoda oddane funkcije.
+        Točke in vrednosti podane funkcije izračunamo tu, saj jih ima naloga že shranjene."""
+        return self._oddaj(
+            kljuc_grafa_oddaje(naloga, oddaja),
+            _narisi_graf_oddaje,
+            naloga.odvedena_funkcija.niz,
+            naloga.tocke_grafa(),
+            naloga.vrednosti_na_grafu(),
+            oddaja.funkcija.niz,
+            oddaja.funkcija.obmocje
+        )
+
+    def stevilo_v_teku(self):
+        """Vrni število risanj, ki se še niso končala."""
+        with self._kljucavnica:
+            return len(self._v_teku)
+
+    def zaustavi(self):
+        if self._izvajalec is not None:
+            self._izvajalec.shutdown()
+            self._izvajalec = None
@@ -1,37 +1,152 @@
 import bottle
+import concurrent.futures
+import json
 import os
 import shutil
 
+import baza_sqlite
+import dnevnik
 import pomozne_funkcije
 import model
+import ocenjevanje
+import risanje
+import streznik
 
 
 DATOTEKA_Z_BAZO_PODATKOV = "db.json"
-MEJA_ZA_NADALJEVANJE = 80   # meja, po kateri so funkcije 'pravilne' in program dovoljuje nadaljevanje
+DATOTEKA_Z_DNEVNIKOM = "db.dnevnik"     # dnevnik sprememb od zadnjega posnetka baze (glej dnevnik.py)
+MEJA_ZA_NADALJEVANJE = model.PovzetekNaloge.MEJA_ZA_RESITEV   # meja, po kateri so funkcije 'pravilne'
 CASOVNI_FORMAT = "%H:%M %-d. %-m. %Y"
+VELIKOST_STRANI_LESTVICE = 50   # koliko uporabnikov prikažemo na eni strani lestvice
+STEVILO_PROCESOV_ZA_RISANJE = int(os.environ.get("STEVILO_PROCESOV_ZA_RISANJE", 2))
+NAJVECJA_VELIKOST_GRAFOV = 200 * 2**20      # največja skupna velikost shranjenih grafov v bajtih
+NAJVECJA_STAROST_GRAFOV = 30 * 24 * 60 * 60     # po koliko sekundah graf narišemo znova
+POSKUSI_BRANJA_GRAFA = 3    # kolikokrat graf, ki ga je medtem izbrisal drug proces, narišemo znova
+CAS_CAKANJA_NA_GRAF = 30    # koliko sekund zahteva za graf največ čaka, da se graf nariše
+# Število procesov za ocenjevanje oddaj; privzeto toliko, kot je procesorskih jeder, pri 0 oddaje ocenimo kar v
+# procesu strežnika (brez omejitev ocenjevanja)
+STEVILO_PROCESOV_ZA_OCENJEVANJE = os.environ.get("STEVILO_PROCESOV_ZA_OCENJEVANJE")
+CAS_OCENJEVANJA = 2.0       # koliko sekund sme trajati ocenjevanje ene oddaje
+NAJVECJA_DOLZINA_ODDAJE = 500   # največja dolžina niza oddane funkcije
+NAJVECJA_VELIKOST_ODDAJE = 300  # največje število vozlišč v izrazu oddane funkcije
+# Ali oddaje ocenjujemo v ozadju; strežnik takoj prikaže stran z oddajo, ki počaka na oceno
+OCENJEVANJE_V_OZADJU = os.environ.get("OCENJEVANJE_V_OZADJU") is not None
+# Ali grafe rišemo v brskalniku iz točk v obliki JSON, namesto da na strežniku rišemo slike
+RISANJE_V_BRSKALNIKU = os.environ.get("RISANJE_V_BRSKALNIKU") is not None
+bottle.BaseTemplate.defaults["risanje_v_brskalniku"] = RISANJE_V_BRSKALNIKU
+
+# Ali je na voljo stran /statistika/ s podatki o predpomnilnikih (le za prijavljene uporabnike)
+STATISTIKA = os.environ.get("STATISTIKA") is not None
+
+# Ali uporabniki oddaje hranijo po stolpcih (glej model.StolpcneOddaje), kar porabi manj pomnilnika
+STOLPCNE_ODDAJE = os.environ.get("STOLPCNE_ODDAJE") is not None
+
+# Če je podana datoteka baze SQLite, podatke hranimo v njej namesto v db.json (glej baza_sqlite.py).
+# Baza SQLite je lahko skupna več procesom, zato lahko le z njo zahteve sprejema več delovnih procesov.
+DATOTEKA_SQLITE = os.environ.get("BAZA_SQLITE")
+STEVILO_DELAVCEV = int(os.environ.get("STEVILO_DELAVCEV", 1))
+VRATA = int(os.environ.get("VRATA", 8080))
+if STEVILO_DELAVCEV > 1 and DATOTEKA_SQLITE is None:
+    raise RuntimeError("Več delovnih procesov lahko uporabljamo le z bazo SQLite (nastavite BAZA_SQLITE).")
+
+# Razčlenjevalnik nizov funkcij lahko izberemo z okoljsko spremenljivko ("pratt" ali "pyparsing")
+model.Funkcija.RAZCLENJEVALNIK = os.environ.get("RAZCLENJEVALNIK", model.Funkcija.RAZCLENJEVALNIK)
+
+
+def preberi_bazo_json():
+    """Vrni slovar baze JSON skupaj s spremembami iz dnevnika; če baze še ni, vrni primer."""
+    if not os.path.exists(DATOTEKA_Z_BAZO_PODATKOV):
+        with open("primer.json") as f:
+            return json.load(f)
+    dnevnik_json = dnevnik.Dnevnik(DATOTEKA_Z_BAZO_PODATKOV, DATOTEKA_Z_DNEVNIKOM)
+    slovar = dnevnik_json.nalozi().shrani_v_slovar()
+    dnevnik_json.zapri()
+    return slovar
 
-# Preberi podatke iz baze
-if not os.path.exists(DATOTEKA_Z_BAZO_PODATKOV):
-    # Prekopiramo primer
-    shutil.copy("primer.json", DATOTEKA_Z_BAZO_PODATKOV)
-
-integrator = model.Integrator.ustvari_iz_datoteke(DATOTEKA_Z_BAZO_PODATKOV)
 
+# Preberi podatke iz baze
+if DATOTEKA_SQLITE is not None:
+    dnevnik_baze = None
+    integrator = baza_sqlite.IntegratorSQLite(DATOTEKA_SQLITE)
+    # Ob prvem zagonu prenesemo obstoječo bazo JSON
+    integrator.uvozi_ce_prazna(preberi_bazo_json)
+else:
+    if not os.path.exists(DATOTEKA_Z_BAZO_PODATKOV):
+        # Prekopiramo primer
+        shutil.copy("primer.json", DATOTEKA_Z_BAZO_PODATKOV)
+
+    dnevnik_baze = dnevnik.Dnevnik(DATOTEKA_Z_BAZO_PODATKOV, DATOTEKA_Z_DNEVNIKOM)
+    # Oddaje uporabnikov ustvarimo šele ob prvi uporabi, da strežnik hitro začne sprejemati zahteve
+    integrator = dnevnik_baze.nalozi(leno=True, stolpcno=STOLPCNE_ODDAJE)
+
+if STEVILO_PROCESOV_ZA_OCENJEVANJE is None or int(STEVILO_PROCESOV_ZA_OCENJEVANJE) > 0:
+    integrator.ocenjevalec = ocenjevanje.OcenjevalecOddaj(
+        None if STEVILO_PROCESOV_ZA_OCENJEVANJE is None else int(STEVILO_PROCESOV_ZA_OCENJEVANJE),
+        CAS_OCENJEVANJA,
+        NAJVECJA_DOLZINA_ODDAJE,
+        NAJVECJA_VELIKOST_ODDAJE,
+        inicializator=streznik.zapri_vticnico_streznika
+    )
 
-# Ustvari direktorij za shranjevanje slik grafov, če ta še ne obstaja
-if not os.path.exists("grafi/"):
-    os.mkdir("grafi")
+# Po želji vnaprej razčlenimo vse funkcije v bazi, da prve zahteve ne čakajo na razčlenjevalnik
+if os.environ.get("OGREJ_PREDPOMNILNIK") is not None:
+    integrator.ogrej_predpomnilnik_izrazov()
+
+
+# Predpomnilnik narisanih grafov; ob zagonu prebere, kateri grafi so že v direktoriju.
+# Z bazo SQLite lahko direktorij hkrati uporablja več procesov.
+predpomnilnik_grafov = risanje.PredpomnilnikGrafov(
+    "grafi", NAJVECJA_VELIKOST_GRAFOV, NAJVECJA_STAROST_GRAFOV, deljen=DATOTEKA_SQLITE is not None
+)
+risar = risanje.RisarGrafov(
+    predpomnilnik_grafov, STEVILO_PROCESOV_ZA_RISANJE, inicializator=streznik.zapri_vticnico_streznika
+)
+
+if OCENJEVANJE_V_OZADJU:
+    # Niti je toliko kot procesov za ocenjevanje, da hkrati ocenjevane oddaje zasedejo vse procese;
+    # brez procesov za ocenjevanje ocenjujemo v eni niti
+    stevilo_niti = os.cpu_count() if STEVILO_PROCESOV_ZA_OCENJEVANJE is None else int(STEVILO_PROCESOV_ZA_OCENJEVANJE)
+    integrator.vrsta_ocenjevanja = ocenjevanje.VrstaOcenjevanja(
+        integrator,
+        max(stevilo_niti, 1),
+        # Graf oddaje začnemo risati takoj po oceni, da je pripravljen, ko se stran z oddajo znova naloži
+        ob_oceni=None if RISANJE_V_BRSKALNIKU else lambda uporabnik, oddaja: zacni_risanje_grafa_oddaje(oddaja)
+    )
 
 
-# Preberi skrivnost ali jo ustvari, če še ne obstaja
+# Preberi skrivnost ali jo ustvari, če še ne obstaja.
+# Skrivnost zapišemo v začasno datoteko in jo povežemo pod končno ime le, če ta še ne obstaja,
+# tako da imajo vsi hkrati zagnani procesi enako skrivnost.
 if not os.path.exists("SKRIVNOST"):
-    with open("SKRIVNOST", "w") as f:
+    zacasna_datoteka = f"SKRIVNOST.{os.getpid()}"
+    with open(zacasna_datoteka, "w") as f:
         f.write(pomozne_funkcije.generiraj_skrivnost())
+    try:
+        os.link(zacasna_datoteka, "SKRIVNOST")
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(zacasna_datoteka)
 
 with open("SKRIVNOST") as f:
     SKRIVNOST = f.read()
 
 
+# Procesi, ki so neocenjene oddaje že postavili v vrsto za ocenjevanje
+procesi_z_ocenjenimi_oddajami = set()
+
+
+@bottle.hook("before_request")
+def oceni_neocenjene_oddaje():
+    """Oddaje, ki ob zaustavitvi strežnika še niso bile ocenjene, ob prvi zahtevi postavimo v vrsto za ocenjevanje.
+    To storimo v vsakem delovnem procesu posebej; oddaji, ki jo je že ocenil drug proces, baza ne spremeni rezultata."""
+    if integrator.vrsta_ocenjevanja is None or os.getpid() in procesi_z_ocenjenimi_oddajami:
+        return
+    procesi_z_ocenjenimi_oddajami.add(os.getpid())
+    for uporabnik, oddaja in integrator.neocenjene_oddaje():
+        integrator.vrsta_ocenjevanja.dodaj(uporabnik, oddaja)
+
+
 def poisci_trenutnega_uporabnika():
     """Poišči in vrni Uporabnik objekt, povezan s trenutno prijavljenim uporabnikom. Vrni None, če ga ni."""
     uporabnisko_ime = bottle.request.get_cookie("uporabnisko_ime", secret=SKRIVNOST)
@@ -99,28 +214,39 @@ def lestvica_pregled_naloge(zaporedna_stevilka):
     if naloga is None:
         bottle.abort(404, "Ni take naloge")
 
-    vse_oddaje = integrator.poisci_oddaje_za_nalogo(naloga._id)
+    lestvica = integrator.lestvica_naloge(naloga._id)
+    stevilo_strani = max(1, -(-len(lestvica) // VELIKOST_STRANI_LESTVICE))
+    try:
+        stran = min(max(1, int(bottle.request.query.get("stran", 1))), stevilo_strani)
+    except ValueError:
+        stran = 1
 
-    oddaje = sorted(
-        ((oddaja.rezultat, uporabnik.uporabnisko_ime, oddaja.cas_oddaje.strftime(CASOVNI_FORMAT))
-            for oddaja, uporabnik in vse_oddaje),
-        reverse=True
-    )
+    # Časovni zapis pripravimo le za vrstice, ki jih prikažemo
+    vrstice = [
+        (mesto, uporabnisko_ime, rezultat, cas.strftime(CASOVNI_FORMAT))
+        for mesto, uporabnisko_ime, rezultat, cas
+        in lestvica.vrstice((stran - 1) * VELIKOST_STRANI_LESTVICE, VELIKOST_STRANI_LESTVICE)
+    ]
 
-    return bottle.template("lestvica_za_nalogo.html", naloga=naloga, oddaje=oddaje, uporabnik=uporabnik)
+    return bottle.template(
+        "lestvica_za_nalogo.html",
+        naloga=naloga,
+        vrstice=vrstice,
+        stran=stran,
+        stevilo_strani=stevilo_strani,
+        mesto_uporabnika=lestvica.mesto(uporabnik.uporabnisko_ime),
+        uporabnik=uporabnik
+    )
 
 
 @bottle.route("/pregled-oddaj/<zaporedna_stevilka:int>/")
 def pregled_oddaj(zaporedna_stevilka):
     uporabnik = poisci_trenutnega_uporabnika_ali_redirect()
 
-    # Prefiltriraj uporabnikove oddaje in prikaži le oddaje za to nalogo
+    # Prikaži le uporabnikove oddaje za to nalogo
+    naloga = integrator.poisci_nalogo(zaporedna_stevilka)
     oddaje = []
-    for oddaja in uporabnik.oddaje:
-        naloga = integrator.poisci_nalogo(_id=oddaja.naloga).zaporedna_stevilka
-        if naloga != str(zaporedna_stevilka):
-            continue
-
+    for oddaja in (uporabnik.oddaje_za_nalogo(naloga._id) if naloga is not None else []):
         oddaje.append((
             oddaja._id,
             oddaja.funkcija.niz_latex,
@@ -147,7 +273,7 @@ def pregled_oddaje(id_oddaje):
 
     # na strani naj se pokaže gumb za nadaljevanje, če katerakoli uporabnikova oddaja
     # na tej nalogi dosega mejo
-    gumb_za_nadaljevanje = uporabnik.je_resil_nalogo(oddaja.naloga, MEJA_ZA_NADALJEVANJE)
+    gumb_za_nadaljevanje = uporabnik.je_resil_nalogo(oddaja.naloga)
 
     return bottle.template(
         "rezultat_oddaje.html",
@@ -157,10 +283,33 @@ def pregled_oddaje(id_oddaje):
         naloga=integrator.poisci_nalogo(_id=oddaja.naloga),
         meja_za_nadaljevanje=MEJA_ZA_NADALJEVANJE,
         gumb_za_nadaljevanje=gumb_za_nadaljevanje,
-        uporabnik=uporabnik
+        uporabnik=uporabnik,
+        napaka=oddaja.napaka
     )
 
 
+@bottle.route("/pregled-oddaje/<id_oddaje>/stanje/")
+def stanje_oddaje(id_oddaje):
+    """Stanje ocenjevanja oddaje v obliki JSON; stran z neocenjeno oddajo ga sproti preverja.
+    Stanje je "v_teku", "ocenjena" ali "napaka"; zadnji dve sta končni."""
+    uporabnik = poisci_trenutnega_uporabnika_ali_redirect()
+    oddaja = uporabnik.poisci_oddajo(_id=id_oddaje)
+    if oddaja is None:
+        bottle.abort(404, "Oddaja ni na voljo.")
+    if oddaja.rezultat is None:
+        stanje = "v_teku"
+    elif oddaja.napaka is not None:
+        stanje = "napaka"
+    else:
+        stanje = "ocenjena"
+    return {
+        "stanje": stanje,
+        "ocenjena": oddaja.rezultat is not None,
+        "rezultat": oddaja.rezultat,
+        "napaka": oddaja.napaka,
+    }
+
+
 @bottle.route("/")
 def index():
     """Glavna stran. Prikaže tabelo rešenih in nerešenih nalog."""
@@ -169,42 +318,26 @@ def index():
     # Če je uporabnik že rešil vse naloge, moramo ustvariti novo, da bo imel kam klikniti
     # Za to potrebujemo pogledati le rešitev zadnje naloge
     zadnja_naloga = max(naloga for naloga in integrator.naloge)
-    if uporabnik.je_resil_nalogo(zadnja_naloga._id, MEJA_ZA_NADALJEVANJE):
-        integrator.ustvari_nakljucno_nalogo(int(zadnja_naloga.zaporedna_stevilka)+1)
+    if uporabnik.je_resil_nalogo(zadnja_naloga._id):
+        nova_naloga = integrator.ustvari_nakljucno_nalogo(int(zadnja_naloga.zaporedna_stevilka)+1)
+        if not RISANJE_V_BRSKALNIKU:
+            zacni_risanje_grafa_naloge(nova_naloga)
 
     # Ustvari seznam parov [naloga, status], kjer je status odvisen od rešitev:
     # če je uporabnik nalogo rešil, je status "zeleno"
-    # če je uporabnik nalgoo poskusil, a neuspešno, je status "rdeče"
-    # če je uprabnik rešil vse naloge do te, te pa še ni poskusil, je status "modro"
+    # če je uporabnik nalogo poskusil, a neuspešno, je status "rdeče"
+    # če je uporabnik rešil vse naloge do te, te pa še ni poskusil, je status "modro"
     # sicer je status "sivo"
+    zaporedno_resene = integrator.stevilo_zaporedno_resenih_nalog(uporabnik)
 
     def pridobi_status(naloga):
-        poskuseno = False
-        for oddaja in uporabnik.oddaje:
-            if oddaja.naloga == naloga._id:
-                poskuseno = True
-                if oddaja.rezultat >= MEJA_ZA_NADALJEVANJE:
-                    return "zeleno"
-
-        return "rdece" if poskuseno else "sivo"
-
-    def splosci(seznam):
-        """Splosci seznam seznamov za iteriranje"""
-        for podseznam in seznam:
-            for x in podseznam:
-                yield x
+        povzetek = uporabnik.povzetek_naloge(naloga._id)
+        if povzetek is None:
+            return "modro" if int(naloga.zaporedna_stevilka) == zaporedno_resene + 1 else "sivo"
+        return "zeleno" if povzetek.resena else "rdece"
 
     vrstice = tabela_nalog(lambda naloga: [naloga.zaporedna_stevilka, pridobi_status(naloga)])
 
-    # Sedaj so naloge že pobarvane glede na to, ali jih je uporabnik rešil ali ne
-    # Moramo še poskrbeti, da uporabnik lahko rešuje nalogo, če je rešil prejšnje
-
-    prejsnji = "zeleno"
-    for i, par in enumerate(splosci(vrstice)):
-        if par[1] == "sivo" and prejsnji == "zeleno":
-            par[1] = "modro"
-        prejsnji = par[1]
-
     return bottle.template("index.html", uporabnik=uporabnik, vrstice=vrstice)
 
 
@@ -253,6 +386,48 @@ def registracija():
     bottle.redirect("/naloga/1/")
 
 
+def vrni_graf(zacni_risanje):
+    """Začni risanje grafa s funkcijo zacni_risanje, ki vrne Future, počakaj, da se graf nariše, in ga vrni.
+    Brskalniki slik z odgovorom 503 ne zahtevajo znova, zato čakamo, dokler risanje ni končano, a največ
+    CAS_CAKANJA_NA_GRAF sekund, da obtičalo risanje ne zasede niti strežnika; nato vrnemo 504, risanje pa
+    pozabimo, da ga naslednja zahteva začne znova.
+    Graf lahko po risanju izbriše drug proces (ali nit) ob čiščenju predpomnilnika, zato datoteko odpremo le
+    enkrat in pošljemo vsebino odprte datoteke; če je ni več, jo narišemo znova."""
+    for __ in range(POSKUSI_BRANJA_GRAFA):
+        prihodnost = zacni_risanje()
+        try:
+            ime_datoteke = prihodnost.result(timeout=CAS_CAKANJA_NA_GRAF)
+        except concurrent.futures.TimeoutError:
+            risar.pozabi(prihodnost)
+            bottle.abort(504, "Risanje grafa je trajalo predolgo.")
+        try:
+            datoteka = open(os.path.join(predpomnilnik_grafov.direktorij, ime_datoteke), "rb")
+        except FileNotFoundError:
+            continue
+
+        podatki = os.fstat(datoteka.fileno())
+        # Ime datoteke je ključ grafa, ki je odvisen od vsebine, zato je primerna oznaka ETag
+        glave = {"ETag": f'"{ime_datoteke}"', "Last-Modified": bottle.http_date(podatki.st_mtime)}
+        if bottle.request.headers.get("If-None-Match") == glave["ETag"]:
+            datoteka.close()
+            return bottle.HTTPResponse(status=304, headers=glave)
+        glave["Content-Type"] = "image/png"
+        glave["Content-Length"] = str(podatki.st_size)
+        return bottle.HTTPResponse(datoteka, headers=glave)
+
+    bottle.abort(500, "Grafa ni bilo mogoče prebrati.")
+
+
+def zacni_risanje_grafa_naloge(naloga):
+    """Začni risati graf v nalogi podane funkcije v ozadju (če še ni narisan) in vrni pripadajoč Future."""
+    return risar.narisi_graf_funkcije(naloga.odvedena_funkcija)
+
+
+def zacni_risanje_grafa_oddaje(oddaja):
+    """Začni risati graf oddaje v ozadju (če še ni narisan) in vrni pripadajoč Future."""
+    return risar.narisi_graf_oddaje(integrator.poisci_nalogo(_id=oddaja.naloga), oddaja)
+
+
 @bottle.route("/graf/<id_funkcije>/")
 def graf(id_funkcije):
     """Vrne narisan graf funkcije kot statično datoteko. Slike grafov si shranjuje."""
@@ -261,10 +436,7 @@ def graf(id_funkcije):
     if funkcija is None:
         bottle.abort(404, "Ni take funkcije")
 
-    if not os.path.exists(f"grafi/{id_funkcije}.png"):
-        funkcija.narisi_graf(f"grafi/{id_funkcije}.png")
-
-    return bottle.static_file(f"{id_funkcije}.png", "grafi")
+    return vrni_graf(lambda: risar.narisi_graf_funkcije(funkcija))
 
 
 @bottle.route("/graf/<id_oddaje>/oddaja/")
@@ -275,14 +447,29 @@ def graf_oddaja(id_oddaje):
     if oddaja is None:
         bottle.abort(404, "Ni oddaje s takim ID.")
 
-    if not os.path.exists(f"grafi/{id_oddaje}_oddaja.png"):
-        model.graf_naloge_in_odvoda_oddaje(
-            integrator.poisci_nalogo(_id=oddaja.naloga),
-            oddaja,
-            f"grafi/{id_oddaje}_oddaja.png"
-        )
+    return vrni_graf(lambda: zacni_risanje_grafa_oddaje(oddaja))
+
+
+@bottle.route("/graf/<id_funkcije>/tocke/")
+def tocke_grafa(id_funkcije):
+    """Vrne točke grafa funkcije v obliki JSON, za risanje v brskalniku."""
+    funkcija = integrator.poisci_funkcijo(id_funkcije)
+
+    if funkcija is None:
+        bottle.abort(404, "Ni take funkcije")
 
-    return bottle.static_file(f"{id_oddaje}_oddaja.png", "grafi")
+    return funkcija.podatki_grafa()
+
+
+@bottle.route("/graf/<id_oddaje>/oddaja/tocke/")
+def tocke_grafa_oddaje(id_oddaje):
+    """Vrne točke grafa odvoda oddane funkcije in v nalogi dane funkcije v obliki JSON."""
+    uporabnik = poisci_trenutnega_uporabnika_ali_redirect()
+    oddaja = uporabnik.poisci_oddajo(id_oddaje)
+    if oddaja is None:
+        bottle.abort(404, "Ni oddaje s takim ID.")
+
+    return model.podatki_grafa_naloge_in_odvoda_oddaje(integrator.poisci_nalogo(_id=oddaja.naloga), oddaja)
 
 
 @bottle.get("/naloga/<zaporedna_stevilka:int>/")
@@ -293,7 +480,7 @@ def stran_z_nalogo(zaporedna_stevilka, napaka=""):
 
     if zaporedna_stevilka > 1 and \
             (prejsnja_naloga := integrator.poisci_nalogo(zaporedna_stevilka-1)) is not None and \
-            not uporabnik.je_resil_nalogo(prejsnja_naloga._id, MEJA_ZA_NADALJEVANJE):
+            not uporabnik.je_resil_nalogo(prejsnja_naloga._id):
 
         return stran_za_napako("Da se lotite naloge, morate rešiti vse naloge pred njo.")
 
@@ -302,12 +489,14 @@ def stran_z_nalogo(zaporedna_stevilka, napaka=""):
         # na tej točki je uporabnik že rešil vse naloge do te številke
         # torej ustvarimo novo nalogo
         naloga = integrator.ustvari_nakljucno_nalogo(zaporedna_stevilka)
+        if not RISANJE_V_BRSKALNIKU:
+            zacni_risanje_grafa_naloge(naloga)
 
     return bottle.template(
         naloga.ime_templata,
         naloga=naloga,
-        prejsnje_oddaje=any(oddaja.naloga == naloga._id for oddaja in uporabnik.oddaje),
-        gumb_za_nadaljevanje=uporabnik.je_resil_nalogo(naloga._id, MEJA_ZA_NADALJEVANJE),
+        prejsnje_oddaje=len(uporabnik.oddaje_za_nalogo(naloga._id)) > 0,
+        gumb_za_nadaljevanje=uporabnik.je_resil_nalogo(naloga._id),
         uporabnik=uporabnik,
         napaka=napaka
     )
@@ -320,7 +509,10 @@ def oddaja_naloge(zaporedna_stevilka):
         return stran_z_nalogo(zaporedna_stevilka, napaka="Ni funkcije")
 
     funkcijski_niz = bottle.request.forms["funkcija"]
-    oddaja = integrator.dodaj_oddajo(zaporedna_stevilka, uporabnik, funkcijski_niz)
+    try:
+        oddaja = integrator.dodaj_oddajo(zaporedna_stevilka, uporabnik, funkcijski_niz)
+    except ocenjevanje.PrekoracenaOmejitev as napaka:
+        return stran_z_nalogo(zaporedna_stevilka, napaka=str(napaka))
 
     if oddaja is None:
         return stran_z_nalogo(
@@ -328,6 +520,14 @@ def oddaja_naloge(zaporedna_stevilka):
             napaka="Napaka pri branju funkcije. Vzrok temu je lahko neveljavna sintaksa, neznana funkcija ipd."
         )
 
+    if oddaja.rezultat is None:
+        # Oddaja se ocenjuje v ozadju; preusmerimo na njeno stran, ki počaka na oceno
+        bottle.redirect(f"/pregled-oddaje/{oddaja._id}/")
+
+    # Graf oddaje začnemo risati takoj, da je pripravljen (ali skoraj pripravljen), ko ga brskalnik zahteva
+    if not RISANJE_V_BRSKALNIKU:
+        zacni_risanje_grafa_oddaje(oddaja)
+
     return pregled_oddaje(oddaja._id)
 
 
@@ -344,16 +544,52 @@ def spremeni_geslo():
     staro_geslo = bottle.request.forms["staro_geslo"]
     novo_geslo = bottle.request.forms["novo_geslo"]
     if uporabnik.preveri_geslo(staro_geslo):
-        uporabnik.nastavi_geslo(novo_geslo)
+        integrator.nastavi_geslo(uporabnik, novo_geslo)
     bottle.redirect("/")
 
 
+@bottle.route("/statistika/")
+def statistika():
+    """Vrne podatke o uporabi predpomnilnikov v obliki JSON.
+    Stran je na voljo le, če je nastavljena okoljska spremenljivka STATISTIKA, in le prijavljenim uporabnikom."""
+    if not STATISTIKA:
+        bottle.abort(404, "Stran ne obstaja.")
+    poisci_trenutnega_uporabnika_ali_redirect()
+    return {
+        "ocene": integrator.predpomnilnik_ocen.statistika(),
+        "izrazi": model.Funkcija.predpomnilnik_izrazov.statistika(),
+        "grafi": predpomnilnik_grafov.statistika(),
+    }
+
+
 @bottle.route("/static/<datoteka:path>")
 def staticne_datoteke(datoteka):
     return bottle.static_file(datoteka, "static")
 
 
+# Aplikacija WSGI za produkcijske strežnike (glej streznik.py)
+app = bottle.default_app()
+
+
+def zaustavi_procese():
+    """Zaustavi skupine procesov za risanje in ocenjevanje ter počakaj, da se ocenijo oddaje v vrsti."""
+    if integrator.vrsta_ocenjevanja is not None:
+        integrator.vrsta_ocenjevanja.zaustavi()
+    if integrator.ocenjevalec is not None:
+        integrator.ocenjevalec.zaustavi()
+    risar.zaustavi()
+
+
 if __name__ == "__main__":
     debug_nacin = os.environ.get("DEBUG") is not None
-    bottle.run(reloader=debug_nacin, debug=debug_nacin, host='0.0.0.0')
-    integrator.shrani_v_datoteko(DATOTEKA_Z_BAZO_PODATKOV)
+    if STEVILO_DELAVCEV > 1:
+        # Povezavo z bazo zapremo, da jo vsak delovni proces odpre sam
+        integrator.zapri()
+        bottle.run(server=streznik.VecprocesniStreznik, delavci=STEVILO_DELAVCEV, ob_zaustavitvi=zaustavi_procese,
+                   debug=debug_nacin, host='0.0.0.0', port=VRATA)
+    else:
+        bottle.run(reloader=debug_nacin, debug=debug_nacin, host='0.0.0.0', port=VRATA)
+    # Počakamo, da se ocenijo oddaje v vrsti, preden zapremo dnevnik
+    zaustavi_procese()
+    if dnevnik_baze is not None:
+        dnevnik_baze.zapri()
@@ -0,0 +1,88 @@
+"""Strežnik, ki zahteve sprejema v več delovnih procesih hkrati.
+Strežnik iz standardne knjižnice (wsgiref) obdela le eno zahtevo naenkrat; z več procesi lahko strežnik
+izkoristi več procesorskih jeder. Procesi si ne delijo pomnilnika, zato mora biti baza skupna (glej baza_sqlite.py).
+
+Namesto tega strežnika lahko uporabimo tudi produkcijski strežnik WSGI, npr.
+    BAZA_SQLITE=db.sqlite gunicorn --workers 4 --bind 0.0.0.0:8080 spletni_vmesnik:app"""
+
+import os
+import signal
+import sys
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+import bottle
+
+# Vtičnica strežnika, ki jo ob razcepu podedujejo delovni procesi (glej zapri_vticnico_streznika)
+_streznik = None
+
+
+def zapri_vticnico_streznika():
+    """Zapri podedovano vtičnico strežnika. Uporabimo jo kot inicializator skupin procesov, ki jih ustvari delovni
+    proces (npr. za ocenjevanje in risanje), da njihovi procesi vtičnice ne držijo odprte, ko se strežnik zaustavi."""
+    if _streznik is not None:
+        _streznik.socket.close()
+
+
+class TihaObdelavaZahtev(WSGIRequestHandler):
+    def log_request(self, *argumenti, **kljucni_argumenti):
+        pass
+
+
+class VecprocesniStreznik(bottle.ServerAdapter):
+    """Strežnik wsgiref z več delovnimi procesi (število podamo z argumentom delavci), npr.
+        bottle.run(server=VecprocesniStreznik, delavci=4)
+    Vtičnico odpremo pred razcepom procesov, zato jo delijo vsi procesi, povezave pa jim izmenično dodeljuje
+    operacijski sistem. Proces, ki se nepričakovano konča, nadomestimo z novim. Deluje le na sistemih z os.fork.
+    Z argumentom ob_zaustavitvi podamo funkcijo, ki jo delovni proces pokliče, preden se konča (npr. da zaustavi
+    svoje skupine procesov)."""
+
+    def run(self, aplikacija):
+        global _streznik
+        delavci = self.options.get("delavci", 2)
+        ob_zaustavitvi = self.options.get("ob_zaustavitvi")
+        obdelava_zahtev = TihaObdelavaZahtev if self.quiet else WSGIRequestHandler
+        streznik = _streznik = make_server(self.host, self.port, aplikacija, handler_class=obdelava_zahtev)
+
+        # Ob SIGTERM se zaustavimo enako kot ob Ctrl-C
+        signal.signal(signal.SIGTERM, lambda *argumenti: sys.exit(0))
+
+        procesi = set()
+        try:
+            while True:
+                while len(procesi) < delavci:
+                    procesi.add(self._zazeni_delavca(streznik, ob_zaustavitvi))
+                pid, __ = os.wait()
+                procesi.discard(pid)
+        finally:
+            for pid in procesi:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            for pid in procesi:
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            streznik.server_close()
+
+    @staticmethod
+    def _zazeni_delavca(streznik, ob_zaustavitvi):
+        pid = os.fork()
+        if pid != 0:
+            return pid
+
+        # Delovni proces: zahteve obdeluje, dokler ga starševski proces ne zaustavi; tudi ob SIGTERM se zaustavi
+        # urejeno, da za njim ne ostanejo procesi njegovih skupin
+        signal.signal(signal.SIGTERM, lambda *argumenti: sys.exit(0))
+        try:
+            streznik.serve_forever()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            try:
+                streznik.server_close()
+                if ob_zaustavitvi is not None:
+                    ob_zaustavitvi()
+            finally:
+                os._exit(0)